@@ -1,15 +1,115 @@
 import os
+import time
 from flask import Flask
 
+from app.config import Config
 from app.utils.model_utils import load_model
+from app.utils.model_registry import ModelRegistry, file_stamp, separated_model_path
+from app.utils.feature_store import FeatureStore
+from app.utils.event_index import EVENTS_FILE, SEPARATED_EVENTS_FILE, EventIndex
+from app.utils.batching import PredictionBatcher
+from app.utils.executor import BoundedExecutor
+from app.utils.forecast_table import ForecastTable
+from app.utils.jobs import JobQueue
+from app.utils.response_cache import ResponseCache
+from app.utils.warmup import Warmup
+from app.endpoints.prediction_endpoints import materialize_forecast
 from . import routes
 from flask_cors import CORS
 
 
 def create_app():
+    started = time.perf_counter()
     app = Flask(__name__)
+    app.config.from_object(Config)
 
-    app.config["MODEL"] = load_model("models/model.joblib")
+    warmup = Warmup()
+    app.config["WARMUP"] = warmup
+
+    app.config["MODEL"] = None
+    app.config["MODEL_STAMP"] = None
+
+    def load_global_model():
+        app.config["MODEL_STAMP"] = file_stamp(app.config["MODEL_PATH"])
+        app.config["MODEL"] = load_model(
+            app.config["MODEL_PATH"],
+            mmap_mode=app.config["MODEL_MMAP_MODE"],
+            compiled=app.config["COMPILED_MODELS"],
+        )
+
+    warmup.add("model", load_global_model)
+
+    model_registry = ModelRegistry(
+        app.config["SEPARATED_MODELS_DIR"],
+        max_models=app.config["MODEL_CACHE_SIZE"],
+        mmap_mode=app.config["MODEL_MMAP_MODE"],
+        compiled=app.config["COMPILED_MODELS"],
+    )
+    if model_registry.max_models is None:
+        warmup.add("separated_models", model_registry.preload)
+    model_registry.start_watcher(app.config["MODEL_RELOAD_INTERVAL"])
+    app.config["MODEL_REGISTRY"] = model_registry
+
+    # Loaded during warmup rather than on the first request, so that workers
+    # forked from this process share the tables
+    feature_store = FeatureStore(app.config["DATASETS_DIR"])
+    warmup.add("datasets", feature_store.refresh)
+    app.config["FEATURE_STORE"] = feature_store
+
+    event_index = EventIndex(app.config["EVENTS_DIR"])
+    warmup.add("events", event_index.calendar)
+    app.config["EVENT_INDEX"] = event_index
+
+    if app.config["FORECAST_TABLE_HORIZON"] > 0:
+        forecast_table = ForecastTable(
+            app.config["DATASETS_DIR"],
+            sources=[app.config["MODEL_PATH"]]
+            + [
+                separated_model_path(app.config["SEPARATED_MODELS_DIR"], *key)
+                for key in model_registry.keys()
+            ]
+            + [
+                os.path.join(app.config["EVENTS_DIR"], file_name)
+                for file_name in (EVENTS_FILE, SEPARATED_EVENTS_FILE)
+            ],
+        )
+        app.config["FORECAST_TABLE"] = forecast_table
+
+        def materialize():
+            with app.app_context():
+                materialize_forecast()
+
+        warmup.add("forecast", materialize)
+        forecast_table.start_scheduler(
+            app.config["FORECAST_TABLE_INTERVAL"], materialize
+        )
+
+    if app.config["PREDICT_BATCHING"]:
+        app.config["PREDICTION_BATCHER"] = PredictionBatcher(
+            model_registry,
+            max_wait_ms=app.config["PREDICT_BATCH_WAIT_MS"],
+            max_batch_size=app.config["PREDICT_BATCH_MAX_SIZE"],
+        )
+
+    if app.config["RESPONSE_CACHE_SIZE"] > 0:
+        app.config["RESPONSE_CACHE"] = ResponseCache(
+            max_entries=app.config["RESPONSE_CACHE_SIZE"],
+            ttl=app.config["RESPONSE_CACHE_TTL"],
+        )
+
+    if app.config["PREDICT_WORKERS"] > 0:
+        app.config["INFERENCE_EXECUTOR"] = BoundedExecutor(
+            max_workers=app.config["PREDICT_WORKERS"],
+            max_queue=app.config["PREDICT_QUEUE_SIZE"],
+            timeout=app.config["PREDICT_TIMEOUT"],
+        )
+
+    # Shared by the server workers, so every worker answers for every job
+    app.config["REBUILD_JOBS"] = JobQueue(
+        max_workers=app.config["REBUILD_WORKERS"],
+        max_queue=app.config["REBUILD_QUEUE_SIZE"],
+        directory=os.path.join(app.config["DATASETS_DIR"], "jobs"),
+    )
 
     cors = CORS(
         app,
@@ -20,6 +120,11 @@ def create_app():
 
     UPLOAD_FOLDER = "storage/"
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-    os.makedirs("datasets/", exist_ok=True)
+    os.makedirs(app.config["DATASETS_DIR"], exist_ok=True)
+
+    if app.config["STARTUP_WARMUP"] != "deferred":
+        warmup.start(background=app.config["STARTUP_WARMUP"] != "blocking")
+    app.config["STARTUP_SECONDS"] = time.perf_counter() - started
+    print(f"App created in {app.config['STARTUP_SECONDS']:.2f}s")
 
     return app
@@ -0,0 +1,138 @@
+"""
+Compiles the models into NumPy array files for the fast inference path.
+
+Run from LumenBackend/:
+
+    python -m app.compile_models
+
+Every per-room model under separated_models/ and the global model are
+exported to an .npz file next to their .joblib file. The compiled copy is
+loaded back and its predictions and intervals are compared with the original
+model on the rows of the per-room datasets (random rows if there are none),
+one row at a time and all rows at once. A copy whose outputs differ by more
+than --tolerance is deleted again and the command exits with status 1.
+
+The server only uses the .npz files with COMPILED_MODELS=1, and falls back to
+the .joblib file of any model whose compiled copy is missing or older.
+"""
+
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from app.config import Config
+from app.enums.room_indices_dict import room_indices
+from app.utils.compiled_models import (
+    CompiledMapie,
+    UnsupportedModel,
+    compare_predictions,
+    compiled_model_path,
+    load_compiled,
+)
+from app.utils.event_index import EventCalendar
+from app.utils.feature_store import FeatureStore, features
+from app.utils.model_registry import LAG_COUNT, separated_model_path
+
+
+def room_rows(feature_store: FeatureStore, room_type: int, count: int) -> np.ndarray:
+    """Feature rows of a room type to compare the models on."""
+    try:
+        return feature_store.table(room_type).values
+    except KeyError:
+        return np.random.default_rng(room_type).standard_normal((count, len(features)))
+
+
+def global_rows(events_dir: str) -> np.ndarray:
+    """Global model inputs for every room type over two years."""
+    # The endpoints module imports Flask, which the rest of the tool avoids
+    from app.endpoints.prediction_endpoints import range_model_input
+
+    try:
+        calendar = EventCalendar.load(events_dir)
+    except OSError:
+        calendar = EventCalendar([], {})
+    dates = pd.date_range("2008-01-01", "2009-12-31", freq="D")
+    return range_model_input(dates, calendar).astype(np.float64)
+
+
+def single_row_ms(model, X, **kwargs) -> float:
+    started = time.perf_counter()
+    for i in range(20):
+        model.predict(X[i : i + 1], **kwargs)
+    return (time.perf_counter() - started) / 20 * 1000
+
+
+def compile_file(path, X, alphas, tolerance) -> bool:
+    """Compile, verify and write one model. Returns False on a mismatch."""
+    from joblib import load
+
+    model = load(path)
+    try:
+        compiled = CompiledMapie.from_model(model)
+    except UnsupportedModel as e:
+        print(f"skipped   {path}: {e}")
+        return True
+
+    target = compiled_model_path(path)
+    compiled.save(target, source_path=path)
+    loaded = load_compiled(path)
+    is_mapie = loaded.method is not None
+    difference = compare_predictions(model, loaded, X, alphas if is_mapie else None)
+    if difference > tolerance:
+        os.remove(target)
+        print(f"MISMATCH  {path}: outputs differ by up to {difference:.3g}")
+        return False
+
+    kwargs = {"alpha": alphas[0]} if is_mapie else {}
+    frame = pd.DataFrame(X[:20], columns=getattr(model, "feature_names_in_", None))
+    original_ms = single_row_ms(model, frame if is_mapie else X[:20], **kwargs)
+    compiled_ms = single_row_ms(loaded, X[:20], **kwargs)
+    print(
+        f"compiled  {path} ({loaded.method or 'regressor'}): max difference "
+        f"{difference:.3g}, {original_ms:.3f} ms -> {compiled_ms:.3f} ms per row"
+    )
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--models-dir", default=Config.SEPARATED_MODELS_DIR)
+    parser.add_argument("--model-path", default=Config.MODEL_PATH)
+    parser.add_argument("--datasets-dir", default=Config.DATASETS_DIR)
+    parser.add_argument("--events-dir", default=Config.EVENTS_DIR)
+    parser.add_argument(
+        "--alphas",
+        default="0.6,0.5,0.2,0.05",
+        help="Comma separated alphas whose intervals are compared",
+    )
+    parser.add_argument("--tolerance", type=float, default=1e-9)
+    parser.add_argument("--rows", type=int, default=200)
+    args = parser.parse_args()
+
+    # sklearn warns about feature names on every single-row timing call
+    warnings.filterwarnings("ignore", category=UserWarning)
+    alphas = [float(alpha) for alpha in args.alphas.split(",")]
+    feature_store = FeatureStore(args.datasets_dir)
+
+    matched = True
+    for room_type in room_indices:
+        X = room_rows(feature_store, room_type, args.rows)
+        for lag in range(LAG_COUNT):
+            path = separated_model_path(args.models_dir, room_type, lag)
+            if os.path.exists(path):
+                matched &= compile_file(path, X, alphas, args.tolerance)
+
+    if os.path.exists(args.model_path):
+        X = global_rows(args.events_dir)
+        matched &= compile_file(args.model_path, X, alphas, args.tolerance)
+
+    sys.exit(0 if matched else 1)
+
+
+if __name__ == "__main__":
+    main()
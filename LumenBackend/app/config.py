@@ -0,0 +1,108 @@
+import os
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    if value in (None, ""):
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+class Config:
+    """Application settings, overridable through environment variables."""
+
+    # Folder the per-room datasets are written to by form()
+    DATASETS_DIR = os.environ.get("DATASETS_DIR", "datasets")
+
+    # Folder holding events.json and separated_events.json
+    EVENTS_DIR = os.environ.get("EVENTS_DIR", "events")
+
+    MODEL_PATH = os.environ.get("MODEL_PATH", "models/model.joblib")
+
+    # Root folder holding separated_models/model_rt_{room_type}/mapie_model_lag_{n}.joblib
+    SEPARATED_MODELS_DIR = os.environ.get("SEPARATED_MODELS_DIR", "separated_models")
+    # 0 keeps every per-room model in memory, N > 0 keeps at most N (LRU)
+    MODEL_CACHE_SIZE = _env_int("MODEL_CACHE_SIZE", 0)
+    # Seconds between checks for changed model files, 0 disables the watcher
+    MODEL_RELOAD_INTERVAL = _env_float("MODEL_RELOAD_INTERVAL", 30)
+    # joblib mmap_mode for the model files ("r" maps the arrays of uncompressed
+    # dumps from the page cache, shared by every worker process), empty loads them
+    MODEL_MMAP_MODE = os.environ.get("MODEL_MMAP_MODE") or None
+
+    # Load the .npz models written by `python -m app.compile_models` in place
+    # of the joblib files they were compiled from, when they are up to date
+    COMPILED_MODELS = _env_bool("COMPILED_MODELS", False)
+
+    # Coalesce concurrent single-row predictions per (room type, lag) model
+    PREDICT_BATCHING = _env_bool("PREDICT_BATCHING", False)
+    PREDICT_BATCH_WAIT_MS = _env_float("PREDICT_BATCH_WAIT_MS", 5)
+    PREDICT_BATCH_MAX_SIZE = _env_int("PREDICT_BATCH_MAX_SIZE", 64)
+
+    # Worker threads running dataset rebuilds queued by uploads
+    REBUILD_WORKERS = _env_int("REBUILD_WORKERS", 1)
+    # Rebuilds allowed to wait for a worker before uploads answer 429
+    REBUILD_QUEUE_SIZE = _env_int("REBUILD_QUEUE_SIZE", 2)
+    # "full" reruns form() on train.parquet plus the upload, "incremental" only
+    # processes the upload on top of the saved state of train.parquet
+    REBUILD_MODE = os.environ.get("REBUILD_MODE", "full")
+    # Processes used for the per-room stages of form(), 1 runs them in-process
+    FORM_WORKERS = _env_int("FORM_WORKERS", 1)
+    # Also write a CSV copy of every per-room dataset next to the parquet files
+    DATASET_CSV_EXPORT = _env_bool("DATASET_CSV_EXPORT", False)
+    # Keep and write the per-room datasets with int8/int16/float32 columns
+    COMPACT_DTYPES = _env_bool("COMPACT_DTYPES", False)
+
+    # Folder the gunicorn workers write their metrics to, so /metrics covers
+    # all of them; gunicorn.conf.py sets one, unset reports this process only
+    METRICS_DIR = os.environ.get("METRICS_DIR") or None
+    # Seconds between two writes of a worker's metrics to METRICS_DIR
+    METRICS_SHARE_INTERVAL = _env_float("METRICS_SHARE_INTERVAL", 5)
+
+    # "background" loads the models, datasets and events on a thread after the
+    # app starts, "blocking" loads them before create_app() returns, and
+    # "deferred" leaves starting the warmup to the server (gunicorn.conf.py
+    # starts it in every worker once forked)
+    STARTUP_WARMUP = os.environ.get("STARTUP_WARMUP", "background")
+
+    # Ranges over 7 days: "global" uses models/model.joblib, "recursive" rolls
+    # the per-room lag 0 models forward day by day and keeps their intervals
+    LONG_RANGE_FORECAST = os.environ.get("LONG_RANGE_FORECAST", "global")
+    # Upper bound on the days one recursive forecast rolls out, counted from
+    # the day after the history when a range starts later; the rollout makes
+    # one model call per room and day, longer ranges answer 400
+    FORECAST_MAX_DAYS = _env_int("FORECAST_MAX_DAYS", 120)
+
+    # Days of predictions materialized into datasets/forecast.parquet after
+    # every rebuild, starting today (or ending on the last day with features),
+    # 0 disables the table
+    FORECAST_TABLE_HORIZON = _env_int("FORECAST_TABLE_HORIZON", 0)
+    # Seconds between checks that the table is still current, 0 only
+    # materializes it at startup and after rebuilds
+    FORECAST_TABLE_INTERVAL = _env_float("FORECAST_TABLE_INTERVAL", 0)
+
+    # Threads computing predictions, 0 computes them on the request thread
+    PREDICT_WORKERS = _env_int("PREDICT_WORKERS", 2)
+    # Predictions allowed to wait for a free worker before answering 429
+    PREDICT_QUEUE_SIZE = _env_int("PREDICT_QUEUE_SIZE", 8)
+    # Seconds a request waits for its prediction before answering 504
+    PREDICT_TIMEOUT = _env_float("PREDICT_TIMEOUT", 30)
+
+    # Upper bound on the queries of one /predict/bulk/ request
+    PREDICT_BULK_MAX_QUERIES = _env_int("PREDICT_BULK_MAX_QUERIES", 1000)
+    # Upper bound on the extra intervals ("alphas") of one request
+    PREDICT_MAX_ALPHAS = _env_int("PREDICT_MAX_ALPHAS", 10)
+
+    # Cached /predict responses, 0 disables the cache
+    RESPONSE_CACHE_SIZE = _env_int("RESPONSE_CACHE_SIZE", 256)
+    # Seconds a cached response is served for, 0 keeps it until evicted
+    RESPONSE_CACHE_TTL = _env_float("RESPONSE_CACHE_TTL", 300)
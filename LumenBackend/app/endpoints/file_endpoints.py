@@ -1,8 +1,11 @@
-from flask import Blueprint, Response, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify, url_for
+import hashlib
 import os
 from werkzeug.utils import secure_filename
-import pandas as pd
-from app.form_datasets import form
+from app.enums.room_indices_dict import room_indices
+from app.utils.feature_store import dataset_file_name, read_manifest
+from app.utils.executor import QueueFull
+from app.utils.jobs import file_lock
 
 file_blueprint = Blueprint("file", __name__)
 
@@ -20,6 +23,106 @@ def parquet_exists(directory):
     return False
 
 
+def file_fingerprint(file):
+    """SHA-256 of an uploaded file, leaving the stream at the start."""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.stream.read(1024 * 1024), b""):
+        digest.update(chunk)
+    file.stream.seek(0)
+    return digest.hexdigest()
+
+
+def rebuild_datasets(
+    storage_path,
+    mode,
+    workers,
+    export_csv,
+    compact,
+    datasets_dir,
+    events_dir,
+    materialize,
+    report,
+):
+    """
+    Reruns form() on the training data followed by the uploaded reservations.
+
+    In "incremental" mode only the upload is processed, on top of the saved
+    pipeline state of the training data. Rebuilds hold a file lock, so jobs
+    started by different server workers do not write the datasets at once.
+    The datasets are published to `datasets_dir`, with the events of
+    `events_dir`.
+    `materialize`, if given, is called with `report` once the new datasets
+    are published.
+    """
+    # The pipeline imports sklearn, which would otherwise slow down startup
+    from app.form_datasets import form
+    from app.form_incremental import form_incremental
+
+    report("waiting", 0.0)
+    with file_lock(os.path.join(datasets_dir, ".rebuild.lock")):
+        if mode == "incremental":
+            form_incremental(
+                storage_path,
+                train_path="parquet_files/train.parquet",
+                progress=report,
+                workers=workers,
+                export_csv=export_csv,
+                compact=compact,
+                datasets_dir=datasets_dir,
+                events_dir=events_dir,
+            )
+        else:
+            form(
+                ["parquet_files/train.parquet", storage_path],
+                progress=report,
+                workers=workers,
+                export_csv=export_csv,
+                compact=compact,
+                datasets_dir=datasets_dir,
+                events_dir=events_dir,
+            )
+
+    if materialize is not None:
+        materialize(report)
+
+
+def forecast_materializer():
+    """
+    The forecast table materialization run after a rebuild, in an app
+    context of its own, or None if the table is disabled.
+    """
+    if current_app.config.get("FORECAST_TABLE") is None:
+        return None
+    from app.endpoints.prediction_endpoints import materialize_forecast
+
+    app = current_app._get_current_object()
+
+    def materialize(report):
+        # The datasets are already published, so a failure here only leaves
+        # predictions to live inference instead of failing the rebuild
+        with app.app_context():
+            try:
+                materialize_forecast(report)
+            except Exception as e:
+                print(f"Error materializing the forecast table: {e}")
+
+    return materialize
+
+
+def invalidate_responses():
+    """Drops the cached predictions after the stored data changed."""
+    cache = current_app.config.get("RESPONSE_CACHE")
+    if cache is not None:
+        cache.invalidate()
+
+
+def job_response(job):
+    return {
+        **job.to_dict(),
+        "status_url": url_for("file.get_job_status", job_id=job.id),
+    }
+
+
 @file_blueprint.route("/", methods=["POST"])
 def upload_file():
     if "file" not in request.files:
@@ -31,26 +134,70 @@ def upload_file():
 
     if file and allowed_file(file.filename):
         storage_path = os.path.join("storage", secure_filename(file.filename))
+        rebuild_jobs = current_app.config["REBUILD_JOBS"]
+
+        fingerprint = file_fingerprint(file)
+        running_job = next(
+            (job for job in rebuild_jobs.active() if job.fingerprint == fingerprint),
+            None,
+        )
+        if running_job is not None:
+            return (
+                jsonify(
+                    {
+                        "success": "File is already being processed",
+                        **job_response(running_job),
+                    }
+                ),
+                202,
+            )
+
         if parquet_exists("storage/"):
             return (
                 jsonify({"error": "A .parquet file already exists on the server"}),
                 400,
             )
 
+        if rebuild_jobs.full():
+            raise QueueFull("Too many dataset rebuilds are queued")
+
         try:
+            # The datasets only change once the rebuild publishes them, which
+            # moves the cache keys to the new version
             file.save(storage_path)
 
-            old_dataset = pd.read_parquet("parquet_files/train.parquet")
-            new_dataset = pd.read_parquet(storage_path)
+            def remove_upload(error):
+                if os.path.exists(storage_path):
+                    os.remove(storage_path)
 
-            combined_dataset = pd.concat([old_dataset, new_dataset])
-            combined_dataset.reset_index(drop=True, inplace=True)
-
-            combined_dataset.to_parquet("parquet_files/dataset.parquet")
-
-            form("parquet_files/dataset.parquet")
+            job, _ = rebuild_jobs.submit(
+                "rebuild",
+                rebuild_datasets,
+                storage_path,
+                current_app.config["REBUILD_MODE"],
+                current_app.config["FORM_WORKERS"],
+                current_app.config["DATASET_CSV_EXPORT"],
+                current_app.config["COMPACT_DTYPES"],
+                current_app.config["DATASETS_DIR"],
+                current_app.config["EVENTS_DIR"],
+                forecast_materializer(),
+                fingerprint=fingerprint,
+                on_error=remove_upload,
+            )
 
-            return jsonify({"success": "File uploaded successfully"}), 200
+            return (
+                jsonify(
+                    {
+                        "success": "File uploaded, dataset rebuild queued",
+                        **job_response(job),
+                    }
+                ),
+                202,
+            )
+        except QueueFull:
+            if os.path.exists(storage_path):
+                os.remove(storage_path)
+            raise
         except Exception as e:
             if os.path.exists(storage_path):
                 os.remove(storage_path)
@@ -76,6 +223,7 @@ def delete_file():
             deleted_files.append(filename)
 
     if deleted_files:
+        invalidate_responses()
         return (
             jsonify(
                 {"success": "Deleted .parquet file", "deleted_file": deleted_files}
@@ -92,24 +240,37 @@ def check_file():
         filename.endswith(".parquet") for filename in os.listdir("storage/")
     )
 
-    required_csvs = [
-        "dataset_room_type_1.csv",
-        "dataset_room_type_2.csv",
-        "dataset_room_type_3.csv",
-        "dataset_room_type_4.csv",
-        "dataset_room_type_5.csv",
-        "dataset_room_type_6.csv",
-        "dataset_room_type_7.csv",
-        "dataset_room_type_11.csv",
+    required_datasets = [
+        dataset_file_name(room_type, extension)
+        for room_type in room_indices
+        for extension in ("parquet", "csv")
     ]
 
-    csv_exists = any(csv_file in os.listdir("datasets/") for csv_file in required_csvs)
+    datasets_dir = current_app.config["DATASETS_DIR"]
+    datasets_exist = read_manifest(datasets_dir) is not None or any(
+        dataset_file in os.listdir(datasets_dir) for dataset_file in required_datasets
+    )
 
-    exists = parquet_exists or csv_exists
+    exists = parquet_exists or datasets_exist
 
     return jsonify({"exists": exists}), 200
 
 
+@file_blueprint.route("/jobs/", methods=["GET"])
+def list_jobs():
+    jobs = current_app.config["REBUILD_JOBS"].jobs()
+    return jsonify([job_response(job) for job in reversed(jobs)]), 200
+
+
+@file_blueprint.route("/jobs/<job_id>/", methods=["GET"])
+def get_job_status(job_id):
+    job = current_app.config["REBUILD_JOBS"].get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    return jsonify(job_response(job)), 200
+
+
 @file_blueprint.route("/download/", methods=["GET"])
 def download_parquet():
     storage_path = "storage/"
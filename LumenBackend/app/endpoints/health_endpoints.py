@@ -0,0 +1,53 @@
+import time
+
+from flask import Blueprint, current_app, jsonify
+
+health_blueprint = Blueprint("health", __name__)
+
+PROCESS_STARTED = time.time()
+
+
+def loaded_artifacts():
+    return {
+        "model": current_app.config.get("MODEL") is not None,
+        "separated_models": len(current_app.config["MODEL_REGISTRY"].loaded()),
+        "datasets": current_app.config["FEATURE_STORE"].room_types(),
+        "events": current_app.config["EVENT_INDEX"].version > 0,
+    }
+
+
+@health_blueprint.route("/live/", methods=["GET"])
+def get_liveness():
+    """The process is up and answering requests."""
+    return (
+        jsonify(
+            {
+                "status": "alive",
+                "uptime_seconds": round(time.time() - PROCESS_STARTED, 3),
+            }
+        ),
+        200,
+    )
+
+
+@health_blueprint.route("/ready/", methods=["GET"])
+def get_readiness():
+    """
+    Ready once the warmup finished and the global model is loaded, with the
+    status and duration of every warmup step.
+    """
+    warmup = current_app.config["WARMUP"]
+    loaded = loaded_artifacts()
+    ready = warmup.done and loaded["model"]
+
+    return (
+        jsonify(
+            {
+                "status": "ready" if ready else "not_ready",
+                "startup_seconds": round(current_app.config["STARTUP_SECONDS"], 3),
+                "warmup": warmup.status(),
+                "loaded": loaded,
+            }
+        ),
+        200 if ready else 503,
+    )
@@ -0,0 +1,34 @@
+import time
+
+from flask import Blueprint, Response, g, request
+
+from app.utils.metrics import HTTP_REQUEST_SECONDS, REGISTRY
+
+metrics_blueprint = Blueprint("metrics", __name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@metrics_blueprint.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@metrics_blueprint.after_app_request
+def observe_request(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        # The route pattern rather than the path keeps job ids out of the labels
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            endpoint=endpoint,
+            status=response.status_code,
+        )
+    return response
+
+
+@metrics_blueprint.route("/", methods=["GET"], strict_slashes=False)
+def get_metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
@@ -1,63 +1,715 @@
-from flask import Blueprint, current_app, jsonify, request
-from datetime import timedelta
+import json
+import os
+from collections import defaultdict
+from datetime import datetime
+
+from flask import (
+    Blueprint,
+    Response,
+    current_app,
+    jsonify,
+    request,
+    stream_with_context,
+)
 from app.enums.room_id_dict import scaled_to_normal_id, scaled_id_list
 from app.enums.room_indices_dict import room_dict
 from app.endpoints.file_endpoints import parquet_exists
+from app.utils.compiled_models import conformity_score_count, model_input
+from app.utils.executor import InferenceTimeout, QueueFull
+from app.utils.forecast import (
+    forecast_available,
+    recursive_forecast,
+    rollout_length,
+)
+from app.utils.forecast_table import (
+    GLOBAL_LAG,
+    forecast_start,
+    source_stamps,
+    write_forecast_table,
+)
+from app.utils.jobs import file_lock
+from app.utils.model_registry import LAG_COUNT
+from app.utils.metrics import MODEL_PREDICT_ROWS, MODEL_PREDICT_SECONDS
 import numpy as np
 import pandas as pd
-import joblib
-
-features = [
-    "day_of_week",
-    "week_day_avg",
-    "month_avg",
-    "week_day_importance",
-    "event",
-    "occupancy_lag_1",
-    "occupancy_lag_2",
-    "occupancy_lag_3",
-    "occupancy_lag_4",
-    "occupancy_lag_5",
-    "occupancy_lag_6",
-    "occupancy_lag_7",
-    "mean_last_7",
-]
 
 predict_blueprint = Blueprint("predict", __name__)
 
+# Alpha of the low_boundary/high_boundary pair every prediction carries
+DEFAULT_ALPHA = 0.6
 
-def predict_date(date, room_type, day_num):
 
-    dataset = pd.read_csv(f"datasets/dataset_room_type_{room_type}.csv")
-    model_path = (
-        f"separated_models/model_rt_{room_type}/mapie_model_lag_{day_num}.joblib"
-    )
-    try:
-        model = joblib.load(model_path)
-    except Exception as e:
-        print(e)
-
-    day = dataset[pd.to_datetime(dataset["stay_date"]) == date]
-    day_series = day[features]
-    day_input = pd.DataFrame(day_series)
-    m_pred, m_piss = model.predict(day_input, alpha=0.6)
-    low = np.round_(m_piss[0][0][0]) if m_piss[0][0][0] > 0 else 0
-    high = np.round_(m_piss[0][1][0])
+def predict_date(date, room_type, day_num, alphas=()):
+
+    feature_store = current_app.config["FEATURE_STORE"]
+    model = current_app.config["MODEL_REGISTRY"].get(room_type, day_num)
+
+    day_input = model_input(model, feature_store.features(room_type, date)[None, :])
+    with MODEL_PREDICT_SECONDS.time(model="separated"):
+        prediction = model.predict(day_input, alpha=model_alphas(alphas))
+    MODEL_PREDICT_ROWS.inc(model="separated")
+    return prediction_bounds(*prediction, alphas)
+
+
+def model_alphas(alphas):
+    """
+    The alpha argument of a MAPIE predict call: the default alpha first,
+    followed by the requested ones, so one call computes every band.
+    """
+    return (DEFAULT_ALPHA, *alphas) if alphas else DEFAULT_ALPHA
+
+
+def interval_bounds(m_pred, m_piss, alpha_index=0):
+    low = np.round_(m_piss[0][0][alpha_index]) if m_piss[0][0][alpha_index] > 0 else 0
+    high = np.round_(m_piss[0][1][alpha_index])
     if low == high:
         high += 1
     return np.round_(m_pred), low, high
 
 
-@predict_blueprint.route("/", methods=["POST"])
-def get_date_prediction():
+def prediction_bounds(m_pred, m_piss, alphas=()):
+    """
+    The (occupancy, low, high) bounds of the default alpha and, if `alphas`
+    were requested, the list of their (low, high) bands as a fourth item.
+    """
+    bounds = interval_bounds(m_pred, m_piss)
+    if not alphas:
+        return bounds
+    bands = [interval_bounds(m_pred, m_piss, i + 1)[1:] for i in range(len(alphas))]
+    return (*bounds, bands)
+
+
+def parse_alphas(data):
+    """
+    Validates the optional "alphas" of a request: the miscoverage rates of
+    the extra intervals, e.g. [0.5, 0.2, 0.05] for 50/80/95% bands.
+    """
+    alphas = data.get("alphas")
+    if alphas is None:
+        return ()
+    max_alphas = current_app.config["PREDICT_MAX_ALPHAS"]
+    if isinstance(alphas, list) and len(alphas) > max_alphas:
+        raise ValueError(f"At most {max_alphas} alphas per request")
+    if not isinstance(alphas, list) or not all(
+        isinstance(alpha, (int, float)) and not isinstance(alpha, bool)
+        for alpha in alphas
+    ):
+        raise ValueError("alphas must be a list of numbers")
+    if not all(0 < alpha < 1 for alpha in alphas):
+        raise ValueError("Every alpha must be between 0 and 1")
+    return tuple(float(alpha) for alpha in alphas)
+
+
+def range_model_keys(date_range, room_types):
+    """The (room type, lag) models the intervals of a range come from."""
+    if len(date_range) <= 7:
+        return {
+            (room_type, lag)
+            for lag in range(len(date_range))
+            for room_type in room_types
+        }
+    if use_recursive_forecast(date_range):
+        return {(room_type, 0) for room_type in room_dict.values()}
+    return set()
+
+
+def check_alphas(alphas, keys):
+    """
+    Raises ValueError for alphas the models of `keys` were calibrated on too
+    few samples for: MAPIE needs at least 1/alpha and 1/(1 - alpha)
+    conformity scores, and would fail the prediction otherwise.
+    """
+    if not alphas:
+        return
+    model_registry = current_app.config["MODEL_REGISTRY"]
+    counts = []
+    for key in keys:
+        try:
+            count = conformity_score_count(model_registry.get(*key))
+        except OSError:
+            # Missing models fail the prediction itself
+            continue
+        if count is not None:
+            counts.append(count)
+    if not counts:
+        return
+    n = min(counts)
+    for alpha in alphas:
+        if n < 1 / alpha or n < 1 / (1 - alpha):
+            raise ValueError(
+                f"alpha {alpha:g} needs more calibration samples than the "
+                f"models have ({n}), use alphas between {1 / n:.4g} and "
+                f"{1 - 1 / n:.4g}"
+            )
+
+
+def prediction_entry(room_type, bounds, alphas=()):
+    """One room of a day in the response, with its extra bands if requested."""
+    occupancy, low, high, *bands = bounds
+    entry = {
+        "room_id": room_type,
+        "room_cnt": int(occupancy),
+        "low_boundary": int(low),
+        "high_boundary": int(high),
+    }
+    if alphas:
+        entry["intervals"] = [
+            {
+                "alpha": alpha,
+                "low_boundary": int(band_low),
+                "high_boundary": int(band_high),
+            }
+            for alpha, (band_low, band_high) in zip(alphas, bands[0])
+        ]
+    return entry
+
+
+def predict_date_range(date_range, room_types, alphas=()):
+    """
+    Predicts every (date, room type) pair of a short range.
+
+    Returns a dict keyed by (day_num, room_type). When the prediction batcher
+    is enabled all rows are queued first, so they can share model calls with
+    each other and with concurrent requests, and collected afterwards.
+    """
+    batcher = current_app.config.get("PREDICTION_BATCHER")
+    if batcher is None:
+        return {
+            (i, room_type): predict_date(date, room_type, i, alphas)
+            for i, date in enumerate(date_range)
+            for room_type in room_types
+        }
+
+    feature_store = current_app.config["FEATURE_STORE"]
+    futures = {
+        (i, room_type): batcher.submit(
+            room_type,
+            i,
+            feature_store.features(room_type, date),
+            alpha=model_alphas(alphas),
+        )
+        for i, date in enumerate(date_range)
+        for room_type in room_types
+    }
+    return {
+        key: prediction_bounds(*future.result(), alphas)
+        for key, future in futures.items()
+    }
+
+
+def predict_missing_days(date_range, room_types, missing, alphas=()):
+    """
+    Predicts the days of a short range flagged in `missing`, with the lag
+    model of their position in the range, keyed like `predict_date_range`.
+    """
+    keys = [
+        (room_type, date_range[i], int(i))
+        for i in np.flatnonzero(missing)
+        for room_type in room_types
+    ]
+    predictions = predict_lag_rows(set(keys), alphas)
+    results = {}
+    for key in keys:
+        bounds = predictions[key]
+        if isinstance(bounds, Exception):
+            raise bounds
+        results[(key[2], key[0])] = bounds
+    return results
+
+
+def use_recursive_forecast(date_range):
+    """
+    Whether a long range is forecast by rolling the per-room models forward
+    instead of with the global model.
+    """
+    return (
+        len(date_range) > 7
+        and current_app.config["LONG_RANGE_FORECAST"] == "recursive"
+        and forecast_available(
+            current_app.config["FEATURE_STORE"], list(room_dict.values())
+        )
+    )
 
-    model = current_app.config.get("MODEL")
-    if model is None:
+
+def check_global_alphas(alphas):
+    """
+    Raises ValueError if alphas are asked of a range the global model
+    predicts, which gives room counts without intervals.
+    """
+    if alphas:
+        raise ValueError(
+            "The global model predicts ranges over 7 days without intervals, "
+            "alphas are only accepted for ranges of up to 7 days"
+        )
+
+
+def check_rollout(date_range):
+    """
+    Raises ValueError for a range the recursive forecast would have to roll
+    out over more than FORECAST_MAX_DAYS days to reach.
+    """
+    max_days = current_app.config["FORECAST_MAX_DAYS"]
+    days = rollout_length(
+        current_app.config["FEATURE_STORE"], date_range, list(room_dict.values())
+    )
+    if days > max_days:
+        raise ValueError(
+            f"The forecast covers at most {max_days} days past the start date "
+            f"or the last known date, this range needs {days}"
+        )
+
+
+def forecast_date_range(date_range, room_types, alphas=()):
+    """Recursive forecast of a range, keyed like `predict_date_range`."""
+    forecast = recursive_forecast(
+        current_app.config["MODEL_REGISTRY"],
+        current_app.config["FEATURE_STORE"],
+        current_app.config["EVENT_INDEX"].calendar(),
+        date_range,
+        room_types,
+        alpha=model_alphas(alphas),
+    )
+    return {key: prediction_bounds(*value, alphas) for key, value in forecast.items()}
+
+
+def range_model_input(date_range, calendar):
+    """
+    Builds the input matrix of the global model for a whole date range.
+
+    Rows are ordered date by date, with one row per room type in
+    `scaled_id_list` order, so the result reshapes to (dates, rooms).
+    """
+    room_count = len(scaled_id_list)
+    event_coef = calendar.any_event(date_range)
+    weather_coef = 0
+
+    return np.column_stack(
+        [
+            np.repeat(date_range.dayofweek + 1, room_count),
+            np.repeat(date_range.dayofyear, room_count),
+            np.full(len(date_range) * room_count, weather_coef),
+            np.tile(scaled_id_list, len(date_range)),
+            np.repeat(event_coef, room_count),
+        ]
+    )
+
+
+def predict_range_counts(model, date_range, calendar):
+    """Predicts the room counts of every room type and date with a single call."""
+    model_input = range_model_input(date_range, calendar)
+    with MODEL_PREDICT_SECONDS.time(model="global"):
+        predictions = model.predict(model_input)
+    MODEL_PREDICT_ROWS.inc(len(model_input), model="global")
+    return np.rint(predictions).astype(int).reshape(len(date_range), -1)
+
+
+def prediction_cache_key(date_range, alphas):
+    """
+    Cache key of a prediction request: the normalized date range and alphas
+    plus the versions of everything the predictions are computed from.
+
+    The key also makes the ETag, so it only holds values that are the same
+    in every server worker and after a restart: the dataset version and the
+    modification times and sizes of the model and event files, never
+    in-process counters.
+    """
+    feature_store = current_app.config["FEATURE_STORE"]
+    feature_store.refresh()
+    event_index = current_app.config["EVENT_INDEX"]
+    event_index.calendar()
+    return (
+        date_range[0].strftime("%Y-%m-%d"),
+        date_range[-1].strftime("%Y-%m-%d"),
+        alphas,
+        current_app.config["LONG_RANGE_FORECAST"],
+        # Folders without a manifest have no version, their file times stand in
+        feature_store.version or feature_store.stamp,
+        current_app.config["MODEL_STAMP"],
+        current_app.config["MODEL_REGISTRY"].stamp,
+        event_index.stamp,
+    )
+
+
+def prediction_unavailable():
+    """Error response if predictions cannot be served right now, else None."""
+    if current_app.config.get("MODEL") is None:
+        if not current_app.config["WARMUP"].done:
+            return (
+                jsonify({"error": "The model is still loading, try again shortly"}),
+                503,
+                {"Retry-After": "1"},
+            )
         return jsonify({"error": "Model not found"}), 404
 
     if parquet_exists("storage/") is False:
         return jsonify({"error": " Parquet file not found"}), 404
 
+    return None
+
+
+def run_inference(fn, *args):
+    """
+    Runs a model call on the bounded inference pool, if there is one.
+    Raises `QueueFull` or `InferenceTimeout` when the pool is saturated.
+    """
+    executor = current_app.config.get("INFERENCE_EXECUTOR")
+    if executor is None:
+        return fn(*args)
+    return executor.run(fn, *args)
+
+
+def predict_lag_rows(keys, alphas=()):
+    """
+    Predicts a set of (room_type, date, lag) keys with one model call per
+    (room type, lag) model, computing the bands of every alpha in that call.
+
+    Returns a dict mapping every key to its bounds, as `prediction_bounds`
+    returns them, or to the exception that prevented its prediction.
+    """
+    feature_store = current_app.config["FEATURE_STORE"]
+    model_registry = current_app.config["MODEL_REGISTRY"]
+
+    groups = defaultdict(list)
+    for room_type, date, lag in keys:
+        groups[(room_type, lag)].append(date)
+
+    results = {}
+    for (room_type, lag), dates in groups.items():
+        rows, row_dates = [], []
+        for date in dates:
+            try:
+                rows.append(feature_store.features(room_type, date))
+                row_dates.append(date)
+            except KeyError as e:
+                results[(room_type, date, lag)] = e
+        if not rows:
+            continue
+
+        try:
+            model = model_registry.get(room_type, lag)
+            with MODEL_PREDICT_SECONDS.time(model="separated"):
+                m_pred, m_pis = model.predict(
+                    model_input(model, np.vstack(rows)), alpha=model_alphas(alphas)
+                )
+            MODEL_PREDICT_ROWS.inc(len(rows), model="separated")
+        except Exception as e:
+            for date in row_dates:
+                results[(room_type, date, lag)] = e
+            continue
+
+        for i, date in enumerate(row_dates):
+            results[(room_type, date, lag)] = prediction_bounds(
+                m_pred[i : i + 1], m_pis[i : i + 1], alphas
+            )
+    return results
+
+
+def current_forecast_table():
+    """
+    The materialized forecast table if it was computed from the datasets,
+    models and events served right now, else None.
+    """
+    forecast_table = current_app.config.get("FORECAST_TABLE")
+    if forecast_table is None:
+        return None
+
+    feature_store = current_app.config["FEATURE_STORE"]
+    feature_store.refresh()
+    event_index = current_app.config["EVENT_INDEX"]
+    event_index.calendar()
+    key = (
+        feature_store.generation,
+        current_app.config["MODEL_REGISTRY"].version,
+        event_index.version,
+    )
+    if not forecast_table.is_current(feature_store.version, key):
+        return None
+    return forecast_table
+
+
+def materialize_forecast(report=None):
+    """
+    Predicts every room type over the next FORECAST_TABLE_HORIZON days and
+    writes the forecast table next to the datasets.
+
+    Nothing is computed if the table on disk is still current and starts on
+    the expected date. Returns whether a new table was written.
+    """
+    forecast_table = current_app.config["FORECAST_TABLE"]
+    horizon = current_app.config["FORECAST_TABLE_HORIZON"]
+    feature_store = current_app.config["FEATURE_STORE"]
+    model_registry = current_app.config["MODEL_REGISTRY"]
+
+    # Server workers share the table, the first one to get here computes it
+    with file_lock(os.path.join(forecast_table.directory, ".forecast.lock")):
+        feature_store.refresh(wait=True)
+        model_registry.refresh()
+        room_types = feature_store.room_types()
+        if feature_store.version is None or not room_types:
+            print("No published datasets, the forecast table is not materialized")
+            return False
+
+        last_date = max(
+            feature_store.table(room_type).index[-1] for room_type in room_types
+        )
+        start = forecast_start(last_date, horizon)
+        if (
+            current_forecast_table() is not None
+            and forecast_table.metadata["start"] == start.strftime("%Y-%m-%d")
+            and forecast_table.metadata["horizon"] == horizon
+        ):
+            return False
+
+        if report is not None:
+            report("forecast")
+        # Stamped before predicting, so files replaced meanwhile mark it stale
+        sources = source_stamps(forecast_table.sources)
+        dates = pd.date_range(start, periods=horizon, freq="D")
+
+        lag_predictions = predict_lag_rows(
+            {
+                (room_type, date, lag)
+                for room_type in room_types
+                for date in dates
+                for lag in range(LAG_COUNT)
+            }
+        )
+        rows = [
+            (date, room_type, lag, *(int(value) for value in result))
+            for (room_type, date, lag), result in lag_predictions.items()
+            if not isinstance(result, Exception)
+        ]
+
+        model = current_app.config.get("MODEL")
+        if model is not None:
+            counts = predict_range_counts(
+                model, dates, current_app.config["EVENT_INDEX"].calendar()
+            )
+            rows.extend(
+                (date, scaled_to_normal_id[scaled_room_id], GLOBAL_LAG, int(count))
+                + (None, None)
+                for date, date_counts in zip(dates, counts)
+                for scaled_room_id, count in zip(scaled_id_list, date_counts)
+            )
+
+        frame = pd.DataFrame(
+            rows,
+            columns=[
+                "stay_date",
+                "room_type",
+                "lag",
+                "room_cnt",
+                "low_boundary",
+                "high_boundary",
+            ],
+        ).astype({"low_boundary": "Int64", "high_boundary": "Int64"})
+        write_forecast_table(
+            forecast_table.directory,
+            frame,
+            {
+                "start": start.strftime("%Y-%m-%d"),
+                "horizon": horizon,
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "dataset_version": feature_store.version,
+                "sources": sources,
+            },
+        )
+        forecast_table.refresh()
+    print(f"Materialized the forecast table from {start:%Y-%m-%d} for {horizon} days")
+    return True
+
+
+def parse_bulk_query(query):
+    """
+    Validates one query of a bulk request. Returns its date range and the
+    requested room types, in `room_dict` order.
+    """
+    if not isinstance(query, dict):
+        raise ValueError("Every query must be an object")
+
+    missing_fields = [
+        field for field in ("start_date", "end_date") if field not in query
+    ]
+    if missing_fields:
+        raise ValueError("Missing data for fields: " + ", ".join(missing_fields))
+
+    start_date = pd.to_datetime(query["start_date"], dayfirst=True)
+    end_date = pd.to_datetime(query["end_date"], dayfirst=True)
+    if start_date > end_date:
+        raise ValueError("Start date can't be after end date")
+
+    room_types = query.get("room_types")
+    if room_types is None:
+        return pd.date_range(start_date, end_date, freq="D"), list(room_dict.values())
+
+    if not isinstance(room_types, list):
+        raise ValueError("room_types must be a list of room ids")
+    unknown = [room for room in room_types if room not in room_dict.values()]
+    if unknown:
+        raise ValueError(f"Unknown room types: {unknown}")
+    return (
+        pd.date_range(start_date, end_date, freq="D"),
+        [room for room in room_dict.values() if room in room_types],
+    )
+
+
+def bulk_predictions(queries, alphas=()):
+    """
+    Computes the predictions every query needs.
+
+    Ranges of up to 7 days use the per-room lag models, where the lag is the
+    position of the date in its range, so every (room type, date, lag) is
+    predicted once however many queries share it. Longer ranges use the
+    global model, called once for the union of their dates, or with the
+    recursive forecast one rollout per start date, long enough for every
+    query starting there.
+    """
+    lag_keys = set()
+    global_dates = set()
+    rollout_ends = {}
+    for date_range, room_types in queries:
+        if len(date_range) <= 7:
+            lag_keys.update(
+                (room_type, date, lag)
+                for lag, date in enumerate(date_range)
+                for room_type in room_types
+            )
+        elif use_recursive_forecast(date_range):
+            start = date_range[0]
+            rollout_ends[start] = max(rollout_ends.get(start, start), date_range[-1])
+        else:
+            global_dates.update(date_range)
+
+    lag_predictions = predict_lag_rows(lag_keys, alphas) if lag_keys else {}
+
+    rollouts = {}
+    for start, end in rollout_ends.items():
+        try:
+            rollouts[start] = forecast_date_range(
+                pd.date_range(start, end, freq="D"), list(room_dict.values()), alphas
+            )
+        except Exception as e:
+            rollouts[start] = e
+
+    global_counts, global_error = {}, None
+    if global_dates:
+        dates = pd.DatetimeIndex(sorted(global_dates))
+        try:
+            counts = predict_range_counts(
+                current_app.config["MODEL"],
+                dates,
+                current_app.config["EVENT_INDEX"].calendar(),
+            )
+            global_counts = dict(zip(dates, counts))
+        except Exception as e:
+            global_error = e
+
+    return lag_predictions, rollouts, global_counts, global_error
+
+
+def bulk_prediction_lines(queries, predictions, alphas=()):
+    """
+    Yields the predictions from `bulk_predictions` as NDJSON lines, one per
+    (query, date). The predictions themselves are small; only the serialized
+    lines are produced lazily.
+    """
+    lag_predictions, rollouts, global_counts, global_error = predictions
+
+    for index, (date_range, room_types) in enumerate(queries):
+        if len(date_range) <= 7:
+            yield from _interval_lines(
+                index,
+                date_range,
+                room_types,
+                lambda lag, date, room_type: lag_predictions[(room_type, date, lag)],
+                alphas,
+            )
+            continue
+
+        rollout = rollouts.get(date_range[0])
+        if rollout is not None:
+            if isinstance(rollout, Exception):
+                yield _ndjson(
+                    {"query": index, "error": f"Model prediction failed: {rollout}"}
+                )
+                continue
+            yield from _interval_lines(
+                index,
+                date_range,
+                room_types,
+                lambda lag, date, room_type: rollout[(lag, room_type)],
+                alphas,
+            )
+            continue
+
+        if global_error is not None:
+            yield _ndjson(
+                {
+                    "query": index,
+                    "error": f"Model prediction failed: {global_error}",
+                }
+            )
+            continue
+        for date in date_range:
+            yield _ndjson(
+                {
+                    "query": index,
+                    "date": date.isoformat(),
+                    "predictions": [
+                        {
+                            "room_id": scaled_to_normal_id.get(scaled_room_id),
+                            "room_cnt": int(room_cnt),
+                        }
+                        for scaled_room_id, room_cnt in zip(
+                            scaled_id_list, global_counts[date]
+                        )
+                        if scaled_to_normal_id.get(scaled_room_id) in room_types
+                    ],
+                }
+            )
+
+
+def _interval_lines(index, date_range, room_types, lookup, alphas=()):
+    for lag, date in enumerate(date_range):
+        predictions = []
+        error = None
+        for room_type in room_types:
+            result = lookup(lag, date, room_type)
+            if isinstance(result, Exception):
+                error = result
+                break
+            predictions.append(prediction_entry(room_type, result, alphas))
+        if error is not None:
+            yield _ndjson(
+                {
+                    "query": index,
+                    "date": date.strftime("%Y-%m-%d"),
+                    "error": f"Model prediction failed: {error}",
+                }
+            )
+            continue
+        yield _ndjson(
+            {
+                "query": index,
+                "date": date.strftime("%Y-%m-%d"),
+                "predictions": predictions,
+            }
+        )
+
+
+def _ndjson(record):
+    return json.dumps(record) + "\n"
+
+
+@predict_blueprint.route("/", methods=["POST"])
+def get_date_prediction():
+
+    unavailable = prediction_unavailable()
+    if unavailable is not None:
+        return unavailable
+
+    model = current_app.config["MODEL"]
+
     data = request.json
 
     if not data:
@@ -86,82 +738,133 @@ def get_date_prediction():
             )
 
         date_range = pd.date_range(start=start_date, end=end_date, freq="D")
+        alphas = parse_alphas(data)
+
+        cache = current_app.config.get("RESPONSE_CACHE")
+        if cache is not None:
+            cache_key = prediction_cache_key(date_range, alphas)
+            etag = cache.etag(cache_key)
+            if etag in request.if_none_match:
+                response = current_app.response_class(status=304)
+                response.set_etag(etag)
+                return response
+            body = cache.get(cache_key)
+            if body is not None:
+                response = current_app.response_class(
+                    body, mimetype=current_app.config["JSONIFY_MIMETYPE"]
+                )
+                response.set_etag(etag)
+                return response, 200
 
         all_predictions = []
 
-        if len(date_range) > 7:
-            all_predictions = []
-
-            for current_date in (
-                start_date + timedelta(days=n)
-                for n in range((end_date - start_date).days + 1)
-            ):
-                date_key = current_date.isoformat()
-                predictions_for_date = []
-                day_of_week = current_date.isoweekday()
-                day_of_year = current_date.timetuple().tm_yday
-
-                event_coef = 1 if date_key in events_data else 0
-
-                for scaled_room_id in scaled_id_list:
-                    weather_coef = 0
-
-                    model_input = np.array(
-                        [
-                            [
-                                day_of_week,
-                                day_of_year,
-                                weather_coef,
-                                scaled_room_id,
-                                event_coef,
-                            ]
-                        ]
-                    )
+        if len(date_range) > 7 and not use_recursive_forecast(date_range):
 
-                    try:
-                        room_cnt = round(model.predict(model_input)[0])
-                    except Exception as e:
-                        return (
-                            jsonify({"error": f"Model prediction failed: {str(e)}"}),
-                            500,
-                        )
+            check_global_alphas(alphas)
+            forecast_table = current_forecast_table()
+            room_counts, missing = (
+                forecast_table.counts(date_range)
+                if forecast_table is not None
+                else (None, None)
+            )
 
-                    predictions_for_date.append(
-                        {
-                            "room_id": scaled_to_normal_id.get(scaled_room_id),
-                            "room_cnt": room_cnt,
-                        }
+            try:
+                # Only the dates the table does not hold are predicted live
+                if missing is None or missing.all():
+                    room_counts = run_inference(
+                        predict_range_counts,
+                        model,
+                        date_range,
+                        current_app.config["EVENT_INDEX"].calendar(),
                     )
+                elif missing.any():
+                    room_counts[missing] = run_inference(
+                        predict_range_counts,
+                        model,
+                        date_range[missing],
+                        current_app.config["EVENT_INDEX"].calendar(),
+                    )
+            except (QueueFull, InferenceTimeout):
+                raise
+            except Exception as e:
+                return (
+                    jsonify({"error": f"Model prediction failed: {str(e)}"}),
+                    500,
+                )
 
+            for current_date, counts in zip(date_range, room_counts):
                 all_predictions.append(
-                    {"date": date_key, "predictions": predictions_for_date}
+                    {
+                        "date": current_date.isoformat(),
+                        "predictions": [
+                            {
+                                "room_id": scaled_to_normal_id.get(scaled_room_id),
+                                "room_cnt": int(room_cnt),
+                            }
+                            for scaled_room_id, room_cnt in zip(scaled_id_list, counts)
+                        ],
+                    }
                 )
 
         else:
 
-            for i, date in enumerate(date_range):
+            current_app.config["FEATURE_STORE"].refresh()
+            check_alphas(alphas, range_model_keys(date_range, room_dict.values()))
+            if len(date_range) > 7:
+                check_rollout(date_range)
 
-                one_day_predictions = []
+            # The table only holds the bands of the default alpha
+            forecast_table = (
+                current_forecast_table()
+                if len(date_range) <= 7 and not alphas
+                else None
+            )
+            predictions, missing = (
+                forecast_table.intervals(date_range, list(room_dict.values()))
+                if forecast_table is not None
+                else (None, None)
+            )
 
-                for room_type_num in room_dict.values():
+            try:
+                # Only the days the table does not hold are predicted live
+                if missing is None or missing.all():
+                    predictions = run_inference(
+                        (
+                            forecast_date_range
+                            if len(date_range) > 7
+                            else predict_date_range
+                        ),
+                        date_range,
+                        list(room_dict.values()),
+                        alphas,
+                    )
+                elif missing.any():
+                    predictions.update(
+                        run_inference(
+                            predict_missing_days,
+                            date_range,
+                            list(room_dict.values()),
+                            missing,
+                        )
+                    )
+            except (QueueFull, InferenceTimeout):
+                raise
+            except Exception as e:
+                return (
+                    jsonify({"error": f"Model prediction failed: {str(e)}"}),
+                    500,
+                )
 
-                    try:
+            for i, date in enumerate(date_range):
 
-                        occupancy, low, high = predict_date(date, room_type_num, i)
+                one_day_predictions = []
 
-                    except Exception as e:
-                        return (
-                            jsonify({"error": f"Model prediction failed: {str(e)}"}),
-                            500,
-                        )
+                for room_type_num in room_dict.values():
 
                     one_day_predictions.append(
-                        {
-                            "room_id": room_type_num,
-                            "room_cnt": int(occupancy),
-                            "low_boundary": int(low),
-                            "high_boundary": int(high),
-                        }
+                        prediction_entry(
+                            room_type_num, predictions[(i, room_type_num)], alphas
+                        )
                     )
 
                 all_predictions.append(
@@ -174,15 +877,120 @@ def get_date_prediction():
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
 
-    return jsonify(all_predictions), 200
+    response = jsonify(all_predictions)
+    if cache is not None:
+        cache.put(cache_key, response.get_data())
+        response.set_etag(etag)
+    return response, 200
 
 
-import json
+@predict_blueprint.route("/bulk/", methods=["POST"])
+def get_bulk_prediction():
+    """
+    Predicts a list of queries, each a date range with optional room types,
+    and optionally the alphas of extra intervals for all of them:
+
+        {"queries": [{"start_date": "20.1.2009", "end_date": "22.1.2009",
+                      "room_types": [2, 5]}, ...],
+         "alphas": [0.5, 0.2, 0.05]}
+
+    The response is streamed as NDJSON, one line per query and date, shaped
+    like the entries of the single range endpoint plus the query index.
+    """
+    unavailable = prediction_unavailable()
+    if unavailable is not None:
+        return unavailable
+
+    data = request.json
+    if not data or not isinstance(data.get("queries"), list):
+        return jsonify({"error": "Expected a list of queries"}), 400
+
+    max_queries = current_app.config["PREDICT_BULK_MAX_QUERIES"]
+    if len(data["queries"]) > max_queries:
+        return (
+            jsonify({"error": f"At most {max_queries} queries per request"}),
+            400,
+        )
+
+    try:
+        alphas = parse_alphas(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    current_app.config["FEATURE_STORE"].refresh()
+    queries = []
+    for index, query in enumerate(data["queries"]):
+        try:
+            date_range, room_types = parse_bulk_query(query)
+            if use_recursive_forecast(date_range):
+                check_rollout(date_range)
+            elif len(date_range) > 7:
+                check_global_alphas(alphas)
+        except ValueError as e:
+            return jsonify({"error": f"Query {index}: {e}"}), 400
+        queries.append((date_range, room_types))
+
+    try:
+        check_alphas(
+            alphas,
+            set().union(
+                *(
+                    range_model_keys(date_range, room_types)
+                    for date_range, room_types in queries
+                )
+            ),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    predictions = run_inference(bulk_predictions, queries, alphas)
+
+    return Response(
+        stream_with_context(bulk_prediction_lines(queries, predictions, alphas)),
+        mimetype="application/x-ndjson",
+    )
+
+
+@predict_blueprint.route("/cache/", methods=["GET"])
+def get_cache_stats():
+    cache = current_app.config.get("RESPONSE_CACHE")
+    if cache is None:
+        return jsonify({"enabled": False}), 200
+
+    return jsonify({"enabled": True, **cache.stats()}), 200
+
+
+@predict_blueprint.route("/forecast/", methods=["GET"])
+def get_forecast_table_stats():
+    forecast_table = current_app.config.get("FORECAST_TABLE")
+    if forecast_table is None:
+        return jsonify({"enabled": False}), 200
+
+    return (
+        jsonify(
+            {
+                "enabled": True,
+                "current": current_forecast_table() is not None,
+                **forecast_table.stats(),
+            }
+        ),
+        200,
+    )
+
+
+@predict_blueprint.route("/executor/", methods=["GET"])
+def get_executor_stats():
+    executor = current_app.config.get("INFERENCE_EXECUTOR")
+    if executor is None:
+        return jsonify({"enabled": False}), 200
 
+    return jsonify({"enabled": True, **executor.stats()}), 200
 
-def read_events(file_path):
-    with open(file_path, "r") as file:
-        return json.load(file)
 
+@predict_blueprint.route("/batching/", methods=["GET"])
+def get_batching_stats():
+    batcher = current_app.config.get("PREDICTION_BATCHER")
+    if batcher is None:
+        return jsonify({"enabled": False}), 200
 
-events_data = read_events("events/events.json")
+    return jsonify({"enabled": True, **batcher.stats()}), 200
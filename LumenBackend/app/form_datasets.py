@@ -1,8 +1,23 @@
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pickle import PicklingError
 import pandas as pd
 import numpy as np
+import pyarrow.parquet as pq
 from sklearn.preprocessing import RobustScaler
 from app.enums.room_indices_dict import room_dict, room_indices, room_column
-import json
+from app.utils.compact import compact_frame
+from app.utils.event_index import EventCalendar
+from app.utils.feature_store import (
+    dataset_file_name,
+    new_version,
+    publish_manifest,
+    version_directory,
+)
+from app.utils.metrics import FORM_STAGE_SECONDS, StageTimer
 
 
 def form_room_occupancy(ds):
@@ -20,6 +35,86 @@ def form_room_occupancy(ds):
     return new_dataset
 
 
+# Columns of a reservation file the pipeline uses, everything else is never read
+reservation_columns = [
+    "stay_date",
+    "room_category_id",
+    "room_cnt",
+    "reservation_status",
+]
+
+INGEST_BATCH_ROWS = 65_536
+
+# Statuses of reservations that never occupied their rooms
+invalid_statuses = ["Cancelled", "No-show"]
+
+
+def valid_reservations(reservations):
+    """Drops the cancelled and no-show stays."""
+    return reservations[~reservations["reservation_status"].isin(invalid_statuses)]
+
+
+def reservation_batches(paths, batch_size=INGEST_BATCH_ROWS, report=None):
+    """
+    Yields the reservations of one or more parquet files as small DataFrames.
+
+    Only `reservation_columns` are read, one batch of row groups at a time,
+    so at most `batch_size` rows of a file are in memory at once.
+    """
+    files = [
+        pq.ParquetFile(path, read_dictionary=["reservation_status"]) for path in paths
+    ]
+    total_rows = sum(file.metadata.num_rows for file in files) or 1
+    read_rows = 0
+    for file in files:
+        for batch in file.iter_batches(
+            batch_size=batch_size, columns=reservation_columns
+        ):
+            read_rows += batch.num_rows
+            if report is not None:
+                report(read_rows / total_rows)
+            yield batch.to_pandas()
+
+
+def stream_room_occupancy(
+    paths, skip_rows=0, batch_size=INGEST_BATCH_ROWS, report=None
+):
+    """
+    Streaming version of `form_room_occupancy` over the `valid_reservations`
+    of one or more parquet files, read in order as if they were concatenated.
+
+    Cancelled and no-show rows are dropped and the room counts are summed per
+    (stay_date, room_category_id) batch by batch, so memory use depends on the
+    number of dates, not on the number of reservations. `skip_rows` drops the
+    first valid reservations, like the `iloc[2:]` in `form()`.
+    """
+    totals = None
+    for batch in reservation_batches(paths, batch_size, report):
+        batch = valid_reservations(batch)
+        if skip_rows:
+            skipped = min(skip_rows, len(batch))
+            batch = batch.iloc[skipped:]
+            skip_rows -= skipped
+
+        counts = batch.groupby(["stay_date", "room_category_id"])["room_cnt"].sum()
+        totals = (
+            counts
+            if totals is None
+            else pd.concat([totals, counts]).groupby(level=[0, 1]).sum()
+        )
+
+    if totals is None:
+        return pd.DataFrame(columns=["stay_date"])
+
+    new_dataset = totals.reset_index(name="room_count").pivot(
+        index="stay_date", columns="room_category_id", values="room_count"
+    )
+    new_dataset = new_dataset.fillna(0)
+    new_dataset.columns = [f"room_type_{col}" for col in new_dataset.columns]
+    new_dataset.reset_index(inplace=True)
+    return new_dataset
+
+
 def remove_anomalies_winsorization(column, lower_percentile=0, upper_percentile=0.95):
     lower_bound = column.quantile(lower_percentile)
     upper_bound = column.quantile(upper_percentile)
@@ -31,155 +126,199 @@ def remove_anomalies_winsorization(column, lower_percentile=0, upper_percentile=
 
 
 def one_hot_occupancy(ds, target_ds):
-    for index, row in ds.iterrows():
-        date = row[0]
-        row = row[1:]
-        for j in range(8):
-            mask = [0 for _ in range(8)]
-            new_row = mask
-            mask[j] = 1
-            for i in range(8):
-                new_row[i] = row[i] if mask[i] == 1 else 0
-            new_row.insert(0, date)
-            target_ds = pd.concat(
-                [target_ds, pd.DataFrame([new_row], columns=target_ds.columns)],
-                ignore_index=True,
-            )
-    return target_ds
+    """
+    Expands every date of the occupancy table into one row per room type.
+
+    Row j of a date keeps the count of the j-th room column and zeroes the
+    others. The expansion is done as a single repeat/mask over the count
+    matrix instead of appending rows one by one.
+    """
+    room_count = ds.shape[1] - 1
+    counts = ds.iloc[:, 1:].to_numpy()
+
+    expanded = np.repeat(counts, room_count, axis=0) * np.tile(
+        np.eye(room_count, dtype=counts.dtype), (len(ds), 1)
+    )
+    result = pd.DataFrame(expanded, columns=target_ds.columns[1:])
+    result.insert(
+        0, target_ds.columns[0], np.repeat(ds.iloc[:, 0].to_numpy(), room_count)
+    )
+
+    if target_ds.empty:
+        return result
+    return pd.concat([target_ds, result], ignore_index=True)
 
 
 def one_hot_occupancy_separated(ds):
-    for index, row in ds.iterrows():
-        date = row[0]
-        row_data = row[1:]
-        row_data = row_data[:-1]
-        res = -10
-        for i in range(len(row_data)):
-            if row_data[i] != 0:
-                res = row_data[i]
-                row_data[i] = 1
-        if res == -10:
-            row_data[index % 8] = 1
-            res = 0
-        row_data = [date] + list(row_data) + [res]
-        ds.loc[index] = row_data
+    """
+    Turns the expanded room counts into one-hot room flags plus `occupancy`.
+
+    The non-zero count of a row becomes its occupancy and its flag is set to 1.
+    Rows without any count get the flag of their position within the date
+    (`index % 8`) and an occupancy of 0.
+    """
+    room_columns = ds.columns[1:-1]
+    counts = ds[room_columns].to_numpy()
+    occupied = counts != 0
+
+    last_occupied = counts.shape[1] - 1 - occupied[:, ::-1].argmax(axis=1)
+    has_count = occupied.any(axis=1)
+    rows = np.arange(len(ds))
+
+    flags = occupied.astype(int)
+    flags[rows[~has_count], ds.index.to_numpy()[~has_count] % 8] = 1
+
+    ds[room_columns] = flags
+    ds[ds.columns[-1]] = np.where(has_count, counts[rows, last_occupied], 0)
     return ds
 
 
 def form_rank_days_of_week(week_day_dataset):
-    ranked_days = pd.DataFrame(week_day_dataset)
-    for column in ranked_days.columns:
-        ranked_days[column] = week_day_dataset[column].rank(method="min")
-    return ranked_days
+    return week_day_dataset.rank(method="min")
+
+
+def row_room_types(ds):
+    """Room type of every row, read from its one-hot room_type_* flags."""
+    return np.array(room_indices)[ds[room_column].to_numpy().argmax(axis=1)]
+
+
+def lookup_room_values(table, keys, room_types):
+    """
+    Reads `table.at[key, f"room_type_{room_type}"]` for every row at once.
+
+    `table` is indexed by day of week or month with one column per room type,
+    as produced by the groupby means and ranks in `form()`.
+    """
+    values = table[room_column].to_numpy()
+    rows = table.index.get_indexer(keys)
+    if (rows < 0).any():
+        missing = sorted(set(np.asarray(keys)[rows < 0]))
+        raise KeyError(f"No values for {missing}")
+    columns = pd.Index(room_indices).get_indexer(room_types)
+    return values[rows, columns]
 
 
 def day_week_avg_column(ds, day_avg_data):
-    for index, row in ds.iterrows():
-        day_of_week = ds.at[index, "day_of_week"][0]
-        week_avgs = [
-            day_avg_data.at[day_of_week, f"room_type_{j}"] for j in room_indices
-        ]
-        ds.at[index, "week_day_avg"] = week_avgs
+    ds["week_day_avg"] = lookup_room_values(
+        day_avg_data, ds["day_of_week"].to_numpy(), row_room_types(ds)
+    )
     return ds
 
 
 def month_avg_column(ds, month_avg_data):
-    for index, row in ds.iterrows():
-        month = index.month
-        monthly_avgs = [
-            month_avg_data.at[month, f"room_type_{j}"] for j in room_indices
-        ]
-        ds.at[index, "month_avg"] = monthly_avgs
+    ds["month_avg"] = lookup_room_values(
+        month_avg_data, ds.index.month, row_room_types(ds)
+    )
     return ds
 
 
 def week_day_importance(ds, ranked_days):
-    for index, row in ds.iterrows():
-        l = [row[i] for i in range(len(room_column))]
-        room_index = l.index(1)
-        room_type = room_dict[room_index]
-        day_of_week = ds.at[index, "day_of_week"][room_index]
-        week_day_importance_value = ranked_days.at[
-            day_of_week, f"room_type_{room_type}"
-        ]
-        ds.at[index, "week_day_importance"][room_index] = week_day_importance_value
+    ds["week_day_importance"] = lookup_room_values(
+        ranked_days, ds["day_of_week"].to_numpy(), row_room_types(ds)
+    )
     return ds
 
 
-def load_events(datasets):
+def room_events(ds, room_type, calendar):
+    """Counts the events of `room_type` on every date of its dataset."""
+    ds["event"] = calendar.counts(room_type, ds["stay_date_help"])
+    return ds
 
-    separated_events_file = open("events/separated_events.json")
 
-    separated_events = json.load(separated_events_file)
-    og_events = pd.read_json("events/events.json")
+def load_events(datasets, calendar=None, events_dir="events"):
+    calendar = calendar or EventCalendar.load(events_dir)
 
     for i in range(len(datasets)):
-
-        datasets[i]["event"] = 0
-        ds = datasets[i]
-        room_type = room_dict[i]
-
-        room_type_events = separated_events[str(room_type)]
-
-        for event_name in room_type_events:
-            dates = dict(og_events[og_events["name"] == event_name]["date"])
-            for values in dates.values():
-                for value in values:
-                    start_date = pd.to_datetime(value["start_date"])
-                    finish_date = pd.to_datetime(value["finish_date"])
-                    mask = (ds["stay_date_help"] >= start_date) & (
-                        ds["stay_date_help"] <= finish_date
-                    )
-                    ds.loc[mask, "event"] += 1
-        datasets[i] = ds
+        datasets[i] = room_events(datasets[i], room_dict[i], calendar)
 
     return datasets
 
 
-def form(dataset_path):
-
-    dataset = pd.read_parquet(dataset_path)
-
-    dataset.drop(
-        [
-            "guest_id",
-            "resort_id",
-            "price",
-            "price_tax",
-            "total_price",
-            "total_price_tax",
-            "food_price",
-            "food_price_tax",
-            "other_price",
-            "other_price_tax",
-            "sales_channel_id",
-        ],
-        axis="columns",
-        inplace=True,
-    )
-
-    dataset["reservation_status"] = dataset["reservation_status"].replace(
-        "No-show", "Cancelled"
-    )
-
-    dataset_without_cancelled = dataset[dataset["reservation_status"] != "Cancelled"]
-    dataset_without_cancelled = dataset_without_cancelled.drop(
-        ["cancel_date", "reservation_status", "guest_country_id"], axis="columns"
-    )
-
-    dataset_without_cancelled = dataset_without_cancelled.iloc[2:].reset_index(
-        drop=True
-    )
-
-    occupancy = form_room_occupancy(dataset_without_cancelled)
-
+def pool_context():
+    """
+    Start method of the per-room process pools.
+
+    Rebuilds run on a thread of the server, and forking a process with other
+    threads running can leave the child stuck on a lock one of them held. A
+    fork server is started once, as a fresh process that only imports this
+    module, and every worker is forked from it instead. Platforms without
+    one start each worker with spawn.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def run_per_room(fn, tasks, workers=1, report=None, stage=None, span=(0.0, 1.0)):
+    """
+    Calls `fn(*task)` for every task and returns the results in task order.
+
+    With `workers` > 1 the tasks run in a process pool; if the pool cannot be
+    started or breaks, all tasks are rerun sequentially.
+    """
+    report = report or (lambda stage, fraction=None: None)
+    start, end = span
+
+    def done(count):
+        report(stage, start + (end - start) * count / len(tasks))
+
+    if workers is not None and workers > 1 and len(tasks) > 1:
+        try:
+            with ProcessPoolExecutor(
+                max_workers=min(workers, len(tasks)),
+                mp_context=pool_context(),
+            ) as executor:
+                futures = [executor.submit(fn, *task) for task in tasks]
+                for count, _ in enumerate(as_completed(futures), start=1):
+                    done(count)
+                return [future.result() for future in futures]
+        except (OSError, BrokenProcessPool, PicklingError) as e:
+            print(f"Process pool unavailable, running sequentially: {e}")
+
+    results = []
+    for task in tasks:
+        results.append(fn(*task))
+        done(len(results))
+    return results
+
+
+def form_room_dataset(ds, room_type, calendar, compact=False):
+    """
+    Per-room part of the pipeline: lag features and event counts, optionally
+    converted to the compact dtypes.
+    """
+    ds = add_lag_features(ds)
+    ds = room_events(ds, room_type, calendar)
+    return compact_frame(ds) if compact else ds
+
+
+def scale_room_dataset(dataset, path, csv_path=None, compact=False):
+    """
+    Scales one room dataset, writes it to `path` as parquet and returns the
+    scaler. With `csv_path` a CSV copy is written as well. `compact` stores
+    the scaled columns as float32 instead of the float64 of the scaler.
+    """
+    dataset = dataset.copy()
+    scaler = RobustScaler()
+    scaled = scaler.fit_transform(dataset[columns_to_normalize])
+    dataset[columns_to_normalize] = scaled.astype(np.float32) if compact else scaled
+
+    dataset.to_parquet(path)
+    if csv_path is not None:
+        dataset.to_csv(csv_path)
+    return scaler
+
+
+def form_room_features(occupancy, occupancy_by_day_of_week, occupancy_by_month):
+    """
+    Expands the occupancy table into one row per (date, room type) and adds
+    the calendar features shared by every room type.
+    """
     dataset = pd.DataFrame(columns=occupancy.columns)
     dataset = one_hot_occupancy(occupancy, dataset)
 
-    occupancy.set_index("stay_date", inplace=True)
-    occupancy_by_day_of_week = occupancy.groupby(occupancy.index.dayofweek).mean()
-    occupancy_by_month = occupancy.groupby(occupancy.index.month).mean()
-
     dataset["occupancy"] = 0
     dataset = one_hot_occupancy_separated(dataset)
 
@@ -196,208 +335,204 @@ def form(dataset_path):
     dataset = day_week_avg_column(dataset, occupancy_by_day_of_week)
     dataset = month_avg_column(dataset, occupancy_by_month)
     dataset = week_day_importance(dataset, ranked_days_mask)
+    return dataset
 
-    dataset_1 = dataset[dataset["room_type_1"] == 1]
-    dataset_2 = dataset[dataset["room_type_2"] == 1]
-    dataset_3 = dataset[dataset["room_type_3"] == 1]
-    dataset_4 = dataset[dataset["room_type_4"] == 1]
-    dataset_5 = dataset[dataset["room_type_5"] == 1]
-    dataset_6 = dataset[dataset["room_type_6"] == 1]
-    dataset_7 = dataset[dataset["room_type_7"] == 1]
-    dataset_11 = dataset[dataset["room_type_11"] == 1]
-
-    dataset_1.drop(
-        columns=[
-            "room_type_1",
-            "room_type_2",
-            "room_type_3",
-            "room_type_4",
-            "room_type_5",
-            "room_type_6",
-            "room_type_7",
-            "room_type_11",
-        ],
-        inplace=True,
-    )
 
-    dataset_2.drop(
-        columns=[
-            "room_type_1",
-            "room_type_2",
-            "room_type_3",
-            "room_type_4",
-            "room_type_5",
-            "room_type_6",
-            "room_type_7",
-            "room_type_11",
-        ],
-        inplace=True,
-    )
+def split_room_datasets(dataset):
+    """One dataset per room type, in `room_dict` order, without the room flags."""
+    return [
+        dataset[dataset[column] == 1].drop(columns=room_column)
+        for column in room_column
+    ]
 
-    dataset_3.drop(
-        columns=[
-            "room_type_1",
-            "room_type_2",
-            "room_type_3",
-            "room_type_4",
-            "room_type_5",
-            "room_type_6",
-            "room_type_7",
-            "room_type_11",
-        ],
-        inplace=True,
-    )
 
-    dataset_4.drop(
-        columns=[
-            "room_type_1",
-            "room_type_2",
-            "room_type_3",
-            "room_type_4",
-            "room_type_5",
-            "room_type_6",
-            "room_type_7",
-            "room_type_11",
-        ],
-        inplace=True,
-    )
+def add_lag_features(ds):
+    """Adds the occupancy lags, 7-day window statistics and future targets."""
+    for j in range(7):
+        ds[f"occupancy_lag_{j+1}"] = ds["occupancy"].shift(j + 1)
 
-    dataset_5.drop(
-        columns=[
-            "room_type_1",
-            "room_type_2",
-            "room_type_3",
-            "room_type_4",
-            "room_type_5",
-            "room_type_6",
-            "room_type_7",
-            "room_type_11",
-        ],
-        inplace=True,
-    )
+    ds["mean_last_7"] = ds["occupancy"].shift(1).rolling(7).mean()
+    ds["max_last_7"] = ds["occupancy"].shift(1).rolling(7).max()
+    ds["min_last_7"] = ds["occupancy"].shift(1).rolling(7).min()
 
-    dataset_6.drop(
-        columns=[
-            "room_type_1",
-            "room_type_2",
-            "room_type_3",
-            "room_type_4",
-            "room_type_5",
-            "room_type_6",
-            "room_type_7",
-            "room_type_11",
-        ],
-        inplace=True,
-    )
+    min_since_day_one = ds["occupancy"].expanding().min()
+    ds["min_last_7"] = ds["min_last_7"].fillna(min_since_day_one)
+
+    max_since_day_one = ds["occupancy"].expanding().max()
+    ds["max_last_7"] = ds["max_last_7"].fillna(max_since_day_one)
+
+    mean_since_day_one = ds["occupancy"].expanding().mean()
+    ds["mean_last_7"] = ds["mean_last_7"].fillna(mean_since_day_one)
+
+    for j in range(7):
+        ds[f"occupancy_lag_{j+1}"] = ds[f"occupancy_lag_{j+1}"].fillna(
+            ds[f"occupancy_lag_{j+1}"].shift(-7)
+        )
 
-    dataset_7.drop(
-        columns=[
-            "room_type_1",
-            "room_type_2",
-            "room_type_3",
-            "room_type_4",
-            "room_type_5",
-            "room_type_6",
-            "room_type_7",
-            "room_type_11",
-        ],
-        inplace=True,
+    for j in range(1, 7):
+        ds[f"occupancy_{j}"] = ds["occupancy"].shift(-j)
+
+    for j in range(1, 7):
+        ds[f"occupancy_{j}"] = ds[f"occupancy_{j}"].fillna(
+            ds[f"occupancy_{j}"].shift(7)
+        )
+
+    return ds
+
+
+columns_to_normalize = [
+    "week_day_avg",
+    "month_avg",
+    "week_day_importance",
+    "mean_last_7",
+    "max_last_7",
+    "min_last_7",
+    "event",
+    "occupancy_lag_1",
+    "occupancy_lag_2",
+    "occupancy_lag_3",
+    "occupancy_lag_4",
+    "occupancy_lag_5",
+    "occupancy_lag_6",
+    "occupancy_lag_7",
+]
+
+
+def write_room_datasets(
+    datasets,
+    report=None,
+    workers=1,
+    export_csv=False,
+    compact=False,
+    datasets_dir="datasets",
+):
+    """
+    Scales the per-room datasets, writes them as parquet to a new version
+    folder under `datasets_dir`/versions/ and publishes that version. `export_csv`
+    also writes a CSV copy of each dataset, and `compact` writes the scaled
+    columns as float32. Returns the fitted scalers in `room_dict` order;
+    their parameters are published with the manifest.
+
+    Predictions keep reading the previous version until the manifest is
+    swapped, so they never see a partly written dataset.
+    """
+    version = new_version()
+    directory = version_directory(datasets_dir, version)
+    os.makedirs(directory)
+    try:
+        scalers = run_per_room(
+            scale_room_dataset,
+            [
+                (
+                    dataset,
+                    os.path.join(directory, dataset_file_name(room_dict[i])),
+                    (
+                        os.path.join(directory, dataset_file_name(room_dict[i], "csv"))
+                        if export_csv
+                        else None
+                    ),
+                    compact,
+                )
+                for i, dataset in enumerate(datasets)
+            ],
+            workers,
+            report,
+            "writing",
+            (0.8, 1.0),
+        )
+    except Exception:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+
+    publish_manifest(
+        datasets_dir,
+        export_csv,
+        {
+            room_dict[i]: {
+                "columns": columns_to_normalize,
+                "center": scaler.center_.tolist(),
+                "scale": scaler.scale_.tolist(),
+            }
+            for i, scaler in enumerate(scalers)
+        },
+        version,
     )
 
-    dataset_11.drop(
-        columns=[
-            "room_type_1",
-            "room_type_2",
-            "room_type_3",
-            "room_type_4",
-            "room_type_5",
-            "room_type_6",
-            "room_type_7",
-            "room_type_11",
-        ],
-        inplace=True,
+    return scalers
+
+
+def form_room_datasets(
+    occupancy, report=None, workers=1, compact=False, events_dir="events"
+):
+    """
+    Runs the feature pipeline on an occupancy table from `form_room_occupancy`,
+    with the events read from `events_dir`.
+
+    The per-room stages run on up to `workers` processes. Returns the unscaled
+    per-room datasets in `room_dict` order, with the dtypes of
+    `compact_frame` if `compact` is set.
+    """
+    report = report or (lambda stage, fraction=None: None)
+
+    daily_occupancy = occupancy.set_index("stay_date")
+    occupancy_by_day_of_week = daily_occupancy.groupby(
+        daily_occupancy.index.dayofweek
+    ).mean()
+    occupancy_by_month = daily_occupancy.groupby(daily_occupancy.index.month).mean()
+
+    report("features", 0.2)
+    dataset = form_room_features(
+        occupancy, occupancy_by_day_of_week, occupancy_by_month
     )
 
-    datasets = [
-        dataset_1,
-        dataset_2,
-        dataset_3,
-        dataset_4,
-        dataset_5,
-        dataset_6,
-        dataset_7,
-        dataset_11,
-    ]
+    report("room_datasets", 0.4)
+    datasets = split_room_datasets(dataset)
+
+    calendar = EventCalendar.load(events_dir)
+    return run_per_room(
+        form_room_dataset,
+        [(ds, room_dict[i], calendar, compact) for i, ds in enumerate(datasets)],
+        workers,
+        report,
+        "room_features",
+        (0.5, 0.8),
+    )
 
-    i = 0
-
-    for ds in datasets:
-
-        for j in range(7):
-            ds[f"occupancy_lag_{j+1}"] = ds["occupancy"].shift(j + 1)
-
-        ds["mean_last_7"] = ds["occupancy"].shift(1).rolling(7).mean()
-        ds["max_last_7"] = ds["occupancy"].shift(1).rolling(7).max()
-        ds["min_last_7"] = ds["occupancy"].shift(1).rolling(7).min()
-
-        min_since_day_one = ds["occupancy"].expanding().min()
-        ds["min_last_7"] = ds["min_last_7"].fillna(min_since_day_one)
-
-        max_since_day_one = ds["occupancy"].expanding().max()
-        ds["max_last_7"] = ds["max_last_7"].fillna(max_since_day_one)
-
-        mean_since_day_one = ds["occupancy"].expanding().mean()
-        ds["mean_last_7"] = ds["mean_last_7"].fillna(mean_since_day_one)
-
-        for j in range(7):
-            ds[f"occupancy_lag_{j+1}"] = ds[f"occupancy_lag_{j+1}"].fillna(
-                ds[f"occupancy_lag_{j+1}"].shift(-7)
-            )
-
-        ds["occupancy_1"] = ds["occupancy"].shift(-1)
-        ds["occupancy_2"] = ds["occupancy"].shift(-2)
-        ds["occupancy_3"] = ds["occupancy"].shift(-3)
-        ds["occupancy_4"] = ds["occupancy"].shift(-4)
-        ds["occupancy_5"] = ds["occupancy"].shift(-5)
-        ds["occupancy_6"] = ds["occupancy"].shift(-6)
-
-        ds["occupancy_1"] = ds["occupancy_1"].fillna(ds["occupancy_1"].shift(7))
-        ds["occupancy_2"] = ds["occupancy_2"].fillna(ds["occupancy_2"].shift(7))
-        ds["occupancy_3"] = ds["occupancy_3"].fillna(ds["occupancy_3"].shift(7))
-        ds["occupancy_4"] = ds["occupancy_4"].fillna(ds["occupancy_4"].shift(7))
-        ds["occupancy_5"] = ds["occupancy_5"].fillna(ds["occupancy_5"].shift(7))
-        ds["occupancy_6"] = ds["occupancy_6"].fillna(ds["occupancy_6"].shift(7))
-
-        datasets[i] = ds
-
-        i += 1
-
-    datasets = load_events(datasets)
-
-    columns_to_normalize = [
-        "week_day_avg",
-        "month_avg",
-        "week_day_importance",
-        "mean_last_7",
-        "max_last_7",
-        "min_last_7",
-        "event",
-        "occupancy_lag_1",
-        "occupancy_lag_2",
-        "occupancy_lag_3",
-        "occupancy_lag_4",
-        "occupancy_lag_5",
-        "occupancy_lag_6",
-        "occupancy_lag_7",
-    ]
 
-    for i, dataset in enumerate(datasets):
+def form(
+    dataset_path,
+    progress=None,
+    workers=1,
+    export_csv=False,
+    compact=False,
+    datasets_dir="datasets",
+    events_dir="events",
+):
+    """
+    Builds the per-room datasets used for prediction from a reservation file,
+    or from a list of files read one after another as if concatenated.
+
+    `progress`, if given, is called as progress(stage, fraction) whenever the
+    pipeline enters a new stage, so background jobs can report on the rebuild.
+    `workers` > 1 fans the per-room stages out over a process pool, and
+    `export_csv` writes a CSV copy next to each parquet dataset. `compact`
+    keeps and writes the datasets with the compact dtypes (int8/int16 ids and
+    counts, float32 features, int32 day numbers for dates). The events are
+    read from `events_dir` and the datasets published to `datasets_dir`.
+    """
+    report = StageTimer(FORM_STAGE_SECONDS, progress, pipeline="full")
+    paths = [dataset_path] if isinstance(dataset_path, str) else list(dataset_path)
+
+    report("reading", 0.0)
+    occupancy = stream_room_occupancy(
+        paths,
+        skip_rows=2,
+        report=lambda fraction: report("reading", 0.2 * fraction),
+    )
 
-        scaler = RobustScaler()
-        dataset[columns_to_normalize] = scaler.fit_transform(
-            dataset[columns_to_normalize]
-        )
+    datasets = form_room_datasets(occupancy, report, workers, compact, events_dir)
 
-        dataset.to_csv(f"datasets/dataset_room_type_{room_dict[i]}.csv")
+    write_room_datasets(datasets, report, workers, export_csv, compact, datasets_dir)
+    report.finish()
 
-    return
+    return datasets
@@ -0,0 +1,225 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from app.enums.room_indices_dict import room_dict, room_column
+from app.form_datasets import (
+    add_lag_features,
+    form_room_datasets,
+    load_events,
+    lookup_room_values,
+    stream_room_occupancy,
+    write_room_datasets,
+)
+from app.utils.compact import compact_frame
+from app.utils.metrics import FORM_STAGE_SECONDS, StageTimer
+
+# Folder of the saved pipeline state, inside the datasets folder
+STATE_DIR = os.path.join("datasets", "state")
+
+# Rows before the first changed date that are recomputed as context for the
+# lag, rolling window and future target columns.
+CONTEXT_ROWS = 14
+
+
+def _source_stamp(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def daily_room_occupancy(occupancy):
+    """
+    Daily occupancy per room type, indexed by stay date, with every room
+    column, from a `stream_room_occupancy` table.
+    """
+    occupancy = occupancy.set_index("stay_date")
+    return occupancy.reindex(columns=room_column, fill_value=0).astype(float)
+
+
+class FeatureState:
+    """
+    Pipeline state of the training data that uploads are applied on top of.
+
+    Holds the daily occupancy, the day-of-week and month sums and date counts
+    behind the average columns, and the unscaled per-room datasets.
+    """
+
+    def __init__(self, occupancy, room_datasets, source, stamp):
+        self.occupancy = occupancy
+        self.room_datasets = room_datasets
+        self.source = source
+        self.stamp = stamp
+
+        self.day_of_week_sum = occupancy.groupby(occupancy.index.dayofweek).sum()
+        self.day_of_week_count = occupancy.index.dayofweek.value_counts()
+        self.month_sum = occupancy.groupby(occupancy.index.month).sum()
+        self.month_count = occupancy.index.month.value_counts()
+
+    def save(self, state_dir=STATE_DIR):
+        os.makedirs(state_dir, exist_ok=True)
+        self.occupancy.to_parquet(os.path.join(state_dir, "occupancy.parquet"))
+        for i, dataset in enumerate(self.room_datasets):
+            dataset.to_parquet(
+                os.path.join(state_dir, f"room_type_{room_dict[i]}.parquet")
+            )
+        with open(os.path.join(state_dir, "state.json"), "w") as file:
+            json.dump({"source": self.source, "stamp": self.stamp}, file)
+
+    @classmethod
+    def load(cls, state_dir=STATE_DIR):
+        try:
+            with open(os.path.join(state_dir, "state.json")) as file:
+                meta = json.load(file)
+            occupancy = pd.read_parquet(os.path.join(state_dir, "occupancy.parquet"))
+            room_datasets = [
+                pd.read_parquet(
+                    os.path.join(state_dir, f"room_type_{room_dict[i]}.parquet")
+                )
+                for i in range(len(room_dict))
+            ]
+        except (OSError, ValueError):
+            return None
+        return cls(occupancy, room_datasets, meta["source"], meta["stamp"])
+
+    @classmethod
+    def build(cls, train_path, events_dir="events"):
+        """Runs the full pipeline on the training data, the same way `form()` does."""
+        occupancy = stream_room_occupancy([train_path], skip_rows=2)
+        room_datasets = form_room_datasets(occupancy, events_dir=events_dir)
+        return cls(
+            daily_room_occupancy(occupancy),
+            room_datasets,
+            train_path,
+            _source_stamp(train_path),
+        )
+
+
+def load_feature_state(train_path, state_dir=STATE_DIR, events_dir="events"):
+    """Loads the saved state, rebuilding it if the training data changed."""
+    state = FeatureState.load(state_dir)
+    if (
+        state is None
+        or state.source != train_path
+        or state.stamp != _source_stamp(train_path)
+    ):
+        state = FeatureState.build(train_path, events_dir)
+        state.save(state_dir)
+    return state
+
+
+def _window_dataset(occupancy, room_type):
+    column = f"room_type_{room_type}"
+    dataset = pd.DataFrame(
+        {
+            "occupancy": occupancy[column].to_numpy(),
+            "stay_date_help": occupancy.index,
+        },
+        index=occupancy.index.rename("stay_date"),
+    )
+    dataset["day_of_week"] = dataset.index.dayofweek
+    dataset["week_day_avg"] = 0
+    dataset["month_avg"] = 0
+    dataset["week_day_importance"] = 0
+    return add_lag_features(dataset)
+
+
+def form_incremental(
+    upload_path,
+    train_path="parquet_files/train.parquet",
+    state_dir=None,
+    progress=None,
+    workers=1,
+    export_csv=False,
+    compact=False,
+    datasets_dir="datasets",
+    events_dir="events",
+):
+    """
+    Builds the per-room datasets for the training data plus an uploaded file
+    without rerunning the pipeline over the whole history.
+
+    Only the upload is read and aggregated. Lags, 7-day windows, future
+    targets and events are recomputed for the changed dates plus a short
+    context window; earlier rows are reused from the saved state. The average
+    and rank columns are remapped from the updated sums, and the scalers are
+    refit, since both depend on every row. The output matches
+    `form()` on the concatenated files. The state is kept in `state_dir`,
+    by default the state/ folder of `datasets_dir`.
+    """
+    report = StageTimer(FORM_STAGE_SECONDS, progress, pipeline="incremental")
+    state_dir = state_dir or os.path.join(datasets_dir, "state")
+
+    report("state", 0.0)
+    state = load_feature_state(train_path, state_dir, events_dir)
+
+    report("reading", 0.2)
+    added = daily_room_occupancy(stream_room_occupancy([upload_path]))
+    if added.empty:
+        datasets = state.room_datasets
+        if compact:
+            datasets = [compact_frame(dataset) for dataset in datasets]
+        write_room_datasets(
+            datasets, report, workers, export_csv, compact, datasets_dir
+        )
+        report.finish()
+        return datasets
+
+    report("occupancy", 0.3)
+    new_dates = added.index.difference(state.occupancy.index)
+    occupancy = state.occupancy.add(added, fill_value=0)
+
+    day_of_week_avg = (
+        state.day_of_week_sum.add(
+            added.groupby(added.index.dayofweek).sum(), fill_value=0
+        )
+    ).div(
+        state.day_of_week_count.add(new_dates.dayofweek.value_counts(), fill_value=0),
+        axis=0,
+    )
+    month_avg = (
+        state.month_sum.add(added.groupby(added.index.month).sum(), fill_value=0)
+    ).div(state.month_count.add(new_dates.month.value_counts(), fill_value=0), axis=0)
+    ranked_days = day_of_week_avg.rank(method="min")
+
+    first_changed = occupancy.index.get_loc(added.index.min())
+    window_start = max(first_changed - CONTEXT_ROWS, 0)
+    keep_from = 0 if window_start == 0 else first_changed - 6
+    window_occupancy = occupancy.iloc[window_start:]
+
+    report("lags", 0.4)
+    windows = [
+        _window_dataset(window_occupancy, room_type) for room_type in room_dict.values()
+    ]
+
+    report("events", 0.6)
+    windows = load_events(windows, events_dir=events_dir)
+
+    datasets = []
+    for i, room_type in room_dict.items():
+        previous = state.room_datasets[i]
+        window = windows[i][previous.columns]
+        dataset = pd.concat(
+            [
+                previous.iloc[:keep_from],
+                window.iloc[keep_from - window_start :],
+            ]
+        )
+
+        room_types = np.full(len(dataset), room_type)
+        day_of_week = dataset["day_of_week"].to_numpy()
+        dataset["week_day_avg"] = lookup_room_values(
+            day_of_week_avg, day_of_week, room_types
+        )
+        dataset["month_avg"] = lookup_room_values(
+            month_avg, dataset.index.month, room_types
+        )
+        dataset["week_day_importance"] = lookup_room_values(
+            ranked_days, day_of_week, room_types
+        )
+        datasets.append(compact_frame(dataset) if compact else dataset)
+
+    write_room_datasets(datasets, report, workers, export_csv, compact, datasets_dir)
+    report.finish()
+    return datasets
@@ -1,5 +1,12 @@
 import os
-from .endpoints import prediction_endpoints, file_endpoints
+from flask import jsonify
+from app.utils.executor import InferenceTimeout, QueueFull
+from .endpoints import (
+    prediction_endpoints,
+    file_endpoints,
+    health_endpoints,
+    metrics_endpoints,
+)
 
 
 def init_app(app):
@@ -11,3 +18,19 @@ def init_app(app):
         file_endpoints.file_blueprint,
         url_prefix="/file",
     )
+    app.register_blueprint(
+        health_endpoints.health_blueprint,
+        url_prefix="/health",
+    )
+    app.register_blueprint(
+        metrics_endpoints.metrics_blueprint,
+        url_prefix="/metrics",
+    )
+
+    @app.errorhandler(QueueFull)
+    def queue_full(error):
+        return jsonify({"error": str(error)}), 429, {"Retry-After": "1"}
+
+    @app.errorhandler(InferenceTimeout)
+    def inference_timeout(error):
+        return jsonify({"error": str(error)}), 504
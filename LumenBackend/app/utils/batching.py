@@ -0,0 +1,147 @@
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.utils.compiled_models import model_input
+from app.utils.metrics import MODEL_PREDICT_ROWS, MODEL_PREDICT_SECONDS
+
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+
+
+class _Batch:
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+        self.rows: List[np.ndarray] = []
+        self.futures: List[Future] = []
+
+
+class PredictionBatcher:
+    """
+    Coalesces single-row predictions that target the same lag model.
+
+    Rows submitted for the same (room type, lag, alpha) are collected for up
+    to `max_wait_ms` milliseconds, or until `max_batch_size` rows are pending,
+    and then predicted with one `model.predict(X, alpha=...)` call on a
+    dispatcher thread. Every caller receives a future resolving to its own
+    `(prediction, intervals)` slice of the batch result. `alpha` may be a
+    tuple, to compute several intervals in the same call.
+
+    Parameters:
+    - model_registry (ModelRegistry): Source of the per-room lag models.
+    - max_wait_ms (float): How long the first row of a batch waits for company.
+    - max_batch_size (int): Batch size that triggers an immediate flush.
+    """
+
+    def __init__(
+        self, model_registry, max_wait_ms: float = 5.0, max_batch_size: int = 64
+    ):
+        self.model_registry = model_registry
+        self.max_wait_ms = max_wait_ms
+        self.max_batch_size = max_batch_size
+        self._pending: Dict[Tuple, _Batch] = {}
+        self._ready: List[Tuple[Tuple, _Batch]] = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._batches = 0
+        self._rows = 0
+        self._max_batch = 0
+        self._buckets = [0 for _ in BATCH_SIZE_BUCKETS] + [0]
+
+    def submit(self, room_type: int, lag: int, row: np.ndarray, alpha=0.6) -> Future:
+        """Queue one feature row and return a future for its prediction."""
+        future = Future()
+        key = (room_type, lag, alpha)
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._dispatch, name="prediction-batcher", daemon=True
+                )
+                self._thread.start()
+            batch = self._pending.get(key)
+            if batch is None:
+                batch = self._pending[key] = _Batch(
+                    time.monotonic() + self.max_wait_ms / 1000
+                )
+            batch.rows.append(row)
+            batch.futures.append(future)
+            if len(batch.rows) >= self.max_batch_size:
+                self._ready.append((key, self._pending.pop(key)))
+            self._cond.notify()
+        return future
+
+    def stats(self) -> dict:
+        with self._cond:
+            buckets = {
+                f"<={bound}": count
+                for bound, count in zip(BATCH_SIZE_BUCKETS, self._buckets)
+            }
+            buckets[f">{BATCH_SIZE_BUCKETS[-1]}"] = self._buckets[-1]
+            return {
+                "max_wait_ms": self.max_wait_ms,
+                "max_batch_size": self.max_batch_size,
+                "batches": self._batches,
+                "rows": self._rows,
+                "mean_batch_size": self._rows / self._batches if self._batches else 0,
+                "max_observed_batch_size": self._max_batch,
+                "pending_batches": len(self._pending) + len(self._ready),
+                "batch_size_histogram": buckets,
+            }
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    due = [
+                        key
+                        for key, batch in self._pending.items()
+                        if batch.deadline <= now
+                    ]
+                    if due or self._ready:
+                        batches = self._ready + [
+                            (key, self._pending.pop(key)) for key in due
+                        ]
+                        self._ready = []
+                        break
+                    timeout = (
+                        min(batch.deadline for batch in self._pending.values()) - now
+                        if self._pending
+                        else None
+                    )
+                    self._cond.wait(timeout)
+
+            for key, batch in batches:
+                self._run(key, batch)
+
+    def _run(self, key: Tuple, batch: _Batch):
+        room_type, lag, alpha = key
+        try:
+            model = self.model_registry.get(room_type, lag)
+            with MODEL_PREDICT_SECONDS.time(model="separated"):
+                m_pred, m_pis = model.predict(
+                    model_input(model, np.vstack(batch.rows)), alpha=alpha
+                )
+            MODEL_PREDICT_ROWS.inc(len(batch.rows), model="separated")
+        except Exception as e:
+            for future in batch.futures:
+                future.set_exception(e)
+            return
+
+        for i, future in enumerate(batch.futures):
+            future.set_result((m_pred[i : i + 1], m_pis[i : i + 1]))
+        self._record(len(batch.rows))
+
+    def _record(self, size: int):
+        with self._cond:
+            self._batches += 1
+            self._rows += size
+            self._max_batch = max(self._max_batch, size)
+            for i, bound in enumerate(BATCH_SIZE_BUCKETS):
+                if size <= bound:
+                    self._buckets[i] += 1
+                    break
+            else:
+                self._buckets[-1] += 1
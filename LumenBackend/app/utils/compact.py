@@ -0,0 +1,115 @@
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+
+DAY_NS = 86_400_000_000_000
+
+INT8_COLUMNS = {"day_of_week", "room_category_id"}
+INT16_COLUMNS = {"room_cnt", "room_count", "occupancy", "event"}
+
+
+def day_numbers(values) -> np.ndarray:
+    """Dates as int32 day numbers (days since 1970-01-01)."""
+    days = np.asarray(values, dtype="datetime64[ns]").astype("datetime64[D]")
+    return days.astype(np.int32)
+
+
+def compact_column(name: str, column: pd.Series) -> pd.Series:
+    """
+    Compact dtype of one column.
+
+    Room ids, day of week and one-hot room flags become int8, counts int16
+    (float32 if they hold NaN or fractions, a wider int if the values do not fit), other
+    floats float32, dates int32 day numbers and strings categoricals. Columns
+    that do not fit a rule keep their dtype.
+    """
+    kind = column.dtype.kind
+    if kind == "M":
+        return pd.Series(day_numbers(column), index=column.index, name=name)
+    if kind == "O":
+        return column.astype("category")
+    if kind not in "iufb":
+        return column
+
+    narrow = []
+    if name in INT8_COLUMNS or name.startswith("room_type_"):
+        narrow = [np.int8, np.int16]
+    elif name in INT16_COLUMNS:
+        narrow = [np.int16]
+
+    if narrow:
+        if column.isna().any() or (kind == "f" and (column % 1 != 0).any()):
+            return column.astype(np.float32)
+        for dtype in narrow:
+            limits = np.iinfo(dtype)
+            if limits.min <= column.min() and column.max() <= limits.max:
+                return column.astype(dtype)
+    if kind == "f":
+        return column.astype(np.float32)
+    if kind in "iu":
+        return pd.to_numeric(column, downcast="integer")
+    return column
+
+
+def compact_frame(frame: pd.DataFrame) -> pd.DataFrame:
+    """Copy of `frame` with every column in its compact dtype, index untouched."""
+    return pd.DataFrame(
+        {name: compact_column(name, column) for name, column in frame.items()},
+        index=frame.index,
+    )
+
+
+def frame_bytes(frames) -> int:
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    return int(sum(frame.memory_usage(index=True, deep=True).sum() for frame in frames))
+
+
+def memory_report(dataset_path: str = "parquet_files/dataset.parquet") -> dict:
+    """
+    Memory of the pipeline tables built from `dataset_path`, with the
+    standard and the compact dtypes.
+    """
+    from app.form_datasets import (
+        form_room_datasets,
+        form_room_features,
+        reservation_columns,
+        stream_room_occupancy,
+    )
+
+    reservations = pd.read_parquet(dataset_path)
+    occupancy = stream_room_occupancy([dataset_path], skip_rows=2)
+
+    daily_occupancy = occupancy.set_index("stay_date")
+    room_features = form_room_features(
+        occupancy,
+        daily_occupancy.groupby(daily_occupancy.index.dayofweek).mean(),
+        daily_occupancy.groupby(daily_occupancy.index.month).mean(),
+    )
+    room_datasets = form_room_datasets(occupancy)
+
+    tables = {
+        "reservations": [reservations],
+        "reservations (pipeline columns)": [reservations[reservation_columns]],
+        "occupancy": [occupancy],
+        "room features": [room_features],
+        "room datasets (8)": room_datasets,
+    }
+
+    report = {}
+    for name, frames in tables.items():
+        standard = frame_bytes(frames)
+        compact = frame_bytes([compact_frame(frame) for frame in frames])
+        report[name] = {
+            "standard_bytes": standard,
+            "compact_bytes": compact,
+            "ratio": round(compact / standard, 3),
+        }
+    return report
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "parquet_files/dataset.parquet"
+    print(json.dumps(memory_report(path), indent=2))
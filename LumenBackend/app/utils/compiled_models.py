@@ -0,0 +1,403 @@
+import json
+import os
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.utils.feature_store import features
+
+FORMAT_VERSION = 1
+
+
+class UnsupportedModel(ValueError):
+    """Raised when a model has no compiled counterpart."""
+
+
+def compiled_model_path(model_path: str) -> str:
+    return os.path.splitext(model_path)[0] + ".npz"
+
+
+def _source_stamp(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def conformity_score_count(model) -> Optional[int]:
+    """
+    Number of conformity scores the intervals of `model` are computed from,
+    None when it is not a conformal model.
+    """
+    if isinstance(model, CompiledMapie):
+        scores = model.conformity_scores
+    else:
+        scores = getattr(model, "conformity_scores_", None)
+    return None if scores is None else len(scores)
+
+
+def model_input(model, rows: np.ndarray):
+    """
+    Input of `model.predict` for a matrix of feature rows: the matrix itself
+    for compiled models, a DataFrame with the feature names otherwise.
+    """
+    if isinstance(model, CompiledMapie):
+        return rows
+    return pd.DataFrame(rows, columns=features)
+
+
+class CompiledLinear:
+    """A fitted linear model: `X @ coef + intercept`."""
+
+    kind = "linear"
+
+    def __init__(self, coef: np.ndarray, intercept: float):
+        self.coef = coef
+        self.intercept = intercept
+
+    @classmethod
+    def from_estimator(cls, estimator) -> "CompiledLinear":
+        coef = np.asarray(estimator.coef_, dtype=np.float64)
+        if coef.ndim != 1:
+            raise UnsupportedModel("Only single output linear models are supported")
+        return cls(coef, float(estimator.intercept_))
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return X @ self.coef + self.intercept
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"coef": self.coef, "intercept": np.array(self.intercept)}
+
+    @classmethod
+    def from_arrays(cls, arrays) -> "CompiledLinear":
+        return cls(arrays["coef"], float(arrays["intercept"]))
+
+
+class CompiledTrees:
+    """
+    Regression trees flattened into shared node arrays, predicting their mean
+    like a forest. Every tree is walked for every row at once, one level per
+    step, comparing float32 features against the thresholds like sklearn.
+    Leaves point back to themselves, so walking `depth` steps lands every row
+    on its leaf without checking which rows are done.
+    """
+
+    kind = "trees"
+
+    def __init__(self, roots, feature, threshold, left, right, value, depth):
+        self.roots = roots
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.depth = depth
+
+    @classmethod
+    def from_estimator(cls, estimator) -> "CompiledTrees":
+        trees = getattr(estimator, "estimators_", [estimator])
+        if getattr(estimator, "n_outputs_", 1) != 1:
+            raise UnsupportedModel("Only single output trees are supported")
+
+        roots, feature, threshold, left, right, value = [], [], [], [], [], []
+        offset = depth = 0
+        for tree in trees:
+            tree = tree.tree_
+            is_leaf = tree.children_left < 0
+            nodes = np.arange(tree.node_count) + offset
+            roots.append(offset)
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+            left.append(np.where(is_leaf, nodes, tree.children_left + offset))
+            right.append(np.where(is_leaf, nodes, tree.children_right + offset))
+            value.append(tree.value[:, 0, 0])
+            offset += tree.node_count
+            depth = max(depth, tree.max_depth)
+
+        return cls(
+            np.array(roots, dtype=np.int64),
+            np.concatenate(feature).astype(np.int64),
+            np.concatenate(threshold).astype(np.float64),
+            np.concatenate(left).astype(np.int64),
+            np.concatenate(right).astype(np.int64),
+            np.concatenate(value).astype(np.float64),
+            depth,
+        )
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        X = X.astype(np.float32)
+        rows = np.arange(len(X))
+        nodes = np.repeat(self.roots[:, np.newaxis], len(X), axis=1)
+        for _ in range(self.depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+        # Summed tree by tree in order and then divided, as sklearn does
+        values = self.value[nodes]
+        prediction = np.zeros(len(X))
+        for tree_values in values:
+            prediction += tree_values
+        prediction /= len(self.roots)
+        return prediction
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            "roots": self.roots,
+            "feature": self.feature,
+            "threshold": self.threshold,
+            "left": self.left,
+            "right": self.right,
+            "value": self.value,
+            "depth": np.array(self.depth),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays) -> "CompiledTrees":
+        return cls(
+            arrays["roots"],
+            arrays["feature"],
+            arrays["threshold"],
+            arrays["left"],
+            arrays["right"],
+            arrays["value"],
+            int(arrays["depth"]),
+        )
+
+
+ESTIMATORS = {cls.kind: cls for cls in (CompiledLinear, CompiledTrees)}
+
+
+def compile_estimator(estimator):
+    """Compiled counterpart of a fitted sklearn regressor."""
+    from sklearn.ensemble import ExtraTreesRegressor, RandomForestRegressor
+    from sklearn.linear_model._base import LinearModel
+    from sklearn.tree import BaseDecisionTree
+
+    if isinstance(estimator, LinearModel):
+        return CompiledLinear.from_estimator(estimator)
+    if isinstance(
+        estimator, (RandomForestRegressor, ExtraTreesRegressor, BaseDecisionTree)
+    ):
+        return CompiledTrees.from_estimator(estimator)
+    raise UnsupportedModel(f"{type(estimator).__name__} cannot be compiled")
+
+
+class CompiledMapie:
+    """
+    Array-backed copy of a fitted MapieRegressor with absolute conformity
+    scores, or of a plain regressor (without intervals).
+
+    `predict` has the signature and output of `MapieRegressor.predict`
+    without its input checks: `X` must be a float matrix of the training
+    columns, in order. With the "naive" and "base" methods the conformity
+    offset of every alpha is a quantile of the stored scores, computed once
+    per alpha; with "plus" and "minmax" the fold models' predictions are
+    combined with the scores per row, as MAPIE does.
+    """
+
+    def __init__(
+        self,
+        estimator,
+        method: Optional[str] = None,
+        fold_estimators=(),
+        fold_weights: Optional[np.ndarray] = None,
+        conformity_scores: Optional[np.ndarray] = None,
+    ):
+        self.estimator = estimator
+        self.method = method
+        self.fold_estimators = list(fold_estimators)
+        self.fold_weights = fold_weights
+        self.conformity_scores = conformity_scores
+        self._offsets: Dict[float, float] = {}
+        # Without missing scores np.quantile gives the same result as MAPIE's
+        # np.nanquantile, without its per-row loop
+        self._quantile = (
+            np.nanquantile
+            if conformity_scores is not None and np.isnan(conformity_scores).any()
+            else np.quantile
+        )
+
+    @classmethod
+    def from_model(cls, model) -> "CompiledMapie":
+        if type(model).__name__ != "MapieRegressor":
+            return cls(compile_estimator(model))
+
+        score = model.conformity_score_function_
+        if type(score).__name__ != "AbsoluteConformityScore" or not score.sym:
+            raise UnsupportedModel(
+                f"{type(score).__name__} conformity scores cannot be compiled"
+            )
+        if model.method not in ("naive", "base", "plus", "minmax"):
+            raise UnsupportedModel(f"MAPIE method {model.method} cannot be compiled")
+
+        ensemble = model.estimator_
+        method = model.method
+
+        # Split and prefit models have no fold models, MAPIE uses the
+        # prediction of the single model in their place
+        fold_estimators, fold_weights = [], None
+        if method in ("plus", "minmax") and not ensemble.use_split_method_:
+            if ensemble.agg_function not in ("mean", None):
+                raise UnsupportedModel(
+                    f"{ensemble.agg_function} aggregation cannot be compiled"
+                )
+            fold_estimators = [compile_estimator(e) for e in ensemble.estimators_]
+            k = np.nan_to_num(ensemble.k_, nan=0.0)
+            fold_weights = k / k.sum(axis=1, keepdims=True)
+
+        return cls(
+            compile_estimator(ensemble.single_estimator_),
+            method,
+            fold_estimators,
+            fold_weights,
+            np.asarray(model.conformity_scores_, dtype=np.float64),
+        )
+
+    def predict(self, X, alpha=None):
+        X = np.asarray(X, dtype=np.float64)
+        y_pred = self.estimator.predict(X)
+        if alpha is None:
+            return y_pred
+        if self.method is None:
+            raise ValueError("The model was fitted without prediction intervals")
+
+        alphas = np.atleast_1d(np.asarray(alpha, dtype=np.float64))
+        if self.method in ("naive", "base"):
+            offsets = np.array([[self._offset(a) for a in alphas]])
+            low = y_pred[:, np.newaxis] + -offsets
+            up = y_pred[:, np.newaxis] + offsets
+            return y_pred, np.stack([low, up], axis=1)
+
+        if self.fold_estimators:
+            y_pred_multi = np.matmul(
+                np.column_stack([e.predict(X) for e in self.fold_estimators]),
+                self.fold_weights.T,
+            )
+        else:
+            y_pred_multi = y_pred[:, np.newaxis]
+        if self.method == "minmax":
+            y_low = np.min(y_pred_multi, axis=1, keepdims=True)
+            y_up = np.max(y_pred_multi, axis=1, keepdims=True)
+            low = y_low + -np.array([[self._offset(a) for a in alphas]])
+            up = y_up + np.array([[self._offset(a) for a in alphas]])
+            return y_pred, np.stack([low, up], axis=1)
+
+        scores_low = y_pred_multi + -self.conformity_scores
+        scores_up = y_pred_multi + self.conformity_scores
+        low = np.column_stack(
+            [self._quantile(scores_low, a, axis=1, method="lower") for a in alphas]
+        )
+        up = np.column_stack(
+            [self._quantile(scores_up, 1 - a, axis=1, method="higher") for a in alphas]
+        )
+        return y_pred, np.stack([low, up], axis=1)
+
+    def _offset(self, alpha: float) -> float:
+        offset = self._offsets.get(alpha)
+        if offset is None:
+            offset = self._offsets[alpha] = self._quantile(
+                self.conformity_scores, 1 - alpha, method="higher"
+            )
+        return offset
+
+    def save(self, path: str, source_path: Optional[str] = None):
+        """
+        Writes the arrays to an .npz file, with the modification time and size
+        of `source_path` so a later load can tell it is out of date.
+        """
+        estimators = [self.estimator] + self.fold_estimators
+        arrays = {}
+        for i, estimator in enumerate(estimators):
+            for name, array in estimator.arrays().items():
+                arrays[f"estimator_{i}_{name}"] = array
+        if self.fold_weights is not None:
+            arrays["fold_weights"] = self.fold_weights
+        if self.conformity_scores is not None:
+            arrays["conformity_scores"] = self.conformity_scores
+
+        metadata = {
+            "format": FORMAT_VERSION,
+            "method": self.method,
+            "estimators": [estimator.kind for estimator in estimators],
+            "source_stamp": _source_stamp(source_path) if source_path else None,
+        }
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, metadata=np.array(json.dumps(metadata)), **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Tuple["CompiledMapie", dict]:
+        with np.load(path) as data:
+            metadata = json.loads(str(data["metadata"]))
+            if metadata["format"] != FORMAT_VERSION:
+                raise ValueError(f"Unknown compiled model format in {path}")
+
+            estimators = []
+            for i, kind in enumerate(metadata["estimators"]):
+                prefix = f"estimator_{i}_"
+                estimators.append(
+                    ESTIMATORS[kind].from_arrays(
+                        {
+                            name[len(prefix) :]: data[name]
+                            for name in data.files
+                            if name.startswith(prefix)
+                        }
+                    )
+                )
+            model = cls(
+                estimators[0],
+                metadata["method"],
+                estimators[1:],
+                data["fold_weights"] if "fold_weights" in data.files else None,
+                (
+                    data["conformity_scores"]
+                    if "conformity_scores" in data.files
+                    else None
+                ),
+            )
+        return model, metadata
+
+
+def load_compiled(model_path: str) -> Optional[CompiledMapie]:
+    """
+    The compiled copy of the model at `model_path`, or None if there is none
+    or it was compiled from a different version of the file.
+    """
+    path = compiled_model_path(model_path)
+    if not os.path.exists(path):
+        return None
+    model, metadata = CompiledMapie.load(path)
+    stamp = metadata["source_stamp"]
+    if stamp is None or tuple(stamp) != _source_stamp(model_path):
+        print(f"The compiled model at {path} is out of date, loading {model_path}")
+        return None
+    return model
+
+
+def compare_predictions(model, compiled, X, alphas) -> float:
+    """
+    Largest absolute difference between the predictions and intervals of a
+    model and its compiled copy on `X`, row by row and for all rows at once.
+    """
+    rows = np.asarray(X, dtype=np.float64)
+    frame = pd.DataFrame(rows, columns=getattr(model, "feature_names_in_", None))
+    is_mapie = compiled.method is not None
+    difference = 0.0
+    for batch in [slice(None)] + [slice(i, i + 1) for i in range(min(len(X), 20))]:
+        if not is_mapie:
+            expected = model.predict(frame[batch].to_numpy())
+            actual = compiled.predict(rows[batch])
+            difference = max(difference, np.max(np.abs(expected - actual)))
+            continue
+        expected_pred, expected_pis = model.predict(frame[batch], alpha=alphas)
+        actual_pred, actual_pis = compiled.predict(rows[batch], alpha=alphas)
+        if expected_pis.shape != actual_pis.shape:
+            return float("inf")
+        difference = max(
+            difference,
+            np.max(np.abs(expected_pred - actual_pred)),
+            np.max(np.abs(expected_pis - actual_pis)),
+        )
+    return float(difference)
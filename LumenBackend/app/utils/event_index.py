@@ -0,0 +1,155 @@
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+EVENTS_FILE = "events.json"
+SEPARATED_EVENTS_FILE = "separated_events.json"
+
+DAY_NS = 86_400_000_000_000
+
+
+def _day(date) -> int:
+    """Day number (days since the epoch) of a single date."""
+    return pd.Timestamp(date).value // DAY_NS
+
+
+def _days(dates) -> np.ndarray:
+    """Day numbers (days since the epoch) of a sequence of dates."""
+    values = np.asarray(dates)
+    if not np.issubdtype(values.dtype, np.datetime64):
+        values = pd.DatetimeIndex(pd.to_datetime(values)).values
+    return values.astype("datetime64[D]").astype(np.int64)
+
+
+class EventCalendar:
+    """
+    Day-by-day event counts compiled from the event files.
+
+    Every event interval is inclusive of its start and finish date. Counts are
+    kept as one int array per room type (plus one over all events) covering
+    the days between the first and last event, so the count for a date is a
+    single array read and a range of dates is one fancy-indexing call.
+
+    Parameters:
+    - events (list): Contents of events.json, events with their date intervals.
+    - separated_events (dict): Contents of separated_events.json, the event
+      names that apply to each room type.
+    """
+
+    def __init__(self, events: List[dict], separated_events: Dict[str, List[str]]):
+        intervals: Dict[str, List[Tuple[int, int]]] = {}
+        for event in events:
+            intervals.setdefault(event["name"], []).extend(
+                (_day(interval["start_date"]), _day(interval["finish_date"]))
+                for interval in event["date"]
+            )
+
+        bounds = [day for spans in intervals.values() for span in spans for day in span]
+        self.first_day = min(bounds, default=0)
+        self.last_day = max(bounds, default=-1)
+
+        self._all = self._compile(
+            span for spans in intervals.values() for span in spans
+        )
+        self._rooms = {
+            int(room_type): self._compile(
+                span for name in names for span in intervals.get(name, [])
+            )
+            for room_type, names in separated_events.items()
+        }
+
+    @classmethod
+    def load(cls, directory: str = "events") -> "EventCalendar":
+        with open(os.path.join(directory, EVENTS_FILE)) as file:
+            events = json.load(file)
+        with open(os.path.join(directory, SEPARATED_EVENTS_FILE)) as file:
+            separated_events = json.load(file)
+        return cls(events, separated_events)
+
+    def count(self, room_type: int, date) -> int:
+        """Number of events of `room_type` on `date`."""
+        table = self._rooms.get(room_type)
+        day = _day(date) - self.first_day
+        if table is None or not 0 <= day < len(table):
+            return 0
+        return int(table[day])
+
+    def counts(self, room_type: int, dates: Iterable) -> np.ndarray:
+        """Number of events of `room_type` on each of `dates`."""
+        return self._lookup(self._rooms.get(room_type), dates)
+
+    def any_event(self, dates: Iterable) -> np.ndarray:
+        """1 for every date with at least one event of any room type, else 0."""
+        return (self._lookup(self._all, dates) > 0).astype(int)
+
+    def _compile(self, spans: Iterable[Tuple[int, int]]) -> np.ndarray:
+        size = self.last_day - self.first_day + 1
+        changes = np.zeros(size + 1, dtype=np.int64)
+        for start, finish in spans:
+            if finish < start:
+                continue
+            changes[start - self.first_day] += 1
+            changes[finish - self.first_day + 1] -= 1
+        return np.cumsum(changes[:-1], dtype=np.int64)
+
+    def _lookup(self, table: Optional[np.ndarray], dates: Iterable) -> np.ndarray:
+        days = _days(dates) - self.first_day
+        result = np.zeros(len(days), dtype=np.int64)
+        if table is None or len(table) == 0:
+            return result
+        inside = (days >= 0) & (days < len(table))
+        result[inside] = table[days[inside]]
+        return result
+
+
+class EventIndex:
+    """
+    Holds the compiled `EventCalendar` of an events folder.
+
+    `calendar()` recompiles the calendar when either event file changed since
+    it was last built, so edits to the files are picked up without a restart.
+    `version` counts the rebuilds and `stamp` holds the modification times
+    and sizes of the files the calendar was built from.
+
+    Parameters:
+    - directory (str): Folder holding events.json and separated_events.json.
+    """
+
+    def __init__(self, directory: str = "events"):
+        self.directory = directory
+        self.version = 0
+        self._calendar: Optional[EventCalendar] = None
+        self._stamp: Optional[Tuple] = None
+        self._lock = threading.Lock()
+
+    @property
+    def stamp(self) -> Optional[Tuple]:
+        return self._stamp
+
+    def calendar(self) -> EventCalendar:
+        stamp = self._file_stamp()
+        if stamp != self._stamp or self._calendar is None:
+            with self._lock:
+                if stamp != self._stamp or self._calendar is None:
+                    self._calendar = EventCalendar.load(self.directory)
+                    self._stamp = stamp
+                    self.version += 1
+        return self._calendar
+
+    def after_fork(self):
+        """Recreate the lock in a forked worker, keeping the loaded calendar."""
+        self._lock = threading.Lock()
+
+    def _file_stamp(self) -> Tuple:
+        stamps = []
+        for file_name in (EVENTS_FILE, SEPARATED_EVENTS_FILE):
+            try:
+                stat = os.stat(os.path.join(self.directory, file_name))
+                stamps.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stamps.append(None)
+        return tuple(stamps)
@@ -0,0 +1,108 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Callable, Optional
+
+from flask import current_app
+
+from app.utils.metrics import INFERENCE_REJECTED
+
+
+class QueueFull(Exception):
+    """Raised when a bounded queue has no room for another task."""
+
+
+class InferenceTimeout(Exception):
+    """Raised when a task did not finish within the request timeout."""
+
+
+class BoundedExecutor:
+    """
+    Thread pool that accepts at most `max_workers + max_queue` tasks at a
+    time and rejects the rest with `QueueFull`, instead of letting work pile
+    up behind a saturated CPU.
+
+    Request threads hand their model calls to this pool and only wait for the
+    result, so the number of requests computing at once is bounded and cheap
+    endpoints keep getting request threads and CPU time.
+
+    Parameters:
+    - max_workers (int): Tasks computed at the same time.
+    - max_queue (int): Tasks allowed to wait for a free worker.
+    - timeout (float, optional): Seconds `run` waits for a result, None for no limit.
+    """
+
+    def __init__(
+        self, max_workers: int = 2, max_queue: int = 8, timeout: Optional[float] = 30
+    ):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout or None
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="inference"
+        )
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+        self._timed_out = 0
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Queue `fn(*args)`, raising `QueueFull` if every slot is taken."""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            INFERENCE_REJECTED.inc(reason="queue_full")
+            raise QueueFull(
+                f"{self.max_workers + self.max_queue} predictions are already queued"
+            )
+        with self._lock:
+            self._in_flight += 1
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def run(self, fn: Callable, *args):
+        """
+        Run `fn(*args)` on the pool inside the current app context and wait
+        for its result, up to `timeout` seconds.
+        """
+        app = current_app._get_current_object()
+
+        def call():
+            with app.app_context():
+                return fn(*args)
+
+        future = self.submit(call)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # A task that has not started yet is dropped; a running one
+            # finishes in the background and its result is discarded
+            future.cancel()
+            with self._lock:
+                self._timed_out += 1
+            INFERENCE_REJECTED.inc(reason="timeout")
+            raise InferenceTimeout(
+                f"The prediction did not finish within {self.timeout:g} seconds"
+            ) from None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "timeout": self.timeout,
+                "in_flight": self._in_flight,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+            }
+
+    def _release(self, future):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
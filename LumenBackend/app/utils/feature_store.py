@@ -0,0 +1,377 @@
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.enums.room_indices_dict import room_indices
+from app.utils.metrics import DATASET_LOAD_SECONDS
+
+MANIFEST_NAME = "manifest.json"
+
+# Every rebuild is written to versions/{version}/ next to the manifest
+VERSIONS_DIR = "versions"
+# Published versions kept on disk, the current one included
+KEPT_VERSIONS = 2
+
+features = [
+    "day_of_week",
+    "week_day_avg",
+    "month_avg",
+    "week_day_importance",
+    "event",
+    "occupancy_lag_1",
+    "occupancy_lag_2",
+    "occupancy_lag_3",
+    "occupancy_lag_4",
+    "occupancy_lag_5",
+    "occupancy_lag_6",
+    "occupancy_lag_7",
+    "mean_last_7",
+]
+
+
+def dataset_file_name(room_type: int, extension: str = "parquet") -> str:
+    return f"dataset_room_type_{room_type}.{extension}"
+
+
+def read_dataset(path: str, columns=None) -> pd.DataFrame:
+    """
+    Reads a per-room dataset indexed by stay date.
+
+    Parquet files keep the column types and are read column by column, so
+    passing `columns` skips everything else; CSV files are the export written
+    for people and are parsed whole.
+    """
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path, columns=columns)
+    frame = pd.read_csv(path, index_col="stay_date", parse_dates=["stay_date"])
+    return frame if columns is None else frame[columns]
+
+
+def new_version() -> int:
+    return time.time_ns()
+
+
+def version_directory(directory: str, version: int) -> str:
+    """Folder the datasets of `version` are written to."""
+    return os.path.join(directory, VERSIONS_DIR, str(version))
+
+
+def read_manifest(directory: str = "datasets") -> Optional[dict]:
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def dataset_path(
+    directory: str, room_type: int, manifest: Optional[dict]
+) -> Optional[str]:
+    """
+    Path of the published dataset of `room_type`, or None if there is none.
+
+    Without a manifest the folder predates it and is read from
+    dataset_room_type_{n}.parquet, or from the .csv export if there is no
+    parquet file.
+    """
+    if manifest is not None:
+        file_name = manifest.get("files", {}).get(str(room_type))
+        candidates = (
+            [os.path.join(manifest.get("directory", ""), file_name)]
+            if file_name
+            else []
+        )
+    else:
+        candidates = [
+            dataset_file_name(room_type),
+            dataset_file_name(room_type, "csv"),
+        ]
+    for file_name in candidates:
+        path = os.path.join(directory, file_name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def publish_manifest(
+    directory: str = "datasets",
+    export_csv: bool = False,
+    scalers=None,
+    version: Optional[int] = None,
+) -> dict:
+    """
+    Writes the manifest marking the datasets in `directory` as a new version.
+
+    `scalers`, if given, maps room types to the fitted scaler of their
+    dataset as {"columns", "center", "scale"}, so inputs computed at
+    prediction time can be scaled like the stored features. `version`, if
+    given, is the snapshot written to `version_directory(directory, version)`;
+    without it the datasets are the files directly in `directory`.
+
+    The manifest is written to a temporary file and moved into place, so
+    readers see either the previous manifest or the complete new one. Once
+    it is in place, versions older than the last `KEPT_VERSIONS` are removed.
+    """
+    manifest = {
+        "version": version or new_version(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "format": "parquet",
+        "files": {
+            str(room_type): dataset_file_name(room_type) for room_type in room_indices
+        },
+    }
+    if export_csv:
+        manifest["csv_files"] = {
+            str(room_type): dataset_file_name(room_type, "csv")
+            for room_type in room_indices
+        }
+    if scalers is not None:
+        manifest["scalers"] = {
+            str(room_type): scaler for room_type, scaler in scalers.items()
+        }
+    if version is not None:
+        manifest["directory"] = f"{VERSIONS_DIR}/{version}"
+    path = os.path.join(directory, MANIFEST_NAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(manifest, file)
+    os.replace(tmp_path, path)
+    collect_versions(directory, manifest["version"])
+    return manifest
+
+
+def collect_versions(directory: str, current: int, keep: int = KEPT_VERSIONS):
+    """
+    Removes the dataset versions of `directory` other than `current` and the
+    `keep - 1` versions published before it.
+
+    The previous version stays on disk, so a reader that read the old
+    manifest just before the swap can still open its files. Folders newer
+    than `current` are left over from rebuilds that failed before publishing,
+    since rebuilds hold a lock and this runs while publishing.
+    """
+    root = os.path.join(directory, VERSIONS_DIR)
+    try:
+        versions = sorted(int(name) for name in os.listdir(root) if name.isdigit())
+    except OSError:
+        return
+    older = [version for version in versions if version < current]
+    kept = set(older[-(keep - 1) :] if keep > 1 else []) | {current}
+    for version in versions:
+        if version not in kept:
+            shutil.rmtree(version_directory(directory, version), ignore_errors=True)
+
+
+class RoomFeatures:
+    """
+    Feature matrix of one room type, indexed by stay date.
+
+    Positions are kept in a plain dict built up front, since the lazily built
+    hash table behind `DatetimeIndex.get_loc` is not safe to initialise from
+    several request threads at once.
+
+    `center` and `scale` hold the scaler parameters of every feature (0 and 1
+    for features that are not scaled), or are None for datasets published
+    without them.
+    """
+
+    def __init__(self, frame: pd.DataFrame, scaler: Optional[dict] = None):
+        self.index = pd.DatetimeIndex(frame.index)
+        self.values = frame[features].to_numpy(dtype=np.float64)
+        self.occupancy = (
+            frame["occupancy"].to_numpy(dtype=np.float64)
+            if "occupancy" in frame
+            else None
+        )
+        self._positions = {value: i for i, value in enumerate(self.index.asi8)}
+
+        self.center = self.scale = None
+        if scaler is not None:
+            self.center = np.zeros(len(features))
+            self.scale = np.ones(len(features))
+            for column, center, scale in zip(
+                scaler["columns"], scaler["center"], scaler["scale"]
+            ):
+                if column in features:
+                    self.center[features.index(column)] = center
+                    self.scale[features.index(column)] = scale
+
+    def position(self, date) -> int:
+        return self._positions[pd.Timestamp(date).value]
+
+    def row(self, date) -> np.ndarray:
+        return self.values[self.position(date)]
+
+
+class _Snapshot:
+    """The tables of one published version, swapped in as a whole."""
+
+    def __init__(
+        self,
+        tables: Dict[int, RoomFeatures],
+        version: Optional[int],
+        generation: int,
+        stamp: Optional[Tuple],
+    ):
+        self.tables = tables
+        self.version = version
+        self.generation = generation
+        self.stamp = stamp
+
+
+class FeatureStore:
+    """
+    Keeps the per-room datasets written by `form()` in memory.
+
+    Each room table is held as a float matrix of the prediction `features`
+    behind a DatetimeIndex, so looking up the feature vector of a date is a
+    hash lookup instead of a CSV parse. `refresh` reloads the tables only when
+    `form()` has published a new manifest. `version` is the manifest version
+    of the loaded tables and `generation` counts the reloads, so callers can
+    tell whether the tables changed. The tables and both counters are
+    swapped in as one snapshot.
+
+    Tables are read from the version folder the manifest points to, which is
+    never written again once published. While a new version is loaded, other
+    threads keep serving the tables already in memory instead of waiting for
+    the reload. Folders written before the manifest existed are read from
+    dataset_room_type_{n}.parquet, or from the .csv export if there is no
+    parquet file.
+
+    Parameters:
+    - directory (str): Folder holding the per-room dataset files.
+    """
+
+    def __init__(self, directory: str = "datasets"):
+        self.directory = directory
+        self._snapshot = _Snapshot({}, None, 0, None)
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> Optional[int]:
+        return self._snapshot.version
+
+    @property
+    def generation(self) -> int:
+        return self._snapshot.generation
+
+    @property
+    def stamp(self) -> Optional[Tuple]:
+        """Modification times of the manifest or files the tables were read from."""
+        return self._snapshot.stamp
+
+    def features(self, room_type: int, date) -> np.ndarray:
+        """Return the feature vector of `room_type` on `date`."""
+        table = self.table(room_type)
+        try:
+            return table.row(date)
+        except KeyError:
+            raise KeyError(
+                f"No features for room type {room_type} on {pd.Timestamp(date):%Y-%m-%d}"
+            ) from None
+
+    def table(self, room_type: int) -> RoomFeatures:
+        if self._snapshot.stamp is None:
+            self.refresh()
+        table = self._snapshot.tables.get(room_type)
+        if table is None:
+            raise KeyError(f"No dataset loaded for room type {room_type}")
+        return table
+
+    def room_types(self):
+        """Room types with a loaded dataset."""
+        return sorted(self._snapshot.tables)
+
+    def refresh(self, wait: bool = False) -> bool:
+        """
+        Reload the tables if a new dataset was published. Returns True on reload.
+
+        While another thread is reloading, the call returns right away and
+        the current tables stay in use, unless nothing is loaded yet or
+        `wait` is set. Writers of data derived from the datasets pass
+        `wait=True`, so they see the version published last.
+        """
+        stamp = self._publication_stamp()
+        if stamp == self._snapshot.stamp:
+            return False
+
+        if not self._lock.acquire(blocking=wait or self._snapshot.stamp is None):
+            return False
+        try:
+            # Another thread may have loaded it while this one waited
+            stamp = self._publication_stamp()
+            snapshot = self._snapshot
+            if stamp == snapshot.stamp:
+                return False
+            manifest, tables = self._load()
+            self._snapshot = _Snapshot(
+                tables,
+                manifest.get("version") if manifest else None,
+                snapshot.generation + 1,
+                stamp,
+            )
+        finally:
+            self._lock.release()
+        return True
+
+    def after_fork(self):
+        """
+        Recreate the lock in a forked worker. The loaded tables are kept,
+        shared copy-on-write with the parent, and never written in place.
+        """
+        self._lock = threading.Lock()
+
+    def _load(self) -> Tuple[Optional[dict], Dict[int, RoomFeatures]]:
+        """
+        Reads the tables of the published version. A version removed while
+        it is read was replaced by a newer one, which is read instead.
+        """
+        while True:
+            manifest = read_manifest(self.directory)
+            scalers = manifest.get("scalers", {}) if manifest else {}
+            tables = {}
+            try:
+                with DATASET_LOAD_SECONDS.time():
+                    for room_type in room_indices:
+                        path = dataset_path(self.directory, room_type, manifest)
+                        if path is None:
+                            continue
+                        tables[room_type] = RoomFeatures(
+                            read_dataset(path, features + ["occupancy"]),
+                            scalers.get(str(room_type)),
+                        )
+            except FileNotFoundError:
+                if read_manifest(self.directory) == manifest:
+                    raise
+                continue
+
+            listed = manifest.get("files", {}) if manifest else {}
+            if len(tables) < len(listed) and read_manifest(self.directory) != manifest:
+                continue
+            return manifest, tables
+
+    def _publication_stamp(self) -> Tuple:
+        manifest_path = os.path.join(self.directory, MANIFEST_NAME)
+        paths = (
+            [manifest_path]
+            if os.path.exists(manifest_path)
+            else [
+                os.path.join(self.directory, dataset_file_name(room_type, extension))
+                for room_type in room_indices
+                for extension in ("parquet", "csv")
+            ]
+        )
+        stamps = []
+        for path in paths:
+            try:
+                stamps.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                stamps.append(None)
+        return tuple(stamps)
@@ -0,0 +1,169 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.utils.compiled_models import model_input
+from app.utils.feature_store import features
+from app.utils.metrics import MODEL_PREDICT_ROWS, MODEL_PREDICT_SECONDS
+
+DAY_OF_WEEK = features.index("day_of_week")
+WEEK_DAY_AVG = features.index("week_day_avg")
+MONTH_AVG = features.index("month_avg")
+WEEK_DAY_IMPORTANCE = features.index("week_day_importance")
+EVENT = features.index("event")
+LAGS = [features.index(f"occupancy_lag_{j}") for j in range(1, 8)]
+MEAN_LAST_7 = features.index("mean_last_7")
+
+WINDOW = len(LAGS)
+
+
+def _calendar_features(table, dates: pd.DatetimeIndex) -> np.ndarray:
+    """
+    Scaled day of week and month columns of `dates`, looked up from the rows
+    of `table` that share the day of week or month.
+    """
+    day_of_week = table.values[:, DAY_OF_WEEK].astype(int)
+    by_day = np.full((7, 2), np.nan)
+    by_day[day_of_week] = table.values[:, [WEEK_DAY_AVG, WEEK_DAY_IMPORTANCE]]
+    by_month = np.full(13, np.nan)
+    by_month[table.index.month] = table.values[:, MONTH_AVG]
+
+    # Months or days the history never saw get the scaled median, 0
+    columns = np.zeros((len(dates), len(features)))
+    columns[:, DAY_OF_WEEK] = dates.dayofweek
+    columns[:, [WEEK_DAY_AVG, WEEK_DAY_IMPORTANCE]] = np.nan_to_num(
+        by_day[dates.dayofweek]
+    )
+    columns[:, MONTH_AVG] = np.nan_to_num(by_month[dates.month])
+    return columns
+
+
+def _initial_window(table, start: pd.Timestamp) -> Tuple[pd.Timestamp, np.ndarray]:
+    """
+    First rollout date and the unscaled occupancies of the 7 days before it,
+    most recent first.
+
+    A start date inside the history is rolled out from its own lags; a start
+    date after the history is reached by rolling out from the day after the
+    last known date.
+    """
+    last = table.index[-1]
+    if start <= last:
+        lags = table.row(start)[LAGS]
+        return start, lags * table.scale[LAGS] + table.center[LAGS]
+
+    position = len(table.index) - 1
+    lags = table.values[position, LAGS] * table.scale[LAGS] + table.center[LAGS]
+    return last + pd.Timedelta(days=1), np.concatenate(
+        [[table.occupancy[position]], lags[:-1]]
+    )
+
+
+def recursive_forecast(
+    model_registry, feature_store, calendar, date_range, room_types, alpha=0.6
+) -> Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray]]:
+    """
+    Forecasts every room type over `date_range` by repeated one-step
+    predictions of the lag 0 models.
+
+    Each room keeps its last 7 (predicted) occupancies in a ring buffer.
+    Every day the feature rows of all rooms are filled in one go from the
+    precomputed calendar columns and the buffers, each room's model predicts
+    the day, and the point prediction is written back as the newest lag. The
+    intervals are those of each one-step prediction and do not widen with the
+    horizon.
+
+    Returns a dict keyed by (day_num, room_type) with the raw
+    `(prediction, intervals)` of the model, like a single-row MAPIE predict.
+    """
+    room_types = list(room_types)
+    start, end = date_range[0], date_range[-1]
+
+    tables, firsts, windows = [], [], []
+    for room_type in room_types:
+        table = feature_store.table(room_type)
+        if table.center is None or table.occupancy is None:
+            raise ValueError(
+                "The datasets were published without scaler parameters, "
+                "rebuild them to use the recursive forecast"
+            )
+        if start < table.index[0]:
+            raise KeyError(f"No features for room type {room_type} on {start:%Y-%m-%d}")
+        first, window = _initial_window(table, start)
+        tables.append(table)
+        firsts.append(first)
+        windows.append(window)
+
+    rollout_dates = pd.date_range(min(firsts), end, freq="D")
+    room_count, step_count = len(room_types), len(rollout_dates)
+
+    inputs = np.empty((room_count, step_count, len(features)))
+    centers = np.stack([table.center for table in tables])
+    scales = np.stack([table.scale for table in tables])
+    for r, (room_type, table) in enumerate(zip(room_types, tables)):
+        inputs[r] = _calendar_features(table, rollout_dates)
+        events = calendar.counts(room_type, rollout_dates)
+        inputs[r, :, EVENT] = (events - table.center[EVENT]) / table.scale[EVENT]
+
+    # buffer[r, (heads[r] - j) % WINDOW] holds the occupancy j days back
+    buffer = np.empty((room_count, WINDOW))
+    heads = np.zeros(room_count, dtype=int)
+    back = np.arange(1, WINDOW + 1)
+    for r, window in enumerate(windows):
+        buffer[r, (-back) % WINDOW] = window
+
+    first_steps = np.array(
+        [rollout_dates.get_loc(first) for first in firsts], dtype=int
+    )
+    offset = rollout_dates.get_loc(start) if start >= rollout_dates[0] else 0
+    models = [model_registry.get(room_type, 0) for room_type in room_types]
+
+    results = {}
+    for step, date in enumerate(rollout_dates):
+        active = np.flatnonzero(first_steps <= step)
+        lags = np.take_along_axis(
+            buffer, (heads[:, None] - back[None, :]) % WINDOW, axis=1
+        )
+        rows = inputs[:, step]
+        rows[:, LAGS] = (lags - centers[:, LAGS]) / scales[:, LAGS]
+        rows[:, MEAN_LAST_7] = (lags.mean(axis=1) - centers[:, MEAN_LAST_7]) / scales[
+            :, MEAN_LAST_7
+        ]
+
+        for r in active:
+            with MODEL_PREDICT_SECONDS.time(model="separated"):
+                m_pred, m_pis = models[r].predict(
+                    model_input(models[r], rows[r : r + 1]), alpha=alpha
+                )
+            MODEL_PREDICT_ROWS.inc(model="separated")
+
+            buffer[r, heads[r] % WINDOW] = max(float(m_pred[0]), 0.0)
+            heads[r] += 1
+            if date >= start:
+                results[(step - offset, room_types[r])] = (m_pred, m_pis)
+
+    return results
+
+
+def rollout_length(feature_store, date_range, room_types: List[int]) -> int:
+    """
+    Days `recursive_forecast` predicts to cover `date_range`, counting those
+    rolled out between the end of the history and a later start date.
+    """
+    first = date_range[0]
+    for room_type in room_types:
+        last = feature_store.table(room_type).index[-1]
+        first = min(first, last + pd.Timedelta(days=1))
+    return (date_range[-1] - first).days + 1
+
+
+def forecast_available(feature_store, room_types: List[int]) -> bool:
+    """Whether every room type has the scaler parameters the rollout needs."""
+    try:
+        return all(
+            feature_store.table(room_type).center is not None
+            for room_type in room_types
+        )
+    except KeyError:
+        return False
@@ -0,0 +1,286 @@
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.enums.room_id_dict import scaled_id_list, scaled_to_normal_id
+from app.enums.room_indices_dict import room_indices
+from app.utils.metrics import FORECAST_TABLE_LOOKUPS
+from app.utils.model_registry import LAG_COUNT
+
+FORECAST_TABLE_NAME = "forecast.parquet"
+METADATA_KEY = b"lumen_forecast"
+
+# Rows of the global model are stored with this lag
+GLOBAL_LAG = -1
+
+
+def source_stamps(paths: List[str]) -> Dict[str, Optional[int]]:
+    """Modification times of the files a forecast was computed from."""
+    stamps = {}
+    for path in paths:
+        try:
+            stamps[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            stamps[path] = None
+    return stamps
+
+
+def forecast_start(last_date: pd.Timestamp, horizon: int, today=None) -> pd.Timestamp:
+    """
+    First date of the materialized horizon: today, or the first of the last
+    `horizon` days with features when the datasets end before today.
+    """
+    today = pd.Timestamp(today or datetime.now()).normalize()
+    return min(today, last_date - pd.Timedelta(days=horizon - 1))
+
+
+class _Snapshot:
+    """One loaded table: its metadata and the predictions as dense arrays."""
+
+    def __init__(self, frame: pd.DataFrame, metadata: dict):
+        self.metadata = metadata
+        self.start = pd.Timestamp(metadata["start"])
+        days = metadata["horizon"]
+        offsets = (pd.DatetimeIndex(frame["stay_date"]) - self.start).days.to_numpy()
+        rooms = frame["room_type"].map(room_indices.index).to_numpy()
+        lags = frame["lag"].to_numpy()
+
+        # has_interval and has_count mark the entries with a prediction
+        self.intervals = np.zeros((days, LAG_COUNT, len(room_indices), 3), dtype=int)
+        self.has_interval = np.zeros(self.intervals.shape[:3], dtype=bool)
+        lag_rows = lags != GLOBAL_LAG
+        entries = offsets[lag_rows], lags[lag_rows], rooms[lag_rows]
+        self.intervals[entries] = frame.loc[
+            lag_rows, ["room_cnt", "low_boundary", "high_boundary"]
+        ].to_numpy(dtype=int)
+        self.has_interval[entries] = True
+
+        counts = np.zeros((days, len(room_indices)), dtype=int)
+        has_count = np.zeros(counts.shape, dtype=bool)
+        global_rows = ~lag_rows
+        entries = offsets[global_rows], rooms[global_rows]
+        counts[entries] = frame.loc[global_rows, "room_cnt"].to_numpy(dtype=int)
+        has_count[entries] = True
+
+        # The global model predicts in scaled_id_list order
+        order = [room_indices.index(scaled_to_normal_id[s]) for s in scaled_id_list]
+        self.counts = counts[:, order]
+        self.has_count = has_count[:, order]
+
+    def offsets(self, date_range: pd.DatetimeIndex) -> Tuple[np.ndarray, np.ndarray]:
+        """Day offsets of a range, 0 outside the table, and which are inside it."""
+        offsets = (date_range - self.start).days.to_numpy()
+        inside = (offsets >= 0) & (offsets < len(self.counts))
+        return np.where(inside, offsets, 0), inside
+
+
+def _count_lookup(missing: np.ndarray):
+    if not missing.any():
+        result = "hit"
+    elif missing.all():
+        result = "miss"
+    else:
+        result = "partial"
+    FORECAST_TABLE_LOOKUPS.inc(result=result)
+
+
+def write_forecast_table(directory: str, frame: pd.DataFrame, metadata: dict) -> str:
+    """
+    Writes the forecast rows sorted by (stay_date, lag, room_type), with
+    `metadata` in the parquet schema. The file is written next to the table
+    and moved into place, so readers see the old or the new table.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(
+        frame.sort_values(["stay_date", "lag", "room_type"]), preserve_index=False
+    )
+    table = table.replace_schema_metadata(
+        {**(table.schema.metadata or {}), METADATA_KEY: json.dumps(metadata)}
+    )
+    path = os.path.join(directory, FORECAST_TABLE_NAME)
+    tmp_path = f"{path}.tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+class ForecastTable:
+    """
+    Predictions materialized ahead of time for every room type over a fixed
+    horizon, read from datasets/forecast.parquet.
+
+    The file holds one row per (stay_date, lag, room_type) with the occupancy
+    and bounds of the per-room lag models, and one row per (stay_date,
+    room_type) with the room count of the global model (lag -1). In memory
+    the rows are kept in dense arrays indexed by the day offset from the
+    first date, so answering a range is an array slice.
+
+    The table records the dataset version and the modification times of the
+    model and event files it was computed from, and is only used while they
+    still match, so a rebuild or a new model never serves stale predictions.
+
+    Parameters:
+    - directory (str): Folder holding the table, next to the datasets.
+    - sources (list): Model and event files the predictions depend on.
+    """
+
+    def __init__(self, directory: str = "datasets", sources: List[str] = ()):
+        self.directory = directory
+        self.sources = list(sources)
+        self._snapshot: Optional[_Snapshot] = None
+        self._stamp: Optional[int] = None
+        self._current: Tuple[Optional[Hashable], bool] = (None, False)
+        self._lock = threading.Lock()
+        self._scheduler: Optional[threading.Thread] = None
+        self._schedule: Optional[Tuple[float, Callable]] = None
+        self._stop = threading.Event()
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, FORECAST_TABLE_NAME)
+
+    @property
+    def metadata(self) -> Optional[dict]:
+        snapshot = self._snapshot
+        return snapshot.metadata if snapshot is not None else None
+
+    def refresh(self) -> bool:
+        """Reload the table if the file changed. Returns True on reload."""
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return False
+
+        with self._lock:
+            if stamp == self._stamp:
+                return False
+            self._snapshot = self._load() if stamp is not None else None
+            self._current = (None, False)
+            self._stamp = stamp
+        return True
+
+    def is_current(self, dataset_version: Optional[int], key: Hashable) -> bool:
+        """
+        Whether the loaded table was computed from the published datasets
+        and the model and event files on disk.
+
+        The files are only checked again when `key` changes, so callers pass
+        the versions of everything that bumps when those files are reloaded.
+        """
+        self.refresh()
+        metadata = self.metadata
+        if metadata is None or metadata["dataset_version"] != dataset_version:
+            return False
+        key = (key, self._stamp)
+        cached_key, current = self._current
+        if cached_key != key:
+            current = metadata["sources"] == source_stamps(self.sources)
+            self._current = (key, current)
+        return current
+
+    def intervals(
+        self, date_range: pd.DatetimeIndex, room_types: List[int]
+    ) -> Tuple[dict, np.ndarray]:
+        """
+        Predictions of the days of a range of up to 7 days the table holds,
+        keyed by (day_num, room_type) like `predict_date_range`, and a mask
+        of the days it does not hold, left to live inference.
+        """
+        snapshot = self._snapshot
+        missing = np.ones(len(date_range), dtype=bool)
+        if snapshot is None or len(date_range) > LAG_COUNT:
+            _count_lookup(missing)
+            return {}, missing
+
+        offsets, inside = snapshot.offsets(date_range)
+        rooms = [room_indices.index(room_type) for room_type in room_types]
+        lags = np.arange(len(date_range))
+        missing = ~(inside & snapshot.has_interval[offsets, lags][:, rooms].all(axis=1))
+        _count_lookup(missing)
+
+        rows = snapshot.intervals[offsets, lags][:, rooms]
+        return {
+            (int(i), room_type): tuple(rows[i, j])
+            for i in np.flatnonzero(~missing)
+            for j, room_type in enumerate(room_types)
+        }, missing
+
+    def counts(self, date_range: pd.DatetimeIndex) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Global model room counts of a range in `scaled_id_list` order, like
+        `predict_range_counts`, and a mask of the days the table does not
+        hold, whose rows are left at 0 for live inference to fill.
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            missing = np.ones(len(date_range), dtype=bool)
+            _count_lookup(missing)
+            return np.zeros((len(date_range), len(scaled_id_list)), dtype=int), missing
+
+        offsets, inside = snapshot.offsets(date_range)
+        missing = ~(inside & snapshot.has_count[offsets].all(axis=1))
+        _count_lookup(missing)
+        counts = snapshot.counts[offsets]
+        counts[missing] = 0
+        return counts, missing
+
+    def stats(self) -> dict:
+        metadata = self.metadata
+        if metadata is None:
+            return {"loaded": False}
+        return {
+            "loaded": True,
+            "start": metadata["start"],
+            "horizon": metadata["horizon"],
+            "created_at": metadata["created_at"],
+            "dataset_version": metadata["dataset_version"],
+        }
+
+    def start_scheduler(self, interval: float, fn: Callable):
+        """Call `fn` every `interval` seconds on a daemon thread."""
+        if interval <= 0 or self._scheduler is not None:
+            return
+        self._schedule = (interval, fn)
+        stop = self._stop = threading.Event()
+
+        def schedule():
+            while not stop.wait(interval):
+                try:
+                    fn()
+                except Exception as e:
+                    print(f"Error materializing the forecast table: {e}")
+
+        self._scheduler = threading.Thread(
+            target=schedule, name="forecast-scheduler", daemon=True
+        )
+        self._scheduler.start()
+
+    def stop_scheduler(self):
+        self._stop.set()
+        self._scheduler = None
+
+    def after_fork(self):
+        """Recreate the lock and the scheduler thread in a forked worker."""
+        self._lock = threading.Lock()
+        self._scheduler = None
+        if self._schedule is not None:
+            self.start_scheduler(*self._schedule)
+
+    def _file_stamp(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self) -> _Snapshot:
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(self.path)
+        metadata = json.loads(table.schema.metadata[METADATA_KEY])
+        return _Snapshot(table.to_pandas(), metadata)
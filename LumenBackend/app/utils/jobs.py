@@ -0,0 +1,425 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+
+from app.utils.executor import QueueFull
+from app.utils.metrics import JOB_SECONDS
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# Seconds between two writes of a job's progress to its state file
+SAVE_INTERVAL = 0.5
+
+
+@contextmanager
+def file_lock(path: str):
+    """
+    Exclusive lock on `path` shared by every process on the host, so jobs
+    queued by different server workers still run one at a time. A no-op
+    where fcntl is not available.
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def _write_json(path: str, data: dict):
+    """Replaces `path` at once, so readers never see a partial file."""
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as file:
+        json.dump(data, file)
+    os.replace(temporary, path)
+
+
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp).isoformat(timespec="seconds")
+
+
+class Job:
+    """
+    State of one background job, updated by the worker as it runs.
+
+    With a `path` every update is also written there as JSON, for the other
+    server processes to read; progress at most every SAVE_INTERVAL seconds.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fingerprint: Optional[str] = None,
+        owner: Optional[str] = None,
+        path: Optional[str] = None,
+    ):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.fingerprint = fingerprint
+        self.owner = owner
+        self.path = path
+        self.status = QUEUED
+        self.stage: Optional[str] = None
+        self.progress = 0.0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.stage_seconds: Dict[str, float] = {}
+        self._stage_started: Optional[float] = None
+        self._saved_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_state(cls, state: dict) -> "Job":
+        """A read-only copy of a job from the state file of another process."""
+        job = cls(state["name"], state["fingerprint"], state["owner"])
+        job.id = state["id"]
+        for field in (
+            "status",
+            "stage",
+            "progress",
+            "error",
+            "created_at",
+            "started_at",
+            "finished_at",
+            "stage_seconds",
+        ):
+            setattr(job, field, state[field])
+        return job
+
+    @property
+    def active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    def report(self, stage: str, progress: Optional[float] = None):
+        """Progress callback handed to the job function."""
+        now = time.perf_counter()
+        with self._lock:
+            changed = stage != self.stage
+            if changed:
+                self._close_stage(now)
+                self.stage = stage
+                self._stage_started = now
+            if progress is not None:
+                self.progress = max(self.progress, min(float(progress), 1.0))
+        self.save(force=changed)
+
+    def state(self) -> dict:
+        with self._lock:
+            return {
+                "id": self.id,
+                "name": self.name,
+                "fingerprint": self.fingerprint,
+                "owner": self.owner,
+                "status": self.status,
+                "stage": self.stage,
+                "progress": self.progress,
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "stage_seconds": dict(self.stage_seconds),
+            }
+
+    def save(self, force: bool = True):
+        if self.path is None:
+            return
+        now = time.monotonic()
+        if not force and now - (self._saved_at or 0.0) < SAVE_INTERVAL:
+            return
+        self._saved_at = now
+        try:
+            _write_json(self.path, self.state())
+        except OSError as e:
+            # Only the other processes miss the update, the job goes on
+            print(f"Error saving the state of job {self.id}: {e}")
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            end = self.finished_at or time.time()
+            return {
+                "job_id": self.id,
+                "name": self.name,
+                "status": self.status,
+                "stage": self.stage,
+                "progress": round(self.progress, 3),
+                "created_at": _isoformat(self.created_at),
+                "started_at": _isoformat(self.started_at),
+                "finished_at": _isoformat(self.finished_at),
+                "elapsed_seconds": (
+                    round(end - self.started_at, 3) if self.started_at else None
+                ),
+                "stage_seconds": {
+                    stage: round(seconds, 3)
+                    for stage, seconds in self.stage_seconds.items()
+                },
+                "error": self.error,
+            }
+
+    def _start(self):
+        with self._lock:
+            self.status = RUNNING
+            self.started_at = time.time()
+        self.save()
+
+    def _finish(self, error: Optional[str] = None):
+        with self._lock:
+            self._close_stage(time.perf_counter())
+            self.stage = None
+            self.finished_at = time.time()
+            self.status = FAILED if error else SUCCEEDED
+            self.error = error
+            if not error:
+                self.progress = 1.0
+        self.save()
+
+    def _close_stage(self, now: float):
+        if self.stage is not None and self._stage_started is not None:
+            self.stage_seconds[self.stage] = (
+                self.stage_seconds.get(self.stage, 0.0) + now - self._stage_started
+            )
+
+
+class JobQueue:
+    """
+    Runs jobs on a local worker pool and keeps their status for polling.
+
+    With the default single worker jobs run one after another, so two
+    rebuilds never touch the datasets at the same time. Submitting a job
+    whose fingerprint matches a queued or running job returns that job
+    instead of starting another one. Once `max_queue` jobs are waiting for
+    a worker, further submissions raise `QueueFull`.
+
+    With a `directory`, the state of every job is also kept there as
+    <job id>.json, and the jobs of every server process using the same
+    folder are visible to each of them: status queries, the fingerprint
+    check and the queue limit all see them. Each process holds a lock on
+    its own .owner file for as long as it runs, so the active jobs of a
+    process that died are reported as failed rather than running forever.
+    `close` removes that file on exit, and the files of processes that
+    could not, unlocked since they died, are removed when a queue opens.
+
+    Parameters:
+    - max_workers (int): Number of worker threads.
+    - history (int): How many finished jobs are kept for status queries.
+    - max_queue (int, optional): Jobs allowed to wait, None for no limit.
+    - directory (str, optional): Folder shared by the server processes.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 1,
+        history: int = 50,
+        max_queue: Optional[int] = None,
+        directory: Optional[str] = None,
+    ):
+        self.history = history
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.directory = directory
+        self._owner_file = None
+        self._open()
+
+    def _open(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="job-worker"
+        )
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.owner = uuid.uuid4().hex
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            if fcntl is not None:
+                # Under the shared lock, so no other queue sweeps the new file
+                # before it is locked
+                with self._shared():
+                    for file_name in os.listdir(self.directory):
+                        if file_name.endswith(".owner"):
+                            self._remove_if_unlocked(
+                                os.path.join(self.directory, file_name)
+                            )
+                    self._owner_file = open(self._owner_path(self.owner), "a")
+                    fcntl.flock(self._owner_file, fcntl.LOCK_EX)
+
+    def close(self):
+        """Removes the owner file of this process, on its way out."""
+        if self._owner_file is not None:
+            try:
+                os.remove(self._owner_file.name)
+            except OSError:
+                pass
+            self._owner_file.close()
+            self._owner_file = None
+
+    def after_fork(self):
+        """
+        Start over in a forked worker: the pool threads and the lock of the
+        parent do not survive the fork, and the worker gets an owner of its
+        own. The inherited owner file is closed without unlocking it, the
+        lock belongs to the parent.
+        """
+        if self._owner_file is not None:
+            self._owner_file.close()
+            self._owner_file = None
+        self._open()
+
+    def submit(
+        self,
+        name: str,
+        fn: Callable,
+        *args,
+        fingerprint: Optional[str] = None,
+        on_error: Optional[Callable] = None,
+    ) -> Tuple[Job, bool]:
+        """
+        Queue `fn(*args, report)` as a job.
+
+        Returns the job and whether it was newly created; `on_error` is called
+        with the exception if the job fails.
+        """
+        with self._shared(), self._lock:
+            jobs = self._all_jobs()
+            if fingerprint is not None:
+                for job in jobs:
+                    if job.active and job.fingerprint == fingerprint:
+                        return job, False
+
+            if self._full(jobs):
+                raise QueueFull(f"{self.max_queue} jobs are already waiting")
+
+            job = Job(name, fingerprint, self.owner)
+            if self.directory is not None:
+                job.path = self._job_path(job.id)
+                job.save()
+            self._jobs[job.id] = job
+            self._trim(jobs + [job])
+
+        self._executor.submit(self._run, job, fn, args, on_error)
+        return job, True
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.directory is not None and job_id.isalnum():
+            job = self._read(self._job_path(job_id))
+        return job
+
+    def active(self):
+        return [job for job in self.jobs() if job.active]
+
+    def full(self) -> bool:
+        with self._lock:
+            return self._full(self._all_jobs())
+
+    def jobs(self):
+        with self._lock:
+            return self._all_jobs()
+
+    def _run(self, job: Job, fn: Callable, args: tuple, on_error: Optional[Callable]):
+        job._start()
+        started = time.perf_counter()
+        try:
+            fn(*args, job.report)
+        except Exception as e:
+            job._finish(error=str(e))
+            JOB_SECONDS.observe(
+                time.perf_counter() - started, job=job.name, status=FAILED
+            )
+            if on_error is not None:
+                on_error(e)
+            return
+        job._finish()
+        JOB_SECONDS.observe(
+            time.perf_counter() - started, job=job.name, status=SUCCEEDED
+        )
+
+    def _all_jobs(self):
+        """Jobs of every process, oldest first; the live copies for our own."""
+        jobs = {}
+        if self.directory is not None:
+            for file_name in os.listdir(self.directory):
+                if file_name.endswith(".json"):
+                    job = self._read(os.path.join(self.directory, file_name))
+                    if job is not None:
+                        jobs[job.id] = job
+        jobs.update(self._jobs)
+        return sorted(jobs.values(), key=lambda job: job.created_at)
+
+    def _read(self, path: str) -> Optional[Job]:
+        try:
+            with open(path) as file:
+                job = Job.from_state(json.load(file))
+        except (OSError, ValueError, KeyError):
+            return None
+        if job.active and not self._owner_alive(job.owner):
+            job.status = FAILED
+            job.error = "The server process running the job exited"
+        return job
+
+    def _owner_alive(self, owner: Optional[str]) -> bool:
+        if owner == self.owner or fcntl is None:
+            return True
+        return not self._remove_if_unlocked(self._owner_path(owner))
+
+    @staticmethod
+    def _remove_if_unlocked(path: str) -> bool:
+        """Removes an owner file no process holds; True if it is gone."""
+        try:
+            with open(path) as file:
+                fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os.remove(path)
+        except BlockingIOError:
+            return False
+        except OSError:
+            pass
+        return True
+
+    def _full(self, jobs) -> bool:
+        if self.max_queue is None:
+            return False
+        active = sum(1 for job in jobs if job.active)
+        return active >= self.max_workers + self.max_queue
+
+    def _trim(self, jobs):
+        finished = [job for job in jobs if not job.active]
+        for job in finished[: max(len(jobs) - self.history, 0)]:
+            self._jobs.pop(job.id, None)
+            if self.directory is not None:
+                try:
+                    os.remove(self._job_path(job.id))
+                except OSError:
+                    pass
+
+    def _shared(self):
+        """Lock keeping the processes sharing `directory` from submitting at once."""
+        if self.directory is None:
+            return nullcontext()
+        return file_lock(os.path.join(self.directory, ".lock"))
+
+    def _job_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _owner_path(self, owner: str) -> str:
+        return os.path.join(self.directory, f"{owner}.owner")
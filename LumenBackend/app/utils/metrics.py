@@ -0,0 +1,446 @@
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ContextDecorator
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def reset(self):
+        """Forget the values of the parent process in a forked worker."""
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def reset(self):
+        super().reset()
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dump(self) -> list:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def render(self, dumps: Optional[list] = None) -> List[str]:
+        """Renders this process's values, or the sum of `dumps` if given."""
+        if dumps is None:
+            dumps = [self.dump()]
+        values: Dict[Tuple[str, ...], float] = {}
+        for dump in dumps:
+            for key, value in dump:
+                key = tuple(key)
+                values[key] = values.get(key, 0) + value
+        return self.header() + [
+            f"{self.name}{_label_text(self.labelnames, key)} {_number(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Gauge(_Metric):
+    """Gauge whose value is read from `function` when the metrics are rendered."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, function: Callable[[], Optional[float]]):
+        super().__init__(name, documentation)
+        self.function = function
+
+    def dump(self) -> Optional[float]:
+        return self.function()
+
+    def render(self, dumps: Optional[Dict[int, Optional[float]]] = None) -> List[str]:
+        """Renders this process's value, or one per pid of `dumps` if given."""
+        if dumps is None:
+            value = self.dump()
+            if value is None:
+                return []
+            return self.header() + [f"{self.name} {_number(value)}"]
+        lines = [
+            f'{self.name}{{pid="{pid}"}} {_number(value)}'
+            for pid, value in sorted(dumps.items())
+            if value is not None
+        ]
+        return self.header() + lines if lines else []
+
+
+class Histogram(_Metric):
+    """
+    Latency histogram with fixed buckets.
+
+    `observe` is a bisect and three additions under a lock, cheap enough to
+    call on every request.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def reset(self):
+        super().reset()
+        self._series = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels) -> "timed":
+        return timed(self, **labels)
+
+    def dump(self) -> list:
+        with self._lock:
+            return [
+                [list(key), list(counts), total, count]
+                for key, (counts, total, count) in self._series.items()
+            ]
+
+    def render(self, dumps: Optional[list] = None) -> List[str]:
+        """Renders this process's series, or the sum of `dumps` if given."""
+        if dumps is None:
+            dumps = [self.dump()]
+        series: Dict[Tuple[str, ...], list] = {}
+        for dump in dumps:
+            for key, counts, total, count in dump:
+                merged = series.setdefault(
+                    tuple(key), [[0] * (len(self.buckets) + 1), 0.0, 0]
+                )
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+        lines = self.header()
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _label_text(self.labelnames, key, f'le="{_number(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _label_text(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class timed(ContextDecorator):
+    """Observes the wall time of a block, or of every call of a function."""
+
+    def __init__(self, histogram: Histogram, **labels):
+        self.histogram = histogram
+        self.labels = labels
+        self._started: List[float] = []
+
+    def __enter__(self):
+        self._started.append(time.perf_counter())
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self._started.pop(), **self.labels)
+        return False
+
+
+class StageTimer:
+    """
+    Progress callback for the pipeline that observes how long each stage
+    took, forwarding every call to `report`.
+    """
+
+    def __init__(
+        self, histogram: Histogram, report: Optional[Callable] = None, **labels
+    ):
+        self.histogram = histogram
+        self.report = report
+        self.labels = labels
+        self._stage = None
+        self._started = 0.0
+
+    def __call__(self, stage, fraction=None):
+        if stage != self._stage:
+            self._close(time.perf_counter())
+            self._stage = stage
+            self._started = time.perf_counter()
+        if self.report is not None:
+            self.report(stage, fraction)
+
+    def finish(self):
+        self._close(time.perf_counter())
+        self._stage = None
+
+    def _close(self, now: float):
+        if self._stage is not None:
+            self.histogram.observe(
+                now - self._started, stage=self._stage, **self.labels
+            )
+
+
+def peak_rss_bytes() -> Optional[int]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class MetricsRegistry:
+    """
+    The metrics of the app, rendered in the Prometheus text format.
+
+    A server running several worker processes calls `share` in each of
+    them. Every worker then writes its values to <directory>/<pid>.json
+    every `interval` seconds, and `render` adds up the counters and
+    histograms of every file, so /metrics describes the whole server
+    whichever worker answers. Files of exited workers are kept, as their
+    counts still happened, while gauges, which describe a single process,
+    are rendered per pid for the workers that wrote recently.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        self.directory: Optional[str] = None
+        self.interval = 0.0
+        self._stop = threading.Event()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, function) -> Gauge:
+        return self.register(Gauge(name, documentation, function))
+
+    def share(self, directory: str, interval: float = 5):
+        """Write the values of this process to `directory` from now on."""
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.interval = interval
+        self.dump()
+        stop = self._stop = threading.Event()
+
+        def write():
+            while not stop.wait(interval):
+                try:
+                    self.dump()
+                except OSError as e:
+                    print(f"Error writing the metrics: {e}")
+
+        threading.Thread(target=write, name="metrics-share", daemon=True).start()
+
+    def after_fork(self):
+        """
+        Start a forked worker from zero: the values of the parent are in the
+        parent's own file, and the locks do not survive the fork.
+        """
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        for metric in self._metrics.values():
+            metric.reset()
+
+    def dump(self):
+        """Writes the values of this process to its file in `directory`."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, "w") as file:
+            json.dump(
+                {
+                    "pid": os.getpid(),
+                    "time": time.time(),
+                    "metrics": {metric.name: metric.dump() for metric in metrics},
+                },
+                file,
+            )
+        os.replace(temporary, path)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        if self.directory is None:
+            for metric in metrics:
+                lines.extend(metric.render())
+            return "\n".join(lines) + "\n"
+
+        self.dump()
+        processes = []
+        for file_name in os.listdir(self.directory):
+            if file_name.endswith(".json"):
+                try:
+                    with open(os.path.join(self.directory, file_name)) as file:
+                        processes.append(json.load(file))
+                except (OSError, ValueError):
+                    continue
+        live_since = time.time() - 3 * self.interval
+        for metric in metrics:
+            if isinstance(metric, Gauge):
+                dumps = {
+                    process["pid"]: process["metrics"].get(metric.name)
+                    for process in processes
+                    if process["time"] >= live_since
+                }
+            else:
+                dumps = [
+                    process["metrics"][metric.name]
+                    for process in processes
+                    if metric.name in process["metrics"]
+                ]
+            lines.extend(metric.render(dumps))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "lumen_http_request_seconds",
+    "Time spent handling HTTP requests.",
+    ["method", "endpoint", "status"],
+)
+FORM_STAGE_SECONDS = REGISTRY.histogram(
+    "lumen_form_stage_seconds",
+    "Time spent in each stage of a dataset rebuild.",
+    ["pipeline", "stage"],
+)
+DATASET_LOAD_SECONDS = REGISTRY.histogram(
+    "lumen_dataset_load_seconds",
+    "Time spent loading the per-room datasets into the feature store.",
+)
+MODEL_LOAD_SECONDS = REGISTRY.histogram(
+    "lumen_model_load_seconds",
+    "Time spent in joblib.load for a model file.",
+    ["model"],
+)
+MODEL_PREDICT_SECONDS = REGISTRY.histogram(
+    "lumen_model_predict_seconds",
+    "Time spent in model.predict.",
+    ["model"],
+)
+MODEL_PREDICT_ROWS = REGISTRY.counter(
+    "lumen_model_predict_rows_total",
+    "Rows passed to model.predict.",
+    ["model"],
+)
+JOB_SECONDS = REGISTRY.histogram(
+    "lumen_job_seconds",
+    "Run time of finished background jobs.",
+    ["job", "status"],
+    buckets=(1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0),
+)
+INFERENCE_REJECTED = REGISTRY.counter(
+    "lumen_inference_rejected_total",
+    "Predictions refused because the inference pool was full or too slow.",
+    ["reason"],
+)
+FORECAST_TABLE_LOOKUPS = REGISTRY.counter(
+    "lumen_forecast_table_lookups_total",
+    "Prediction ranges looked up in the materialized forecast table.",
+    ["result"],
+)
+STARTUP_STEP_SECONDS = REGISTRY.histogram(
+    "lumen_startup_step_seconds",
+    "Time spent in each warmup step after the app started.",
+    ["step"],
+)
+REGISTRY.gauge(
+    "lumen_process_peak_rss_bytes",
+    "Peak resident set size of this process.",
+    peak_rss_bytes,
+)
+REGISTRY.gauge(
+    "lumen_process_resident_memory_bytes",
+    "Current resident set size of this process.",
+    rss_bytes,
+)
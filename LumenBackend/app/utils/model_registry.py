@@ -0,0 +1,214 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.enums.room_indices_dict import room_indices
+from app.utils.compiled_models import compiled_model_path, load_compiled
+from app.utils.metrics import MODEL_LOAD_SECONDS
+
+LAG_COUNT = 7
+
+
+def separated_model_path(root: str, room_type: int, lag: int) -> str:
+    return os.path.join(root, f"model_rt_{room_type}", f"mapie_model_lag_{lag}.joblib")
+
+
+def file_stamp(path: str) -> Optional[Tuple[int, int]]:
+    """Modification time and size of a file, None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class ModelRegistry:
+    """
+    In-memory registry of the per-room, per-lag MAPIE models.
+
+    Models are loaded once and shared by every request. With `max_models` set,
+    models are loaded lazily and the least recently used ones are evicted once
+    the limit is reached; otherwise all of them can be loaded up front with
+    `preload`.
+
+    `refresh` compares the cached models against the files on disk, loads every
+    changed file and swaps the new models in under a single lock, so a request
+    sees either the old or the new set and never a half-loaded model.
+
+    Parameters:
+    - root (str): Folder containing the model_rt_{room_type} subfolders.
+    - max_models (int, optional): Upper bound on cached models, None for no limit.
+    - mmap_mode (str, optional): joblib mmap_mode used to load the model files.
+    - compiled (bool): Load the compiled .npz copy of a model when it is up to date.
+    """
+
+    def __init__(
+        self,
+        root: str = "separated_models",
+        max_models: Optional[int] = None,
+        mmap_mode: Optional[str] = None,
+        compiled: bool = False,
+    ):
+        self.root = root
+        self.max_models = max_models or None
+        self.mmap_mode = mmap_mode
+        self.compiled = compiled
+        self.version = 0
+        self._models: "OrderedDict[Tuple[int, int], Tuple[Any, Any]]" = OrderedDict()
+        self._stamps: Tuple[int, Optional[Tuple]] = (-1, None)
+        self._lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def stamp(self) -> Tuple:
+        """
+        Stamps of every model file, taken again whenever `version` changes.
+        Unlike `version`, they are the same in every process serving the
+        same files and after a restart.
+        """
+        version, stamp = self._stamps
+        if version != self.version:
+            version = self.version
+            stamp = tuple(self._stamp(key) for key in self.keys())
+            self._stamps = (version, stamp)
+        return stamp
+
+    def keys(self):
+        return [
+            (room_type, lag) for room_type in room_indices for lag in range(LAG_COUNT)
+        ]
+
+    def get(self, room_type: int, lag: int) -> Any:
+        """Return the model for (room_type, lag), loading it on a cache miss."""
+        key = (room_type, lag)
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None:
+                self._models.move_to_end(key)
+                return entry[1]
+
+        stamp, model = self._load(key)
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None:
+                return entry[1]
+            self._models[key] = (stamp, model)
+            self._evict()
+        return model
+
+    def preload(self) -> int:
+        """Load every model found on disk, up to `max_models`. Returns the count."""
+        loaded = 0
+        for key in self.keys():
+            if self.max_models is not None and loaded >= self.max_models:
+                break
+            path = separated_model_path(self.root, *key)
+            if not os.path.exists(path):
+                continue
+            try:
+                self.get(*key)
+                loaded += 1
+            except Exception as e:
+                print(f"Error loading the model at {path}: {e}")
+        return loaded
+
+    def refresh(self) -> int:
+        """Reload models whose files changed on disk. Returns the number swapped."""
+        with self._lock:
+            cached = {key: entry[0] for key, entry in self._models.items()}
+
+        updates: Dict[Tuple[int, int], Tuple[Any, Any]] = {}
+        removed = []
+        for key, old_stamp in cached.items():
+            stamp = self._stamp(key)
+            if stamp is None:
+                removed.append(key)
+            elif stamp != old_stamp:
+                try:
+                    updates[key] = self._load(key)
+                except Exception as e:
+                    print(f"Error reloading the model {key}: {e}")
+
+        if not updates and not removed:
+            return 0
+
+        with self._lock:
+            for key in removed:
+                self._models.pop(key, None)
+            self._models.update(updates)
+            self._evict()
+            self.version += 1
+        return len(updates) + len(removed)
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self.version += 1
+
+    def loaded(self):
+        with self._lock:
+            return list(self._models.keys())
+
+    def start_watcher(self, interval: float):
+        """Call `refresh` every `interval` seconds on a daemon thread."""
+        if interval <= 0 or self._watcher is not None:
+            return
+        stop = self._stop = threading.Event()
+
+        def watch():
+            while not stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"Error refreshing models: {e}")
+
+        self._watcher = threading.Thread(
+            target=watch, name="model-watcher", daemon=True
+        )
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+        self._watcher = None
+
+    def after_fork(self, interval: float):
+        """
+        Prepare a registry inherited from a parent process for use in a
+        forked worker: the loaded models are kept, shared copy-on-write with
+        the parent, while the lock and the watcher thread, which do not
+        survive a fork, are recreated.
+        """
+        self._lock = threading.Lock()
+        self._watcher = None
+        self.start_watcher(interval)
+
+    def _stamp(self, key: Tuple[int, int]) -> Optional[Tuple]:
+        """Stamp of the model file, and of its compiled copy if those are used."""
+        path = separated_model_path(self.root, *key)
+        stamp = file_stamp(path)
+        if stamp is None or not self.compiled:
+            return stamp
+        return stamp + (file_stamp(compiled_model_path(path)),)
+
+    def _load(self, key: Tuple[int, int]) -> Tuple[Any, Any]:
+        path = separated_model_path(self.root, *key)
+        stamp = self._stamp(key)
+        if stamp is None:
+            raise FileNotFoundError(f"The model file at {path} does not exist.")
+
+        with MODEL_LOAD_SECONDS.time(model="separated"):
+            if self.compiled:
+                model = load_compiled(path)
+                if model is not None:
+                    return stamp, model
+            from joblib import load
+
+            return stamp, load(path, mmap_mode=self.mmap_mode)
+
+    def _evict(self):
+        if self.max_models is None:
+            return
+        while len(self._models) > self.max_models:
+            self._models.popitem(last=False)
@@ -1,9 +1,15 @@
 from typing import Optional, Any
 import os
-from joblib import load
 
+from app.utils.compiled_models import load_compiled
+from app.utils.metrics import MODEL_LOAD_SECONDS
 
-def load_model(model_path: Optional[str] = "models/model.joblib") -> Optional[Any]:
+
+def load_model(
+    model_path: Optional[str] = "models/model.joblib",
+    mmap_mode: Optional[str] = None,
+    compiled: bool = False,
+) -> Optional[Any]:
     """
     Loads a machine learning model from the specified path.
 
@@ -14,6 +20,10 @@ def load_model(model_path: Optional[str] = "models/model.joblib") -> Optional[An
     Parameters:
     - model_path (str, optional): The path to the .joblib file containing the model.
                                   Defaults to "models/model.joblib".
+    - mmap_mode (str, optional): joblib mmap_mode, "r" maps the arrays of an
+                                 uncompressed dump instead of reading them.
+    - compiled (bool, optional): Load the compiled .npz copy of the model
+                                 instead, if it is up to date.
 
     Returns:
     - The loaded model if the file exists and is successfully loaded; otherwise, None.
@@ -23,7 +33,18 @@ def load_model(model_path: Optional[str] = "models/model.joblib") -> Optional[An
         return None
 
     try:
-        model = load(model_path)
+        if compiled:
+            with MODEL_LOAD_SECONDS.time(model="global"):
+                model = load_compiled(model_path)
+            if model is not None:
+                return model
+
+        # joblib pulls in sklearn/mapie with the model, so it is only
+        # imported once a model is actually loaded
+        from joblib import load
+
+        with MODEL_LOAD_SECONDS.time(model="global"):
+            model = load(model_path, mmap_mode=mmap_mode)
         return model
     except Exception as e:
         print(f"Error loading the model: {e}")
@@ -0,0 +1,82 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache of serialized responses with a time to live.
+
+    Keys are built by the caller and should contain everything the response
+    depends on, including a data version, so that a new dataset or model
+    simply stops matching the old entries. `invalidate` drops every entry,
+    to free the memory of entries that can no longer match, and `generation`
+    counts the invalidations.
+
+    The ETag of a response is a hash of its key, so a key made of durable
+    versions gives the same ETag in every worker and after a restart.
+
+    Parameters:
+    - max_entries (int): Entries kept before the least recently used is evicted.
+    - ttl (float): Seconds an entry is served for, 0 for no expiry.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def etag(key: Hashable) -> str:
+        """Entity tag of the response stored under `key`."""
+        return hashlib.sha1(repr(key).encode()).hexdigest()
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (self.ttl and entry[0] <= now):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, body: bytes):
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0.0
+        with self._lock:
+            self._entries[key] = (expires_at, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+    def after_fork(self):
+        """
+        Recreate the lock in a forked worker. The entries are kept: their
+        keys hold durable versions, so they are as valid in the worker.
+        """
+        self._lock = threading.Lock()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "generation": self.generation,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from app.utils.metrics import STARTUP_STEP_SECONDS
+
+PENDING = "pending"
+RUNNING = "running"
+LOADED = "loaded"
+FAILED = "failed"
+
+
+class Warmup:
+    """
+    Loads the heavy artifacts of the app (models, datasets, events) one step
+    after another, either on a background thread so the server can answer
+    right away, or inline before the app is returned.
+
+    Steps are plain callables registered with `add`. Each step's status and
+    duration are kept for the health endpoints; a failing step is recorded
+    and the remaining steps still run.
+    """
+
+    def __init__(self):
+        self.created_at = time.perf_counter()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._steps: "OrderedDict[str, dict]" = OrderedDict()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def add(self, name: str, fn: Callable):
+        self._steps[name] = {
+            "fn": fn,
+            "status": PENDING,
+            "seconds": None,
+            "error": None,
+        }
+
+    def start(self, background: bool = True):
+        self.started_at = time.perf_counter()
+        if not background:
+            self.run()
+            return
+        self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+        self._thread.start()
+
+    def run(self):
+        for name, step in self._steps.items():
+            with self._lock:
+                step["status"] = RUNNING
+            started = time.perf_counter()
+            try:
+                step["fn"]()
+                status, error = LOADED, None
+            except Exception as e:
+                print(f"Error during warmup step {name}: {e}")
+                status, error = FAILED, str(e)
+            seconds = time.perf_counter() - started
+            STARTUP_STEP_SECONDS.observe(seconds, step=name)
+            with self._lock:
+                step.update(status=status, seconds=seconds, error=error)
+
+        with self._lock:
+            self.finished_at = time.perf_counter()
+        print(
+            f"Warmup finished in {self.finished_at - self.started_at:.2f}s, "
+            f"{self.finished_at - self.created_at:.2f}s after create_app() started"
+        )
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.done
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "done": self.done,
+                "seconds": (
+                    round(self.finished_at - self.started_at, 3) if self.done else None
+                ),
+                "steps": {
+                    name: {
+                        "status": step["status"],
+                        "seconds": (
+                            round(step["seconds"], 3)
+                            if step["seconds"] is not None
+                            else None
+                        ),
+                        "error": step["error"],
+                    }
+                    for name, step in self._steps.items()
+                },
+            }
@@ -0,0 +1,65 @@
+"""
+Compares two result files written by benchmarks.run:
+
+    python -m benchmarks.compare old.json new.json --threshold 0.1
+
+Prints the median of every measurement side by side and exits with status 1
+if any of them got slower by more than the threshold.
+"""
+
+import argparse
+import json
+import sys
+
+
+def medians(results, prefix=""):
+    """Flattens a results tree into {"form.stages.reading": median_seconds}."""
+    flat = {}
+    for name, value in results.items():
+        path = f"{prefix}{name}"
+        if "median" in value:
+            flat[path] = value["median"]
+        else:
+            flat.update(medians(value, f"{path}."))
+    return flat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark results.")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative slowdown reported as a regression",
+    )
+    args = parser.parse_args()
+
+    with open(args.old) as file:
+        old = json.load(file)
+    with open(args.new) as file:
+        new = json.load(file)
+    old_medians = medians(old["results"])
+    new_medians = medians(new["results"])
+
+    print(f"old: {old['meta'].get('commit')}  new: {new['meta'].get('commit')}")
+    regressions = []
+    for name in sorted(old_medians.keys() | new_medians.keys()):
+        before = old_medians.get(name)
+        after = new_medians.get(name)
+        if before is None or after is None:
+            print(f"{name:45} {before!s:>12} {after!s:>12}")
+            continue
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > args.threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:45} {before:12.6f} {after:12.6f} {change:+8.1%}{flag}")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
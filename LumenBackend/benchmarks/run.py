@@ -0,0 +1,320 @@
+"""
+Offline benchmarks for the dataset pipeline and the prediction endpoints.
+
+Run from LumenBackend/:
+
+    python -m benchmarks.run --years 2 --rows-per-day 45 --output results.json
+
+Everything runs in a scratch folder holding synthetic reservations, the
+events and the models, so the datasets/ and storage/ folders of the checkout
+are never touched. Without --models, small stand-in models are fitted on the
+synthetic datasets; they exercise the same code paths as the real ones but
+their timings are only comparable with other stand-in runs.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import write_reservations
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PREDICT_RANGES = [1, 7, 30, 365]
+
+
+def summarize(seconds):
+    return {
+        "runs": len(seconds),
+        "min": round(min(seconds), 6),
+        "median": round(statistics.median(seconds), 6),
+        "mean": round(statistics.mean(seconds), 6),
+        "max": round(max(seconds), 6),
+    }
+
+
+def git_commit():
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"],
+                cwd=BACKEND_DIR,
+                stderr=subprocess.DEVNULL,
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def fit_standin_models(root):
+    """
+    Fits quick MAPIE models on the datasets written by form(), laid out like
+    the real separated_models/ and models/ folders.
+    """
+    import joblib
+    from mapie.regression import MapieRegressor
+    from sklearn.linear_model import LinearRegression
+
+    from app.enums.room_indices_dict import room_indices
+    from app.utils.feature_store import dataset_path, features, read_manifest
+    from app.utils.model_registry import LAG_COUNT, separated_model_path
+
+    datasets_dir = os.path.join(root, "datasets")
+    manifest = read_manifest(datasets_dir)
+    for room_type in room_indices:
+        dataset = pd.read_parquet(dataset_path(datasets_dir, room_type, manifest))
+        for lag in range(LAG_COUNT):
+            target = "occupancy" if lag == 0 else f"occupancy_{lag}"
+            rows = dataset.dropna(subset=[target])
+            model = MapieRegressor(LinearRegression(), method="plus", cv=3)
+            model.fit(rows[features], rows[target])
+            path = separated_model_path(
+                os.path.join(root, "separated_models"), room_type, lag
+            )
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            joblib.dump(model, path)
+
+    rng = np.random.default_rng(0)
+    inputs = rng.random((500, 5))
+    os.makedirs(os.path.join(root, "models"), exist_ok=True)
+    joblib.dump(
+        LinearRegression().fit(inputs, inputs @ np.arange(1, 6) * 3),
+        os.path.join(root, "models", "model.joblib"),
+    )
+
+
+def bench_form(repeat, workers):
+    from app.form_datasets import form
+    from app.utils.metrics import Histogram, StageTimer
+
+    totals = []
+    stages = {}
+    for _ in range(repeat):
+        # A histogram of this run only, the app's one sums over every run
+        stage_seconds = Histogram(
+            "form_stage_seconds", "Seconds spent per form() stage.", ["stage"]
+        )
+        timer = StageTimer(stage_seconds)
+        started = time.perf_counter()
+        form("parquet_files/train.parquet", progress=timer, workers=workers)
+        totals.append(time.perf_counter() - started)
+        timer.finish()
+        for (stage,), _, seconds, _ in stage_seconds.dump():
+            stages.setdefault(stage, []).append(seconds)
+
+    return {
+        "total": summarize(totals),
+        "stages": {stage: summarize(seconds) for stage, seconds in stages.items()},
+    }
+
+
+def bench_predict(client, start, repeat):
+    results = {}
+    for days in PREDICT_RANGES:
+        end = start + pd.Timedelta(days=days - 1)
+        payload = {
+            "start_date": start.strftime("%d.%m.%Y"),
+            "end_date": end.strftime("%d.%m.%Y"),
+        }
+        client.post("/predict/", json=payload)
+
+        seconds = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            response = client.post("/predict/", json=payload)
+            seconds.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise RuntimeError(
+                    f"/predict/ returned {response.status_code} for {payload}: "
+                    f"{response.get_data(as_text=True)[:200]}"
+                )
+        results[f"{days}_day"] = summarize(seconds)
+    return results
+
+
+def bench_upload(client, app, upload_path, mode, repeat):
+    seconds = []
+    stages = {}
+    for _ in range(repeat):
+        client.delete("/file/")
+        app.config["REBUILD_MODE"] = mode
+        with open(upload_path, "rb") as file:
+            started = time.perf_counter()
+            response = client.post("/file/", data={"file": (file, "upload.parquet")})
+        if response.status_code != 202:
+            raise RuntimeError(
+                f"/file/ returned {response.status_code}: "
+                f"{response.get_data(as_text=True)[:200]}"
+            )
+        status_url = response.get_json()["status_url"]
+        while True:
+            job = client.get(status_url).get_json()
+            if job["status"] in ("succeeded", "failed"):
+                break
+            time.sleep(0.01)
+        seconds.append(time.perf_counter() - started)
+        if job["status"] == "failed":
+            raise RuntimeError(f"Rebuild failed: {job['error']}")
+        for stage, stage_seconds in job["stage_seconds"].items():
+            stages.setdefault(stage, []).append(stage_seconds)
+
+    return {
+        "total": summarize(seconds),
+        "stages": {stage: summarize(values) for stage, values in stages.items()},
+    }
+
+
+def run(args, workdir):
+    os.makedirs(os.path.join(workdir, "parquet_files"))
+    os.makedirs(os.path.join(workdir, "datasets"))
+    shutil.copytree(
+        os.path.join(BACKEND_DIR, "events"), os.path.join(workdir, "events")
+    )
+
+    data_options = {
+        "start": args.start,
+        "years": args.years,
+        "room_categories": args.room_categories,
+        "rows_per_day": args.rows_per_day,
+        "cancellation_rate": args.cancellation_rate,
+    }
+    train = write_reservations(
+        os.path.join(workdir, "parquet_files", "train.parquet"),
+        seed=args.seed,
+        **data_options,
+    )
+    upload_start = train["stay_date"].max() - pd.Timedelta(days=args.upload_days)
+    upload = write_reservations(
+        os.path.join(workdir, "upload.parquet"),
+        seed=args.seed + 1,
+        **{
+            **data_options,
+            "start": upload_start.strftime("%Y-%m-%d"),
+            "years": args.upload_days / 365,
+        },
+    )
+
+    # The app reads its settings when app.config is first imported and uses
+    # paths relative to the working directory
+    os.chdir(workdir)
+    os.environ["MODEL_RELOAD_INTERVAL"] = "0"
+    os.environ["RESPONSE_CACHE_SIZE"] = "0"
+    os.environ["STARTUP_WARMUP"] = "blocking"
+    os.environ["FORM_WORKERS"] = str(args.workers)
+    sys.path.insert(0, BACKEND_DIR)
+
+    results = {"form": bench_form(args.repeat, args.workers)}
+
+    if args.models:
+        for folder in ("models", "separated_models"):
+            shutil.copytree(
+                os.path.join(args.models, folder), os.path.join(workdir, folder)
+            )
+    else:
+        fit_standin_models(workdir)
+
+    # /predict/ answers only while a reservation file is stored
+    os.makedirs(os.path.join(workdir, "storage"))
+    shutil.copy(
+        os.path.join(workdir, "upload.parquet"),
+        os.path.join(workdir, "storage", "upload.parquet"),
+    )
+
+    from app import create_app
+
+    app = create_app()
+    client = app.test_client()
+
+    predict_start = train["stay_date"].min() + pd.Timedelta(days=30)
+    results["predict"] = bench_predict(client, predict_start, args.repeat)
+
+    results["upload"] = {
+        mode: bench_upload(
+            client, app, os.path.join(workdir, "upload.parquet"), mode, args.repeat
+        )
+        for mode in ("full", "incremental")
+    }
+
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "models": "given" if args.models else "stand-in",
+            "repeat": args.repeat,
+            "workers": args.workers,
+            "data": {
+                **data_options,
+                "seed": args.seed,
+                "train_rows": len(train),
+                "upload_rows": len(upload),
+                "upload_days": args.upload_days,
+            },
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", default=None, help="Results JSON file")
+    parser.add_argument("--start", default="2008-01-01")
+    parser.add_argument("--years", type=float, default=2)
+    parser.add_argument("--room-categories", type=int, nargs="+", default=None)
+    parser.add_argument("--rows-per-day", type=float, default=45)
+    parser.add_argument("--cancellation-rate", type=float, default=0.2)
+    parser.add_argument("--upload-days", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--models",
+        default=None,
+        help="Folder with models/ and separated_models/ to use instead of stand-ins",
+    )
+    args = parser.parse_args()
+    if args.models:
+        args.models = os.path.abspath(args.models)
+
+    output = args.output or os.path.join(
+        BACKEND_DIR,
+        "benchmarks",
+        "results",
+        f"{datetime.now():%Y%m%d-%H%M%S}-{(git_commit() or 'nogit')[:8]}.json",
+    )
+    output = os.path.abspath(output)
+
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="lumen-bench-")
+    try:
+        report = run(args, workdir)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(json.dumps(report["results"], indent=2))
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
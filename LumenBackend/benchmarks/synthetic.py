@@ -0,0 +1,162 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Share of stay nights per room category in parquet_files/train.parquet
+ROOM_WEIGHTS = {1: 48, 2: 12505, 3: 5998, 4: 878, 5: 8548, 6: 3343, 7: 261, 11: 53}
+
+COUNTRIES = ["HR", "I", "F", "GB", "NL", "D", "SLO", "USA"]
+COUNTRY_WEIGHTS = [16061, 6041, 2057, 1712, 1052, 858, 819, 353]
+
+NO_SHOW_SHARE = 0.02
+
+
+def _date_strings(days):
+    return np.datetime_as_string(days.astype("datetime64[D]"), unit="D").astype(object)
+
+
+def generate_reservations(
+    start="2008-01-01",
+    years=2,
+    room_categories=None,
+    rows_per_day=45,
+    cancellation_rate=0.2,
+    seed=0,
+):
+    """
+    Synthetic reservation table with the schema of parquet_files/train.parquet.
+
+    Every reservation is expanded into one row per night, like the real
+    export. Arrivals follow a yearly season with a summer peak, so the day of
+    week and month features have something to pick up.
+
+    Parameters:
+    - start (str): First arrival date.
+    - years (float): Length of the arrival period in years.
+    - room_categories (list, optional): Room category ids, all of them by default.
+    - rows_per_day (float): Average number of stay-night rows per date.
+    - cancellation_rate (float): Share of reservations that are cancelled or
+      no-shows.
+    - seed (int): Random seed.
+    """
+    rng = np.random.default_rng(seed)
+    room_categories = list(room_categories or ROOM_WEIGHTS)
+
+    first_day = np.datetime64(start, "D")
+    day_count = max(int(round(365 * years)), 1)
+    mean_nights = 3.0
+    reservation_count = max(int(day_count * rows_per_day / mean_nights), 1)
+
+    day_offsets = np.arange(day_count)
+    season = 1.0 + 0.6 * np.sin(2 * np.pi * (day_offsets / 365.25 - 0.3))
+    arrival = rng.choice(day_offsets, size=reservation_count, p=season / season.sum())
+    arrival_days = first_day + arrival.astype("timedelta64[D]")
+    nights = np.minimum(rng.geometric(1 / mean_nights, reservation_count), 30)
+
+    weights = np.array([ROOM_WEIGHTS.get(room, 1) for room in room_categories], float)
+    categories = rng.choice(
+        room_categories, size=reservation_count, p=weights / weights.sum()
+    )
+    room_cnt = np.where(
+        rng.random(reservation_count) < 0.85, 1, rng.integers(2, 8, reservation_count)
+    )
+
+    cancelled = rng.random(reservation_count) < cancellation_rate
+    no_show = cancelled & (rng.random(reservation_count) < NO_SHOW_SHARE)
+    status = np.where(cancelled, "Cancelled", "Checked-out").astype(object)
+    status[no_show] = "No-show"
+
+    booked_days = arrival_days - rng.integers(0, 120, reservation_count).astype(
+        "timedelta64[D]"
+    )
+    cancel_days = booked_days + (
+        rng.random(reservation_count) * (arrival_days - booked_days).astype(int)
+    ).astype("timedelta64[D]")
+    cancel_date = np.where(cancelled & ~no_show, _date_strings(cancel_days), None)
+
+    reservation_id = np.arange(reservation_count, dtype=np.int64) + 70_000
+    guest_id = rng.integers(1, 200_000, reservation_count)
+    country = rng.choice(
+        COUNTRIES,
+        size=reservation_count,
+        p=np.array(COUNTRY_WEIGHTS) / sum(COUNTRY_WEIGHTS),
+    )
+    adult_cnt = rng.integers(1, 4, reservation_count) * room_cnt
+    sales_channel = rng.choice([1.0, 3.0, 4.0, 9.0, 10.0], size=reservation_count)
+    nightly_price = rng.normal(4300, 900, reservation_count).clip(500)
+
+    rows = np.repeat(np.arange(reservation_count), nights)
+    night_number = np.concatenate([np.arange(1, n + 1) for n in nights]).astype(float)
+    stay_days = arrival_days[rows] + (night_number - 1).astype("timedelta64[D]")
+
+    price = nightly_price[rows] * room_cnt[rows]
+    food_price = price * 0.06
+    other_price = price * 0.01
+
+    return pd.DataFrame(
+        {
+            "reservation_id": reservation_id[rows],
+            "night_number": night_number,
+            "stay_date": stay_days.astype("datetime64[ns]"),
+            "guest_id": guest_id[rows],
+            "guest_country_id": country[rows].astype(object),
+            "reservation_status": status[rows],
+            "reservation_date": _date_strings(booked_days)[rows],
+            "date_from": _date_strings(arrival_days)[rows],
+            "date_to": _date_strings(arrival_days + nights.astype("timedelta64[D]"))[
+                rows
+            ],
+            "resort_id": np.ones(len(rows), dtype=np.int64),
+            "cancel_date": cancel_date[rows],
+            "room_cnt": room_cnt[rows].astype(np.int64),
+            "adult_cnt": adult_cnt[rows].astype(np.int64),
+            "children_cnt": np.zeros(len(rows), dtype=np.int64),
+            "price": price,
+            "price_tax": price * 0.1,
+            "total_price_tax": (price + food_price + other_price) * 0.1,
+            "total_price": price + food_price + other_price,
+            "food_price": food_price,
+            "food_price_tax": food_price * 0.1,
+            "other_price": other_price,
+            "other_price_tax": np.zeros(len(rows)),
+            "room_category_id": categories[rows].astype(np.int64),
+            "sales_channel_id": sales_channel[rows],
+        }
+    )
+
+
+def write_reservations(path, **kwargs):
+    """Generates a reservation table and writes it to `path` as parquet."""
+    reservations = generate_reservations(**kwargs)
+    reservations.to_parquet(path, index=False)
+    return reservations
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Write a synthetic reservation parquet file."
+    )
+    parser.add_argument("path")
+    parser.add_argument("--start", default="2008-01-01")
+    parser.add_argument("--years", type=float, default=2)
+    parser.add_argument("--room-categories", type=int, nargs="+", default=None)
+    parser.add_argument("--rows-per-day", type=float, default=45)
+    parser.add_argument("--cancellation-rate", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    reservations = write_reservations(
+        args.path,
+        start=args.start,
+        years=args.years,
+        room_categories=args.room_categories,
+        rows_per_day=args.rows_per_day,
+        cancellation_rate=args.cancellation_rate,
+        seed=args.seed,
+    )
+    print(f"Wrote {len(reservations)} rows to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
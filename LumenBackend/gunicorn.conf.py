@@ -0,0 +1,102 @@
+"""
+Production server settings, read by gunicorn from the working directory:
+
+    gunicorn run:app
+
+The master process builds the app without loading any artifact and binds
+right away. By default (STARTUP_WARMUP=blocking) it then loads the models,
+the feature tables and the event calendar once, before forking the first
+worker, so the workers share that memory copy-on-write instead of each
+loading their own copy; joblib's mmap_mode alone cannot share the sklearn
+and MAPIE objects. Connections made meanwhile wait in the listen backlog
+and the healthcheck on /health/ready/ fails until the workers are up. With
+STARTUP_WARMUP=background every worker loads its own copy on a background
+thread once forked, answering 503 on /health/ready/ and /predict/ until it
+is done: workers come up sooner, but nothing is shared.
+
+What the workers must agree on is kept in files: the status of background
+jobs in datasets/jobs/ and the metrics in METRICS_DIR, a folder of this
+server run that is removed when it exits.
+"""
+
+import gc
+import os
+import shutil
+import tempfile
+
+# The master only builds the app; the warmup is started below, in the master
+# before the first fork or in every worker after it
+warmup_in_workers = os.environ.get("STARTUP_WARMUP", "blocking") == "background"
+os.environ["STARTUP_WARMUP"] = "deferred"
+# One folder per server run, for the workers to add up their metrics
+os.environ.setdefault(
+    "METRICS_DIR", os.path.join(tempfile.gettempdir(), f"lumen-metrics-{os.getpid()}")
+)
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("GUNICORN_WORKERS", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+preload_app = True
+accesslog = "-"
+
+
+def share_metrics(app):
+    from app.utils.metrics import REGISTRY
+
+    if app.config["METRICS_DIR"]:
+        REGISTRY.share(app.config["METRICS_DIR"], app.config["METRICS_SHARE_INTERVAL"])
+
+
+def when_ready(server):
+    # The master reports what it loaded, the workers report from post_worker_init
+    share_metrics(server.app.wsgi())
+
+
+def pre_fork(server, worker):
+    # Runs once the sockets are bound; also after a reload (HUP) builds a new app
+    warmup = server.app.wsgi().config["WARMUP"]
+    if not warmup_in_workers and warmup.started_at is None:
+        warmup.start(background=False)
+    # Objects loaded so far are never collected, so the collector does not
+    # write to (and un-share) their pages in the workers
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from app.utils.metrics import REGISTRY
+
+    app = server.app.wsgi()
+    REGISTRY.after_fork()
+    app.config["MODEL_REGISTRY"].after_fork(app.config["MODEL_RELOAD_INTERVAL"])
+    for name in (
+        "FEATURE_STORE",
+        "EVENT_INDEX",
+        "FORECAST_TABLE",
+        "RESPONSE_CACHE",
+        "REBUILD_JOBS",
+    ):
+        if app.config.get(name) is not None:
+            app.config[name].after_fork()
+    # INFERENCE_EXECUTOR and PREDICTION_BATCHER start their threads on the
+    # first prediction, which the master never serves, so they fork clean
+    if warmup_in_workers:
+        app.config["WARMUP"].start(background=True)
+
+
+def post_worker_init(worker):
+    share_metrics(worker.wsgi)
+
+
+def worker_exit(server, worker):
+    from app.utils.metrics import REGISTRY
+
+    # The counts of the last interval, kept after the worker is gone
+    if REGISTRY.directory is not None:
+        REGISTRY.dump()
+    worker.wsgi.config["REBUILD_JOBS"].close()
+
+
+def on_exit(server):
+    server.app.wsgi().config["REBUILD_JOBS"].close()
+    shutil.rmtree(os.environ["METRICS_DIR"], ignore_errors=True)
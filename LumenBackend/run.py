@@ -1,6 +1,9 @@
 from app import create_app
 
-app = create_app()
+# Pool workers of the dataset rebuilds import this file as __mp_main__ and
+# must not build an app of their own
+if __name__ != "__mp_main__":
+    app = create_app()
 
 if __name__ == "__main__":
     app.run(debug=True, port=5000, host="0.0.0.0")
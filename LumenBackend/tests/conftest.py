@@ -0,0 +1,61 @@
+import os
+import shutil
+
+import pytest
+
+from benchmarks.run import fit_standin_models
+from benchmarks.synthetic import write_reservations
+
+EVENTS_DIR = os.path.join(os.path.dirname(__file__), os.pardir, "events")
+
+
+@pytest.fixture(scope="session")
+def backend(tmp_path_factory):
+    """
+    A backend folder built from a year of synthetic reservations: the
+    uploaded and training files, the formed datasets, the events and quick
+    stand-in models, laid out like the repository root.
+    """
+    from app.form_datasets import form
+
+    root = tmp_path_factory.mktemp("backend")
+    shutil.copytree(EVENTS_DIR, root / "events")
+    os.makedirs(root / "parquet_files")
+    os.makedirs(root / "storage")
+    train_path = str(root / "parquet_files" / "train.parquet")
+    write_reservations(train_path, start="2009-01-01", years=1, rows_per_day=20)
+    shutil.copy(train_path, root / "storage" / "upload.parquet")
+
+    form(
+        train_path,
+        datasets_dir=str(root / "datasets"),
+        events_dir=str(root / "events"),
+    )
+    fit_standin_models(str(root))
+    return root
+
+
+@pytest.fixture
+def make_app(backend, monkeypatch):
+    """Creates apps on the backend folder, with `Config` overrides."""
+    from app import create_app
+    from app.config import Config
+
+    monkeypatch.chdir(backend)
+    apps = []
+
+    def make(**settings):
+        settings = {
+            "STARTUP_WARMUP": "blocking",
+            "MODEL_RELOAD_INTERVAL": 0,
+            "RESPONSE_CACHE_SIZE": 0,
+            **settings,
+        }
+        for name, value in settings.items():
+            monkeypatch.setattr(Config, name, value)
+        apps.append(create_app())
+        return apps[-1]
+
+    yield make
+    for app in apps:
+        app.config["REBUILD_JOBS"].close()
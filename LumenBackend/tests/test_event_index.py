@@ -0,0 +1,89 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from app.endpoints.prediction_endpoints import predict_range_counts
+from app.enums.room_id_dict import scaled_id_list
+from app.enums.room_indices_dict import room_indices
+from app.form_datasets import room_events
+from app.utils.event_index import EventCalendar
+
+EVENTS_DIR = os.path.join(os.path.dirname(__file__), os.pardir, "events")
+
+
+def room_events_reference(ds, room_type):
+    """The per-interval masks room_events replaced."""
+    with open(os.path.join(EVENTS_DIR, "separated_events.json")) as file:
+        separated_events = json.load(file)
+    og_events = pd.read_json(os.path.join(EVENTS_DIR, "events.json"))
+
+    ds["event"] = 0
+    for event_name in separated_events[str(room_type)]:
+        dates = dict(og_events[og_events["name"] == event_name]["date"])
+        for values in dates.values():
+            for value in values:
+                start_date = pd.to_datetime(value["start_date"])
+                finish_date = pd.to_datetime(value["finish_date"])
+                mask = (ds["stay_date_help"] >= start_date) & (
+                    ds["stay_date_help"] <= finish_date
+                )
+                ds.loc[mask, "event"] += 1
+    return ds
+
+
+class Model:
+    """Global model stand-in that predicts the event column of its input."""
+
+    def predict(self, inputs):
+        return inputs[:, 4].astype(float)
+
+
+@pytest.fixture
+def calendar():
+    return EventCalendar.load(EVENTS_DIR)
+
+
+def test_room_events_match_reference(calendar):
+    dates = pd.date_range("2007-12-01", "2012-01-31", freq="D")
+    for room_type in room_indices:
+        ds = pd.DataFrame({"stay_date_help": dates})
+        expected = room_events_reference(ds.copy(), room_type)
+        result = room_events(ds.copy(), room_type, calendar)
+        assert (result["event"].to_numpy() == expected["event"].to_numpy()).all()
+
+
+def test_range_counts_flag_event_days(calendar):
+    # Rijecki karneval runs from 17.1. to 24.2.2009, nothing else until April
+    date_range = pd.date_range("2009-02-10", "2009-03-05", freq="D")
+    model = Model()
+
+    counts = predict_range_counts(model, date_range, calendar)
+
+    expected = (date_range <= pd.Timestamp("2009-02-24")).astype(int)
+    assert counts.shape == (len(date_range), len(scaled_id_list))
+    assert (counts == expected[:, None]).all()
+
+
+class EmptyEventIndex:
+    def calendar(self):
+        return EventCalendar([], {})
+
+
+def test_only_long_ranges_use_the_calendar(make_app):
+    app = make_app()
+    client = app.test_client()
+    short = {"start_date": "20.1.2009", "end_date": "26.1.2009"}
+    long = {"start_date": "10.2.2009", "end_date": "5.3.2009"}
+    responses = [client.post("/predict/", json=body) for body in (short, long)]
+
+    app.config["EVENT_INDEX"] = EmptyEventIndex()
+    without_events = [client.post("/predict/", json=body) for body in (short, long)]
+
+    # Up to 7 days the events come from the datasets, as before the calendar
+    assert responses[0].status_code == 200
+    assert responses[0].get_json() == without_events[0].get_json()
+    assert responses[1].status_code == 200
+    assert responses[1].get_json() != without_events[1].get_json()
+    assert responses[1].get_json()[-1] == without_events[1].get_json()[-1]
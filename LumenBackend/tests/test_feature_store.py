@@ -0,0 +1,77 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.enums.room_indices_dict import room_indices
+from app.utils.feature_store import (
+    VERSIONS_DIR,
+    FeatureStore,
+    dataset_file_name,
+    features,
+    publish_manifest,
+    version_directory,
+)
+
+
+def publish(directory, version, value):
+    """Publishes `version` with every feature of every room set to `value`."""
+    folder = version_directory(str(directory), version)
+    os.makedirs(folder)
+    index = pd.date_range("2009-01-01", periods=10, freq="D", name="stay_date")
+    frame = pd.DataFrame(
+        np.full((len(index), len(features) + 1), float(value)),
+        index=index,
+        columns=features + ["occupancy"],
+    )
+    for room_type in room_indices:
+        frame.to_parquet(os.path.join(folder, dataset_file_name(room_type)))
+    publish_manifest(str(directory), version=version)
+
+
+@pytest.fixture
+def store(tmp_path):
+    publish(tmp_path, 1, 1)
+    store = FeatureStore(str(tmp_path))
+    store.refresh()
+    return store
+
+
+def test_reads_the_published_version(store):
+    assert store.version == 1
+    assert store.room_types() == sorted(room_indices)
+    assert store.features(2, "2009-01-05")[0] == 1
+
+
+def test_keeps_the_previous_version_only(tmp_path, store):
+    for version in (2, 3, 4):
+        publish(tmp_path, version, version)
+
+    assert sorted(os.listdir(tmp_path / VERSIONS_DIR)) == ["3", "4"]
+    assert store.refresh()
+    assert store.version == 4
+    assert store.features(2, "2009-01-05")[0] == 4
+
+
+def test_refresh_leaves_a_running_reload_to_its_thread(tmp_path, store):
+    publish(tmp_path, 2, 2)
+    generation = store.generation
+
+    # Another thread is reloading: readers keep the current tables
+    store._lock.acquire()
+    assert not store.refresh()
+    assert (store.version, store.generation) == (1, generation)
+
+    waited = []
+    waiter = threading.Thread(target=lambda: waited.append(store.refresh(wait=True)))
+    waiter.start()
+    waiter.join(0.2)
+    assert waiter.is_alive()
+
+    store._lock.release()
+    waiter.join()
+    assert waited == [True]
+    assert (store.version, store.generation) == (2, generation + 1)
+    assert store.features(2, "2009-01-05")[0] == 2
@@ -0,0 +1,28 @@
+import pandas as pd
+
+HORIZON = 10
+
+
+def day(date):
+    return date.strftime("%d.%m.%Y")
+
+
+def test_ranges_straddling_the_table_match_live_inference(make_app):
+    live = make_app(FORECAST_TABLE_HORIZON=0).test_client()
+    table = make_app(FORECAST_TABLE_HORIZON=HORIZON).test_client()
+    start = pd.Timestamp(table.get("/predict/forecast/").get_json()["start"])
+
+    for first, last in [
+        (start - pd.Timedelta(days=3), start + pd.Timedelta(days=3)),
+        (start, start + pd.Timedelta(days=HORIZON - 1)),
+        (start - pd.Timedelta(days=20), start + pd.Timedelta(days=5)),
+    ]:
+        body = {"start_date": day(first), "end_date": day(last)}
+        expected = live.post("/predict/", json=body)
+        response = table.post("/predict/", json=body)
+        assert expected.status_code == 200
+        assert response.status_code == 200
+        assert response.get_json() == expected.get_json()
+
+    lookups = table.get("/metrics").get_data(as_text=True)
+    assert 'lumen_forecast_table_lookups_total{result="partial"} 2' in lookups
@@ -0,0 +1,189 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.enums.room_indices_dict import room_column, room_indices
+from app.form_datasets import (
+    form,
+    form_room_occupancy,
+    one_hot_occupancy,
+    stream_room_occupancy,
+    valid_reservations,
+)
+from app.form_incremental import form_incremental
+from app.utils.compact import day_numbers
+from app.utils.feature_store import dataset_path, read_manifest
+from benchmarks.synthetic import generate_reservations
+
+EVENTS_DIR = os.path.join(os.path.dirname(__file__), os.pardir, "events")
+
+
+def one_hot_occupancy_reference(ds, target_ds):
+    """The row by row implementation one_hot_occupancy replaced."""
+    for index, row in ds.iterrows():
+        date = row[0]
+        row = row[1:]
+        for j in range(8):
+            mask = [0 for _ in range(8)]
+            new_row = mask
+            mask[j] = 1
+            for i in range(8):
+                new_row[i] = row[i] if mask[i] == 1 else 0
+            new_row.insert(0, date)
+            target_ds = pd.concat(
+                [target_ds, pd.DataFrame([new_row], columns=target_ds.columns)],
+                ignore_index=True,
+            )
+    return target_ds
+
+
+@pytest.fixture
+def occupancy():
+    """Occupancy of 12 days with every room category booked on some of them."""
+    rng = np.random.default_rng(0)
+    dates = pd.date_range("2009-01-01", periods=12, freq="D")
+    reservations = pd.DataFrame(
+        {
+            "stay_date": rng.choice(dates, 200),
+            "room_category_id": rng.choice([1, 2, 3, 4, 5, 6, 7, 11], 200),
+            "room_cnt": rng.integers(1, 4, 200),
+        }
+    )
+    return form_room_occupancy(reservations)
+
+
+def test_one_hot_occupancy_matches_reference(occupancy):
+    target = pd.DataFrame(columns=occupancy.columns)
+
+    expected = one_hot_occupancy_reference(occupancy, target)
+    result = one_hot_occupancy(occupancy, target)
+
+    # The reference builds object columns out of the empty target frame
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+    assert result["stay_date"].dtype == expected["stay_date"].dtype
+    assert all(pd.api.types.is_numeric_dtype(result[column]) for column in room_column)
+
+
+def test_one_hot_occupancy_appends_to_target(occupancy):
+    first, second = occupancy.iloc[:5], occupancy.iloc[5:]
+    target = pd.DataFrame(columns=occupancy.columns)
+
+    expected = one_hot_occupancy_reference(
+        second, one_hot_occupancy_reference(first, target)
+    )
+    result = one_hot_occupancy(second, one_hot_occupancy(first, target))
+
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_stream_room_occupancy_drops_invalid_stays(tmp_path):
+    rng = np.random.default_rng(1)
+    reservations = pd.DataFrame(
+        {
+            "stay_date": rng.choice(pd.date_range("2009-01-01", periods=20), 500),
+            "room_category_id": rng.choice([1, 2, 3, 11], 500),
+            "room_cnt": rng.integers(1, 4, 500),
+            "reservation_status": rng.choice(
+                ["Checked-out", "Cancelled", "No-show"], 500
+            ),
+        }
+    )
+    path = tmp_path / "reservations.parquet"
+    reservations.to_parquet(path)
+
+    expected = form_room_occupancy(valid_reservations(reservations))
+    result = stream_room_occupancy([str(path)], batch_size=64)
+
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.fixture
+def reservations(tmp_path):
+    """A year of synthetic reservations, whole and split in two files."""
+    reservations = generate_reservations(start="2009-01-01", years=1, rows_per_day=20)
+    split = reservations["stay_date"] >= pd.Timestamp("2009-10-01")
+    paths = {}
+    for name, rows in [
+        ("all", reservations),
+        ("train", reservations[~split]),
+        ("upload", reservations[split]),
+    ]:
+        paths[name] = str(tmp_path / f"{name}.parquet")
+        rows.reset_index(drop=True).to_parquet(paths[name], index=False)
+    return paths
+
+
+def published(datasets_dir):
+    """The datasets a form run published to `datasets_dir`, by room type."""
+    manifest = read_manifest(datasets_dir)
+    return {
+        room_type: pd.read_parquet(dataset_path(datasets_dir, room_type, manifest))
+        for room_type in room_indices
+    }
+
+
+def test_form_incremental_matches_form(reservations, tmp_path):
+    form(
+        reservations["all"],
+        datasets_dir=str(tmp_path / "full"),
+        events_dir=EVENTS_DIR,
+    )
+    form_incremental(
+        reservations["upload"],
+        train_path=reservations["train"],
+        datasets_dir=str(tmp_path / "incremental"),
+        events_dir=EVENTS_DIR,
+    )
+
+    full = published(str(tmp_path / "full"))
+    incremental = published(str(tmp_path / "incremental"))
+    for room_type in room_indices:
+        pd.testing.assert_frame_equal(
+            incremental[room_type], full[room_type], check_exact=False, atol=1e-9
+        )
+
+
+def test_form_with_workers_matches_form(reservations, tmp_path):
+    for workers in (1, 2):
+        form(
+            reservations["all"],
+            workers=workers,
+            datasets_dir=str(tmp_path / f"workers_{workers}"),
+            events_dir=EVENTS_DIR,
+        )
+
+    single = published(str(tmp_path / "workers_1"))
+    pooled = published(str(tmp_path / "workers_2"))
+    for room_type in room_indices:
+        pd.testing.assert_frame_equal(pooled[room_type], single[room_type])
+
+
+def test_compact_form_matches_form(reservations, tmp_path):
+    for compact in (False, True):
+        form(
+            reservations["all"],
+            compact=compact,
+            datasets_dir=str(tmp_path / f"compact_{compact}"),
+            events_dir=EVENTS_DIR,
+        )
+
+    default = published(str(tmp_path / "compact_False"))
+    compact = published(str(tmp_path / "compact_True"))
+    for room_type in room_indices:
+        expected, result = default[room_type], compact[room_type]
+        assert list(result.columns) == list(expected.columns)
+        pd.testing.assert_index_equal(result.index, expected.index)
+        for column in expected.columns:
+            if expected[column].dtype.kind == "M":
+                assert (day_numbers(expected[column]) == result[column]).all()
+            else:
+                # The compact features are computed in float32, not only stored
+                np.testing.assert_allclose(
+                    result[column].astype(float),
+                    expected[column].astype(float),
+                    rtol=1e-5,
+                    atol=1e-5,
+                    err_msg=f"room type {room_type}, {column}",
+                )
@@ -0,0 +1,83 @@
+import threading
+
+import pytest
+
+from app.utils.jobs import FAILED, RUNNING, SUCCEEDED, JobQueue, fcntl
+
+
+@pytest.fixture
+def queues(tmp_path):
+    """Two queues sharing a folder, as two server workers would."""
+    first = JobQueue(directory=str(tmp_path))
+    second = JobQueue(directory=str(tmp_path))
+    yield first, second
+    first._executor.shutdown()
+    second._executor.shutdown()
+
+
+def blocked_job(queue, release, fingerprint="upload"):
+    started = threading.Event()
+
+    def run(report):
+        report("running", 0.5)
+        started.set()
+        release.wait()
+
+    job, created = queue.submit("rebuild", run, fingerprint=fingerprint)
+    assert created
+    started.wait()
+    return job
+
+
+def test_jobs_are_visible_to_every_queue(queues):
+    first, second = queues
+    release = threading.Event()
+    job = blocked_job(first, release)
+
+    shared = second.get(job.id)
+    assert shared.status == RUNNING
+    assert shared.stage == "running"
+    assert [active.id for active in second.active()] == [job.id]
+
+    # The same upload in another worker joins the running job
+    joined, created = second.submit(
+        "rebuild", lambda report: None, fingerprint="upload"
+    )
+    assert (joined.id, created) == (job.id, False)
+
+    release.set()
+    first._executor.shutdown()
+    assert second.get(job.id).status == SUCCEEDED
+    assert second.get("missing") is None
+
+
+@pytest.mark.skipif(fcntl is None, reason="needs fcntl")
+def test_jobs_of_an_exited_process_fail(queues):
+    first, second = queues
+    release = threading.Event()
+    job = blocked_job(first, release)
+
+    # What the exit of the first worker releases
+    first._owner_file.close()
+
+    assert second.get(job.id).status == FAILED
+    assert second.active() == []
+    release.set()
+
+
+@pytest.mark.skipif(fcntl is None, reason="needs fcntl")
+def test_owner_files_do_not_outlive_their_process(tmp_path):
+    first = JobQueue(directory=str(tmp_path))
+    second = JobQueue(directory=str(tmp_path))
+    owners = lambda: sorted(p.name for p in tmp_path.glob("*.owner"))
+    assert owners() == sorted(f"{q.owner}.owner" for q in (first, second))
+
+    second.close()
+    assert owners() == [f"{first.owner}.owner"]
+
+    # A process that died without closing leaves an unlocked file behind
+    first._owner_file.close()
+    third = JobQueue(directory=str(tmp_path))
+    assert owners() == [f"{third.owner}.owner"]
+    for queue in (first, second, third):
+        queue._executor.shutdown()
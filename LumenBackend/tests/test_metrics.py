@@ -0,0 +1,40 @@
+import json
+import time
+
+from app.utils.metrics import MetricsRegistry
+
+
+def test_render_adds_up_the_workers(tmp_path):
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests.", ["status"])
+    seconds = registry.histogram("seconds", "Seconds.", buckets=(1.0,))
+    registry.gauge("rss_bytes", "Memory.", lambda: 10)
+    requests.inc(status="200")
+    seconds.observe(0.5)
+
+    registry.directory, registry.interval = str(tmp_path), 5
+    other = {
+        "pid": 1,
+        "time": time.time(),
+        "metrics": {
+            "requests_total": [[["200"], 2], [["500"], 1]],
+            "seconds": [[[], [0, 1], 3.0, 1]],
+            "rss_bytes": 20,
+        },
+    }
+    (tmp_path / "1.json").write_text(json.dumps(other))
+    lines = registry.render().splitlines()
+
+    assert 'requests_total{status="200"} 3' in lines
+    assert 'requests_total{status="500"} 1' in lines
+    assert 'seconds_bucket{le="1.0"} 1' in lines
+    assert 'seconds_bucket{le="+Inf"} 2' in lines
+    assert "seconds_count 2" in lines
+    assert 'rss_bytes{pid="1"} 20' in lines
+
+    # Counts of an exited worker stay, its gauges do not
+    other["time"] -= 60
+    (tmp_path / "1.json").write_text(json.dumps(other))
+    lines = registry.render().splitlines()
+    assert 'requests_total{status="200"} 3' in lines
+    assert not any(line.startswith('rss_bytes{pid="1"}') for line in lines)
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+from flask import Flask
+
+from app.endpoints.prediction_endpoints import check_alphas, parse_alphas
+
+
+class Model:
+    def __init__(self, count):
+        self.conformity_scores_ = np.zeros(count)
+
+
+class Registry:
+    def __init__(self, counts):
+        self.counts = counts
+
+    def get(self, room_type, lag):
+        if (room_type, lag) not in self.counts:
+            raise FileNotFoundError(room_type, lag)
+        return Model(self.counts[(room_type, lag)])
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config["PREDICT_MAX_ALPHAS"] = 3
+    app.config["MODEL_REGISTRY"] = Registry({(2, 0): 100, (2, 1): 40})
+    with app.app_context():
+        yield app
+
+
+def test_parse_alphas(app):
+    assert parse_alphas({}) == ()
+    assert parse_alphas({"alphas": [0.5, 0.05]}) == (0.5, 0.05)
+    for alphas in ([0.5, 0.2, 0.1, 0.05], [0], [1.5], 0.5, [True], ["0.5"]):
+        with pytest.raises(ValueError):
+            parse_alphas({"alphas": alphas})
+
+
+def test_check_alphas_against_the_smallest_calibration_set(app):
+    check_alphas((0.02,), {(2, 0)})
+    check_alphas((0.02,), {(2, 0), (3, 0)})
+    with pytest.raises(ValueError, match=r"\(40\)"):
+        check_alphas((0.02,), {(2, 0), (2, 1)})
+    with pytest.raises(ValueError):
+        check_alphas((0.995,), {(2, 0)})
+
+
+def test_recursive_forecast_is_limited_to_forecast_max_days(make_app):
+    client = make_app(
+        LONG_RANGE_FORECAST="recursive", FORECAST_MAX_DAYS=30
+    ).test_client()
+
+    inside = client.post(
+        "/predict/", json={"start_date": "1.6.2009", "end_date": "30.6.2009"}
+    )
+    assert inside.status_code == 200
+    assert len(inside.get_json()) == 30
+
+    # The datasets end on 2.1.2010, a later range also rolls out the gap
+    for start, end in [("1.6.2009", "1.7.2009"), ("20.1.2010", "5.2.2010")]:
+        response = client.post("/predict/", json={"start_date": start, "end_date": end})
+        assert response.status_code == 400
+        assert "at most 30 days" in response.get_json()["error"]
+
+    response = client.post(
+        "/predict/bulk/",
+        json={"queries": [{"start_date": "20.1.2010", "end_date": "5.2.2010"}]},
+    )
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("Query 0:")
+
+
+def test_alphas_are_refused_for_global_model_ranges(make_app):
+    body = {"start_date": "1.6.2009", "end_date": "20.6.2009", "alphas": [0.2]}
+
+    client = make_app().test_client()
+    response = client.post("/predict/", json=body)
+    assert response.status_code == 400
+    assert "without intervals" in response.get_json()["error"]
+    response = client.post(
+        "/predict/bulk/",
+        json={
+            "queries": [{"start_date": "1.6.2009", "end_date": "20.6.2009"}],
+            "alphas": [0.2],
+        },
+    )
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("Query 0:")
+
+    recursive = make_app(LONG_RANGE_FORECAST="recursive").test_client()
+    response = recursive.post("/predict/", json=body)
+    assert response.status_code == 200
+    assert response.get_json()[0]["predictions"][0]["intervals"][0]["alpha"] == 0.2